@@ -0,0 +1,849 @@
+import os
+import json
+import shutil
+import asyncio
+import zipfile
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+try:
+    from aiobotocore.session import get_session
+    from aiobotocore.config import AioConfig
+except ImportError:
+    get_session = None
+    AioConfig = None
+from botocore.exceptions import ClientError
+import s3_backup
+from s3_backup import (MIN_PART_SIZE, MAX_PARTS, _log_throughput, _member_spans, extract_member_stream,
+                       extract_in_order)
+from progress import tracked
+from throttle import limiter, open_throttled
+from backup_codecs import get_codec
+from catalog import update_catalog
+from integrity import (part_checksum, checksums_path, checksums_document, load_checksums, save_checksums,
+                       format_checksum, count_verified, archive_verifier)
+from backup import (create_backup, restore_backup, backup_file_name, write_backup_archive,
+                    member_target, select_restore_set, restore_links)
+
+# Bytes fetched from the end of an archive to find its central directory
+TAIL_SIZE = 1024 * 1024
+# Size of the chunks member data is handed to extraction threads in
+STREAM_CHUNK_SIZE = 256 * 1024
+# Chunks buffered between a member download and its extraction thread
+STREAM_QUEUE_SIZE = 8
+
+def open_client(config=None):
+    """
+    Open an aiobotocore S3 client for an AWSConfig
+
+    Use it as 'async with open_client() as client:' and pass the client to
+    several calls of this module to share its connection pool. The pool is
+    sized by config.pool_size(); raise max_pool_connections together with
+    max_concurrency for very wide transfers.
+
+    Args:
+        config (AWSConfig): Credentials, region and endpoint. None uses
+            s3_backup.aws_config
+
+    Returns:
+        Async context manager yielding the client
+    """
+    if get_session is None:
+        raise ImportError("The asyncio API needs the 'aiobotocore' package")
+    config = config or s3_backup.aws_config
+    return get_session().create_client(
+        's3',
+        region_name=config.region_name,
+        endpoint_url=config.endpoint_url,
+        aws_access_key_id=config.aws_access_key_id,
+        aws_secret_access_key=config.aws_secret_access_key,
+        config=AioConfig(max_pool_connections=config.pool_size())
+    )
+
+@asynccontextmanager
+async def _client_scope(client):
+    """Yield the caller's client, or a new one closed afterwards"""
+    if client is not None:
+        yield client
+    else:
+        async with open_client() as client:
+            yield client
+
+def _part_size(file_size, config):
+    """Part size from a TransferConfig, within the S3 multipart limits"""
+    return max(config.multipart_chunksize, MIN_PART_SIZE, -(-file_size // MAX_PARTS))
+
+def _read_part(path, offset, size):
+    with open_throttled(path) as f:
+        f.seek(offset)
+        return f.read(size)
+
+def _write_part(f, lock, offset, data):
+    with lock:
+        f.seek(offset)
+        f.write(data)
+
+def _write_verified(f, verifier, data):
+    verifier.update(data)
+    f.write(data)
+
+async def _get_range(client, bucket_name, s3_key, start, end):
+    """Fetch bytes [start, end) of an object"""
+    await limiter.athrottle('download', end - start)
+    response = await client.get_object(Bucket=bucket_name, Key=s3_key, Range=f"bytes={start}-{end - 1}")
+    async with response['Body'] as body:
+        return await body.read()
+
+class AsyncMultipartUpload:
+    """
+    Multipart upload whose parts are sent concurrently from one event loop
+
+    Call 'await wait_slot()' before producing a part and submit() once it is
+    ready. At most max_inflight_parts parts are buffered or uploading, so
+    memory stays below max_inflight_parts * part size while no thread is
+    tied up by a request in flight. Parts are sent with their SHA-256
+    checksums; after complete() the part list is in parts.
+    """
+    def __init__(self, client, bucket_name, s3_key, max_inflight_parts=4, progress=None):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.s3_key = s3_key
+        self.progress = progress
+        self.upload_id = None
+        self._slots = asyncio.Semaphore(max_inflight_parts)
+        self._tasks = []
+        self.parts = None
+
+    async def start(self):
+        response = await self.client.create_multipart_upload(Bucket=self.bucket_name, Key=self.s3_key,
+                                                              ChecksumAlgorithm='SHA256')
+        self.upload_id = response['UploadId']
+        return self
+
+    async def wait_slot(self):
+        """Wait until another part may be buffered, failing fast if a part upload failed"""
+        for task in self._tasks:
+            if task.done() and task.exception() is not None:
+                raise task.exception()
+        await self._slots.acquire()
+
+    def submit(self, body):
+        """Start uploading the next part; call after wait_slot()"""
+        if len(self._tasks) >= MAX_PARTS:
+            self._slots.release()
+            raise ValueError(f"Upload needs more than {MAX_PARTS} parts, increase the part size")
+        self._tasks.append(asyncio.ensure_future(self._upload_part(len(self._tasks) + 1, body)))
+
+    async def _upload_part(self, part_number, body):
+        try:
+            await limiter.athrottle('upload', len(body))
+            checksum = part_checksum(body)
+            start = time.perf_counter()
+            response = await self.client.upload_part(
+                Bucket=self.bucket_name, Key=self.s3_key, UploadId=self.upload_id,
+                PartNumber=part_number, Body=body, ChecksumSHA256=checksum)
+            if self.progress is not None:
+                self.progress.add_phase_time('upload', time.perf_counter() - start)
+                self.progress.transfer('upload', len(body))
+            return {'PartNumber': part_number, 'ETag': response['ETag'], 'ChecksumSHA256': checksum}
+        finally:
+            self._slots.release()
+
+    async def complete(self):
+        """Wait for all parts and complete the upload"""
+        if not self._tasks:
+            await self.wait_slot()
+            self.submit(b'')
+        parts = list(await asyncio.gather(*self._tasks))
+        await self.client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=self.s3_key, UploadId=self.upload_id,
+            MultipartUpload={'Parts': parts})
+        self.parts = parts
+
+    async def abort(self):
+        """Cancel pending parts and abort the upload"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.upload_id is not None:
+            await self.client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.s3_key, UploadId=self.upload_id)
+
+class _OrderedRanges:
+    """
+    Fetch a whole object as ranged GETs, up to concurrency ahead, handed out in order
+
+    Call 'await next()' until it returns None, then 'await close()', which
+    also cancels what is still in flight after a failure.
+    """
+    def __init__(self, client, bucket_name, s3_key, size, range_size, concurrency):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.s3_key = s3_key
+        self.size = size
+        self.range_size = max(1, range_size)
+        self._pending = deque()
+        self._next = 0
+        for _ in range(max(1, concurrency)):
+            self._fetch_next()
+
+    def _fetch_next(self):
+        if self._next < self.size:
+            end = min(self._next + self.range_size, self.size)
+            self._pending.append(asyncio.ensure_future(
+                _get_range(self.client, self.bucket_name, self.s3_key, self._next, end)))
+            self._next = end
+
+    async def next(self):
+        """Return the next range's bytes, or None after the last one"""
+        if not self._pending:
+            return None
+        data = await self._pending.popleft()
+        self._fetch_next()
+        return data
+
+    async def close(self):
+        for task in self._pending:
+            task.cancel()
+        await asyncio.gather(*self._pending, return_exceptions=True)
+        self._pending.clear()
+
+class _PartQueueWriter:
+    """
+    Non-seekable file object handing part_size chunks from a thread to the event loop
+
+    write() blocks the writing thread while the queue is full, which
+    throttles compression to the upload speed. Once the consumer fails,
+    the next write raises so compression stops early.
+    """
+    def __init__(self, loop, queue, part_size):
+        self.loop = loop
+        self.queue = queue
+        self.part_size = part_size
+        self.failed = False
+        self._buffer = bytearray()
+        self._position = 0
+
+    def _put(self, item):
+        if self.failed:
+            raise IOError("Upload failed")
+        asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop).result()
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._put(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        raise OSError("_PartQueueWriter is not seekable")
+
+    def seekable(self):
+        return False
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Send the remaining data and the end marker"""
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer = bytearray()
+        self._put(None)
+
+class _ChunkQueueReader:
+    """Readable file object for a thread, fed with chunks from the event loop ('' ends it)"""
+    def __init__(self, loop, queue):
+        self.loop = loop
+        self.queue = queue
+        self._buffer = b''
+        self._eof = False
+        self._position = 0
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = asyncio.run_coroutine_threadsafe(self.queue.get(), self.loop).result()
+            if not chunk:
+                self._eof = True
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self._position += len(data)
+        return data
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        pass
+
+class _OutOfRange(Exception):
+    """Raised by _TailFile for reads before the fetched tail"""
+    def __init__(self, position):
+        super().__init__(position)
+        self.position = position
+
+class _TailFile:
+    """Seekable file object over the last bytes of an object, for zipfile to parse"""
+    def __init__(self, size, offset, data):
+        self.size = size
+        self.offset = offset
+        self.data = data
+        self._position = 0
+
+    def seek(self, offset, whence=0):
+        base = {0: 0, 1: self._position, 2: self.size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def read(self, size=-1):
+        if self._position < self.offset:
+            raise _OutOfRange(self._position)
+        start = self._position - self.offset
+        end = len(self.data) if size is None or size < 0 else start + size
+        data = self.data[start:end]
+        self._position += len(data)
+        return data
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        pass
+
+def _read_directory(tail, paths):
+    """Parse the central directory in a tail; returns (members, links, extra, spans)"""
+    with zipfile.ZipFile(tail) as zipf:
+        members, links, extra = select_restore_set(zipf, paths)
+        return members, links, extra, _member_spans(zipf)
+
+async def _feed(queue, chunk, consumer):
+    """Put a chunk on a queue unless the consumer finished first; returns whether it was queued"""
+    put = asyncio.ensure_future(queue.put(chunk))
+    await asyncio.wait({put, consumer}, return_when=asyncio.FIRST_COMPLETED)
+    if put.done():
+        return True
+    put.cancel()
+    return False
+
+async def _put_checksums(client, bucket_name, s3_key, document):
+    """Store the checksums document of an archive next to it, see s3_backup.put_checksums"""
+    await client.put_object(Bucket=bucket_name, Key=checksums_path(s3_key),
+                            Body=json.dumps(document).encode(), ContentType='application/json')
+
+async def _get_checksums(client, bucket_name, s3_key):
+    """Fetch the checksums document of an archive, or None, see s3_backup.get_checksums"""
+    try:
+        response = await client.get_object(Bucket=bucket_name, Key=checksums_path(s3_key))
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    async with response['Body'] as body:
+        return json.loads(await body.read())
+
+async def _extract_member(client, bucket_name, s3_key, zinfo, span, restore_dir, checksums, progress):
+    """Stream one member's byte range into an extraction thread"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(STREAM_QUEUE_SIZE)
+    consumer = loop.run_in_executor(None, extract_member_stream, _ChunkQueueReader(loop, queue), zinfo,
+                                    restore_dir, checksums)
+    try:
+        response = await client.get_object(Bucket=bucket_name, Key=s3_key,
+                                           Range=f"bytes={span[0]}-{span[1] - 1}")
+        async with response['Body'] as body:
+            while True:
+                chunk = await body.read(STREAM_CHUNK_SIZE)
+                await limiter.athrottle('download', len(chunk))
+                if not await _feed(queue, chunk, consumer) or not chunk:
+                    break
+                progress.transfer('download', len(chunk))
+    except BaseException:
+        # Unblock the extraction thread before giving up on the member
+        while not consumer.done():
+            await _feed(queue, b'', consumer)
+        if not consumer.cancelled():
+            consumer.exception()
+        raise
+    return await consumer
+
+async def _extract_in_order(client, bucket_name, s3_key, size, members, spans, restore_dir, checksums,
+                            verifier, concurrency, progress):
+    """
+    Stream a whole archive in order into an extraction thread, checking it on the way
+
+    Ranges are fetched concurrently by _OrderedRanges, fed to the verifier
+    and queued for s3_backup.extract_in_order, so the archive digest and
+    part checksums are compared without a second pass.
+
+    Returns:
+        list: (ZipInfo, exception) pairs for members that failed
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(STREAM_QUEUE_SIZE)
+    consumer = loop.run_in_executor(None, extract_in_order, _ChunkQueueReader(loop, queue), members, spans,
+                                    restore_dir, checksums, progress)
+    range_size = s3_backup.aws_config.get_transfer_config(size).multipart_chunksize
+    ranges = _OrderedRanges(client, bucket_name, s3_key, size, range_size, concurrency)
+    try:
+        fed = True
+        while fed:
+            data = await ranges.next()
+            if data is None:
+                await _feed(queue, b'', consumer)
+                break
+            await loop.run_in_executor(None, verifier.update, data)
+            progress.transfer('download', len(data))
+            for start in range(0, len(data), STREAM_CHUNK_SIZE):
+                fed = await _feed(queue, data[start:start + STREAM_CHUNK_SIZE], consumer)
+                if not fed:
+                    break
+    except BaseException:
+        # Unblock the extraction thread before giving up on the archive
+        while not consumer.done():
+            await _feed(queue, b'', consumer)
+        if not consumer.cancelled():
+            consumer.exception()
+        raise
+    finally:
+        await ranges.close()
+    errors = await consumer
+    verifier.check()
+    return errors
+
+@tracked('upload_to_s3')
+async def upload_to_s3(local_file, bucket_name, s3_key=None, transfer_config=None, client=None,
+                       progress=None):
+    """
+    Upload a file to AWS S3 from an asyncio event loop
+
+    Large files are sent as multipart uploads whose parts all run on the
+    event loop, at most max_concurrency at a time; file reads happen in the
+    default executor.
+
+    Args:
+        local_file (str): Path to local file
+        bucket_name (str): S3 bucket name
+        s3_key (str): S3 object key (path in bucket). If None, uses filename
+        transfer_config (dict): Transfer settings overriding aws_config's,
+            see s3_backup.upload_to_s3
+        client: aiobotocore S3 client from open_client(). None opens one
+        progress (Progress): Receives progress events and the run report
+
+    Returns:
+        str: Success message or error message
+    """
+    try:
+        # Validate local file
+        if not os.path.exists(local_file):
+            return f"Error: Local file '{local_file}' does not exist"
+
+        # If s3_key not provided, use filename
+        if s3_key is None:
+            s3_key = os.path.basename(local_file)
+
+        loop = asyncio.get_running_loop()
+        file_size = os.path.getsize(local_file)
+        config = s3_backup.aws_config.get_transfer_config(file_size, **(transfer_config or {}))
+        part_size = _part_size(file_size, config)
+        progress.message(f"Uploading {local_file} to s3://{bucket_name}/{s3_key}")
+        start = time.perf_counter()
+        async with _client_scope(client) as client:
+            with progress.phase('upload'):
+                if file_size < config.multipart_threshold:
+                    body = await loop.run_in_executor(None, _read_part, local_file, 0, file_size)
+                    await limiter.athrottle('upload', file_size)
+                    await client.put_object(Bucket=bucket_name, Key=s3_key, Body=body)
+                    progress.transfer('upload', file_size)
+                else:
+                    upload = await AsyncMultipartUpload(client, bucket_name, s3_key,
+                                                        config.max_concurrency, progress).start()
+                    try:
+                        for offset in range(0, file_size, part_size):
+                            await upload.wait_slot()
+                            upload.submit(await loop.run_in_executor(None, _read_part, local_file,
+                                                                     offset, part_size))
+                        await upload.complete()
+                    except BaseException:
+                        await upload.abort()
+                        raise
+        _log_throughput(progress, 'upload', file_size, time.perf_counter() - start,
+                        part_size if file_size >= config.multipart_threshold else None,
+                        config.max_concurrency)
+
+        progress.message("Upload completed successfully!")
+        return f"File uploaded to s3://{bucket_name}/{s3_key}"
+
+    except ClientError as e:
+        return f"AWS Error: {str(e)}"
+    except Exception as e:
+        return f"Error uploading to S3: {str(e)}"
+
+@tracked('download_from_s3')
+async def download_from_s3(bucket_name, s3_key, local_file, transfer_config=None, client=None,
+                           checksums=None, progress=None):
+    """
+    Download a file from AWS S3 from an asyncio event loop
+
+    Large objects are fetched as concurrent ranged GETs, at most
+    max_concurrency at a time, each written at its offset in the executor.
+    With checksums the ranges are written in order instead, and the
+    archive digest and part checksums are checked on the way.
+
+    Args:
+        bucket_name (str): S3 bucket name
+        s3_key (str): S3 object key (path in bucket)
+        local_file (str): Path where to save the file locally
+        transfer_config (dict): Transfer settings overriding aws_config's,
+            see s3_backup.upload_to_s3
+        client: aiobotocore S3 client from open_client(). None opens one
+        checksums (dict): Checksums document of the archive, see
+            s3_backup.download_from_s3
+        progress (Progress): Receives progress events and the run report
+
+    Returns:
+        str: Success message or error message
+    """
+    try:
+        # Create local directory if it doesn't exist
+        os.makedirs(os.path.dirname(local_file) or '.', exist_ok=True)
+
+        loop = asyncio.get_running_loop()
+        async with _client_scope(client) as client:
+            # Size parts from the object size
+            file_size = (await client.head_object(Bucket=bucket_name, Key=s3_key))['ContentLength']
+            config = s3_backup.aws_config.get_transfer_config(file_size, **(transfer_config or {}))
+            part_size = _part_size(file_size, config)
+            if file_size < config.multipart_threshold:
+                part_size = max(file_size, 1)
+            progress.message(f"Downloading s3://{bucket_name}/{s3_key} to {local_file}")
+            start = time.perf_counter()
+            slots = asyncio.Semaphore(config.max_concurrency)
+            lock = threading.Lock()
+
+            async def fetch(f, offset):
+                async with slots:
+                    data = await _get_range(client, bucket_name, s3_key, offset,
+                                            min(offset + part_size, file_size))
+                    await loop.run_in_executor(None, _write_part, f, lock, offset, data)
+                progress.transfer('download', len(data))
+
+            verifier = archive_verifier(checksums, s3_key)
+            if verifier is None:
+                with progress.phase('download'), open(local_file, 'wb') as f:
+                    await asyncio.gather(*(fetch(f, offset) for offset in range(0, file_size, part_size)))
+            else:
+                ranges = _OrderedRanges(client, bucket_name, s3_key, file_size, part_size,
+                                        config.max_concurrency)
+                try:
+                    with progress.phase('download'), open(local_file, 'wb') as f:
+                        while True:
+                            data = await ranges.next()
+                            if data is None:
+                                break
+                            await loop.run_in_executor(None, _write_verified, f, verifier, data)
+                            progress.transfer('download', len(data))
+                    verifier.check()
+                except BaseException:
+                    # Leave no partial or corrupted archive behind
+                    if os.path.exists(local_file):
+                        os.remove(local_file)
+                    raise
+                finally:
+                    await ranges.close()
+        _log_throughput(progress, 'download', file_size, time.perf_counter() - start,
+                        part_size if file_size >= config.multipart_threshold else None,
+                        config.max_concurrency)
+
+        progress.message("Download completed successfully!")
+        return f"File downloaded to {local_file}"
+
+    except ClientError as e:
+        return f"AWS Error: {str(e)}"
+    except Exception as e:
+        return f"Error downloading from S3: {str(e)}"
+
+@tracked('stream_backup_to_s3')
+async def stream_backup_to_s3(source_dir, bucket_name, s3_key, workers=1,
+                              part_size=64 * 1024 * 1024, max_inflight_parts=4, codec=None,
+                              adaptive=False, dedup=False, catalog=None, client=None,
+                              progress=None):
+    """
+    Compress a directory straight into an S3 multipart upload from an event loop
+
+    Compression runs in the default executor and hands full parts to the
+    event loop through a bounded queue; the loop uploads them concurrently.
+    See s3_backup.stream_backup_to_s3 for the arguments; client is an
+    aiobotocore S3 client from open_client(), None opens one.
+
+    Returns:
+        str: Success message or error message
+    """
+    try:
+        # Validate source directory
+        if not os.path.exists(source_dir):
+            return f"Error: Source directory '{source_dir}' does not exist"
+        if part_size < MIN_PART_SIZE:
+            return f"Error: part_size must be at least {MIN_PART_SIZE} bytes"
+
+        loop = asyncio.get_running_loop()
+        progress.message(f"Streaming backup of {source_dir} to s3://{bucket_name}/{s3_key}")
+        start = time.perf_counter()
+        queue = asyncio.Queue(1)
+        writer = _PartQueueWriter(loop, queue, part_size)
+
+        def compress():
+            stats = write_backup_archive(source_dir, writer, workers=workers, codec=codec,
+                                         adaptive=adaptive, dedup=dedup, progress=progress)
+            writer.close()
+            return stats
+
+        async with _client_scope(client) as client:
+            upload = await AsyncMultipartUpload(client, bucket_name, s3_key, max_inflight_parts,
+                                                progress).start()
+            producer = loop.run_in_executor(None, compress)
+            try:
+                while True:
+                    get = asyncio.ensure_future(queue.get())
+                    await asyncio.wait({get, producer}, return_when=asyncio.FIRST_COMPLETED)
+                    if not get.done():
+                        # Compression ended without the end marker
+                        get.cancel()
+                        await producer
+                        raise RuntimeError("Compression stopped before the archive was complete")
+                    part = get.result()
+                    if part is None:
+                        break
+                    await upload.wait_slot()
+                    upload.submit(part)
+                stats = await producer
+                await upload.complete()
+            except BaseException:
+                # Let the compression thread stop before aborting the upload
+                writer.failed = True
+                while not producer.done():
+                    get = asyncio.ensure_future(queue.get())
+                    await asyncio.wait({get, producer}, return_when=asyncio.FIRST_COMPLETED)
+                    get.cancel()
+                if not producer.cancelled():
+                    producer.exception()
+                await upload.abort()
+                raise
+            await _put_checksums(client, bucket_name, s3_key,
+                                 checksums_document(stats, writer.tell(), upload.parts, part_size))
+        _log_throughput(progress, 'upload', writer.tell(), time.perf_counter() - start,
+                        part_size, max_inflight_parts)
+        await loop.run_in_executor(None, update_catalog, catalog, lambda c: c.record(
+            s3_key, os.path.abspath(source_dir), size=writer.tell(), codec=get_codec(codec).spec,
+            checksum=format_checksum(stats['algorithm'], stats['checksum']), members=stats['paths'],
+            bucket=bucket_name), progress)
+
+        progress.message("Upload completed successfully!")
+        return f"File uploaded to s3://{bucket_name}/{s3_key}"
+
+    except ClientError as e:
+        return f"AWS Error: {str(e)}"
+    except Exception as e:
+        return f"Error streaming backup to S3: {str(e)}"
+
+@tracked('backup_to_s3')
+async def backup_to_s3(source_dir, bucket_name, s3_prefix='', stream=False, workers=1,
+                       part_size=64 * 1024 * 1024, max_inflight_parts=4, codec=None, adaptive=False,
+                       dedup=False, transfer_config=None, catalog=None, client=None,
+                       progress=None):
+    """
+    Create a backup and upload it to S3 from an asyncio event loop
+
+    Compression always runs in the default executor, so the event loop
+    stays responsive. See s3_backup.backup_to_s3 for the arguments; client
+    is an aiobotocore S3 client from open_client(), None opens one. The
+    temporary archive goes to a private temporary directory.
+
+    Returns:
+        str: Success message or error message
+    """
+    try:
+        if stream:
+            s3_key = os.path.join(s3_prefix, backup_file_name(source_dir))
+            return await stream_backup_to_s3(source_dir, bucket_name, s3_key, workers,
+                                             part_size, max_inflight_parts, codec, adaptive, dedup,
+                                             catalog, client, progress=progress)
+
+        loop = asyncio.get_running_loop()
+        temp_backup_dir = tempfile.mkdtemp(prefix='backup_')
+        try:
+            # First create local backup
+            backup_file = await loop.run_in_executor(
+                None, lambda: create_backup(source_dir, temp_backup_dir, workers=workers, codec=codec,
+                                            adaptive=adaptive, dedup=dedup, catalog=catalog,
+                                            progress=progress))
+
+            if isinstance(backup_file, str) and backup_file.startswith('Error'):
+                return backup_file
+
+            # Upload to S3
+            s3_key = os.path.join(s3_prefix, os.path.basename(backup_file))
+            result = await upload_to_s3(backup_file, bucket_name, s3_key, transfer_config, client,
+                                        progress=progress)
+
+            # The catalog entry follows the archive from the temporary file to S3
+            if result.startswith('File uploaded'):
+                checksums = load_checksums(backup_file)
+                if checksums is not None:
+                    async with _client_scope(client) as scoped:
+                        await _put_checksums(scoped, bucket_name, s3_key, checksums)
+                update = lambda c: c.relocate(backup_file, s3_key, bucket_name)
+            else:
+                update = lambda c: c.remove(backup_file)
+            await loop.run_in_executor(None, update_catalog, catalog, update, progress)
+            return result
+        finally:
+            # Cleanup temporary files
+            shutil.rmtree(temp_backup_dir, ignore_errors=True)
+
+    except Exception as e:
+        return f"Error in backup to S3: {str(e)}"
+
+@tracked('stream_restore_from_s3')
+async def stream_restore_from_s3(bucket_name, s3_key, restore_dir, workers=8, paths=None,
+                                 link_duplicates=False, client=None, progress=None):
+    """
+    Restore a backup straight from S3 from an asyncio event loop
+
+    The central directory is read from the end of the object, then up to
+    workers members are fetched at once. Each member's bytes are streamed
+    into the default executor, where it is decompressed and written. A
+    full restore of an archive with recorded checksums is streamed whole
+    and in order instead, and checked against them, see _extract_in_order.
+    See s3_backup.stream_restore_from_s3 for the arguments; client is an
+    aiobotocore S3 client from open_client(), None opens one.
+
+    Returns:
+        str: Success message or error message
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        async with _client_scope(client) as client:
+            # Read the central directory only; fetch more if it starts before the tail
+            size = (await client.head_object(Bucket=bucket_name, Key=s3_key))['ContentLength']
+            offset = max(0, size - TAIL_SIZE)
+            while True:
+                tail = _TailFile(size, offset, await _get_range(client, bucket_name, s3_key, offset, size))
+                try:
+                    members, links, extra, spans = await loop.run_in_executor(
+                        None, _read_directory, tail, paths)
+                    break
+                except _OutOfRange as e:
+                    offset = e.position
+            if paths is not None and not members and not links:
+                return f"Error: No files in s3://{bucket_name}/{s3_key} match {paths}"
+            checksums = await _get_checksums(client, bucket_name, s3_key)
+            # A full restore reads every byte anyway, in order it checks the whole archive too
+            verifier = archive_verifier(checksums, s3_key) if paths is None else None
+
+            # Create restore directory and all member directories
+            for zinfo in members:
+                target = member_target(restore_dir, zinfo.filename)
+                os.makedirs(target if zinfo.is_dir() else os.path.dirname(target), exist_ok=True)
+            os.makedirs(restore_dir, exist_ok=True)
+
+            progress.message(f"Streaming s3://{bucket_name}/{s3_key} to: {restore_dir}")
+            progress.set_total(len(members), sum(info.compress_size for info in members))
+            start = time.perf_counter()
+            slots = asyncio.Semaphore(workers)
+            errors = []
+
+            async def extract(zinfo):
+                async with slots:
+                    try:
+                        await _extract_member(client, bucket_name, s3_key, zinfo, spans[zinfo.filename],
+                                              restore_dir, checksums, progress)
+                        error = None
+                    except Exception as e:
+                        errors.append((zinfo, e))
+                        error = e
+                progress.file_done(zinfo.filename, zinfo.compress_size, zinfo.file_size, error)
+
+            files = sorted((zinfo for zinfo in members if not zinfo.is_dir()), key=lambda zinfo: -zinfo.file_size)
+            if verifier is None:
+                with progress.phase('extract'):
+                    await asyncio.gather(*(extract(zinfo) for zinfo in files))
+                downloaded = sum(end - begin for begin, end in (spans[info.filename] for info in members))
+            else:
+                errors = await _extract_in_order(client, bucket_name, s3_key, size, members, spans,
+                                                 restore_dir, checksums, verifier, workers, progress)
+                downloaded = size
+        if errors:
+            names = ', '.join(info.filename for info, _ in errors[:5])
+            return f"Error in streaming restore from S3: {len(errors)} members failed ({names})"
+        progress.count('verified_files', count_verified(checksums, members))
+        _log_throughput(progress, 'download', downloaded, time.perf_counter() - start,
+                        concurrency=workers)
+        await loop.run_in_executor(None, restore_links, links, restore_dir, extra, link_duplicates)
+        progress.count('linked_files', len(links))
+
+        progress.message("Restore completed successfully!")
+        return f"Backup restored to: {restore_dir}"
+
+    except ClientError as e:
+        return f"AWS Error: {str(e)}"
+    except Exception as e:
+        return f"Error in streaming restore from S3: {str(e)}"
+
+@tracked('restore_from_s3')
+async def restore_from_s3(bucket_name, s3_key, restore_dir, stream=False, workers=8, paths=None,
+                          link_duplicates=False, transfer_config=None, client=None, progress=None):
+    """
+    Download a backup from S3 and restore it from an asyncio event loop
+
+    See s3_backup.restore_from_s3 for the arguments; client is an
+    aiobotocore S3 client from open_client(), None opens one. Extraction
+    runs in the default executor. The archive is downloaded to a private
+    temporary directory.
+
+    Returns:
+        str: Success message or error message
+    """
+    try:
+        if stream or paths is not None:
+            return await stream_restore_from_s3(bucket_name, s3_key, restore_dir, workers, paths,
+                                                link_duplicates, client, progress=progress)
+
+        loop = asyncio.get_running_loop()
+        temp_download_dir = tempfile.mkdtemp(prefix='restore_')
+        try:
+            # Download file, checking the archive against its checksums on the way
+            async with _client_scope(client) as scoped:
+                checksums = await _get_checksums(scoped, bucket_name, s3_key)
+            local_file = os.path.join(temp_download_dir, os.path.basename(s3_key))
+            download_result = await download_from_s3(bucket_name, s3_key, local_file, transfer_config,
+                                                     client, checksums, progress=progress)
+
+            if 'Error' in download_result.split(':', 1)[0]:
+                return download_result
+
+            # restore_backup verifies the files against checksums found next to the archive
+            if checksums is not None:
+                save_checksums(local_file, checksums)
+
+            # Restore from downloaded file
+            return await loop.run_in_executor(
+                None, lambda: restore_backup(local_file, restore_dir, link_duplicates=link_duplicates,
+                                             progress=progress))
+        finally:
+            # Cleanup temporary files
+            shutil.rmtree(temp_download_dir, ignore_errors=True)
+
+    except Exception as e:
+        return f"Error in restore from S3: {str(e)}"
@@ -1,64 +1,1392 @@
+import io
 import os
+import json
+import time
+import queue
+import struct
 import zipfile
+import tarfile
+import zlib
+import tempfile
+import fnmatch
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import shutil
+from manifest import (scan_files, diff_files, save_manifest, load_manifest,
+                      find_latest_manifest, backup_chain)
+from chunk_repo import ChunkRepository
+from backup_codecs import (get_codec, archive_comment, copy_member_data, member_codec,
+                           is_incompressible)
+from progress import Progress, ConsoleRenderer, tracked
+from walker import iter_files
+from dedup import find_duplicates, write_links, read_links, links_member
+from catalog import update_catalog
+from throttle import open_throttled, limiter
+from pipeline import Pipeline, PipelineAborted, BufferPool, merge_reports
+from fastio import local_file, copy_file_data
+from checkpoint import (Journal, archive_fingerprint, record_member, resume_archive, journal_path,
+                        find_unfinished_archive)
+from integrity import (HashingWriter, new_digest, member_writer, checksums_document,
+                       save_checksums, load_checksums, format_checksum, count_verified,
+                       algorithm_available, ChecksumError)
+from shards import (plan_shards, shard_path, shard_entry, shard_index, shard_index_path, save_shard_index,
+                    load_shard_index, is_shard_index, select_shards)
+from tar_format import (get_tar_format, is_tar_archive, FrameWriter, archive_header, header_metadata,
+                        build_index, index_member, is_index_member, open_tar_stream)
 
-def create_backup(source_dir, target_dir):
+# Largest read size of the backup pipeline; lower memory limits use smaller chunks
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+# Chunks queued per member between the read, compress and write stages
+QUEUE_DEPTH = 4
+# Compressed data waiting for the writer stays in memory up to this size, then spills to disk
+SPOOL_MAX_SIZE = 16 * 1024 * 1024
+# Memory the backup pipeline may hold in buffers unless told otherwise
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024
+# Files read at the same time by default; more rarely helps a single disk
+READ_WORKERS = 4
+# Stored members from this size on are copied into local archives by the kernel
+DIRECT_COPY_MIN_SIZE = 4 * 1024 * 1024
+# Python versions whose zipfile internals _write_member_header and _finish_member
+# are checked against; tests/test_zip_compat.py fails outside this range
+SUPPORTED_PYTHON = ((3, 9), (3, 13))
+# ZIP format values zipfile only has under private names (APPNOTE.TXT 4.3.9, 4.4.4)
+DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_LZMA_END_MARKER = 0x02
+
+def _scan_source(source_dir, workers=1):
     """
-    Create a backup of source directory in ZIP format
+    Collect every file below source_dir together with its archive name and size
+    
+    Args:
+        source_dir (str): Path to source directory
+        workers (int): Number of threads listing directories
+    
+    Returns:
+        list: (file_path, arcname, size, stat) tuples sorted by arcname, so the
+            archive layout does not depend on directory listing order
+    """
+    members = [(entry.path, entry.relpath, entry.stat.st_size, entry.stat)
+               for entry in iter_files(source_dir, workers)]
+    members.sort(key=lambda m: m[1])
+    return members
+
+def _zip_info(file_path, arcname, st=None):
+    """
+    Build the ZipInfo for a file, like ZipInfo.from_file but reusing a
+    stat result the directory walk already has
+    """
+    if st is None:
+        st = os.stat(file_path)
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[0:6])
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+    zinfo.file_size = st.st_size
+    return zinfo
+
+def _choose_codec(file_path, size, codec, adaptive):
+    """Return the codec for one file: 'store' if adaptive mode finds it incompressible"""
+    if adaptive and codec.name != 'store' and is_incompressible(file_path, size):
+        return get_codec('store')
+    return codec
+
+def _pipeline_limits(memory_limit, workers):
+    """
+    Size the backup pipeline's buffers so they fit in memory_limit bytes
+    
+    Each member in flight holds at most a queue of read chunks, a queue of
+    compressed chunks and an in-memory spool, so the limit is shared by the
+    window of members in flight. Codecs' own state (e.g. a zstd window) is
+    not counted, and a few hundred KB are used however low the limit is.
+    
+    Returns:
+        tuple: (window of members in flight, chunk size, queue depth, spool size)
+    """
+    window = max(2, min(workers * 2, memory_limit // (3 * MIN_CHUNK_SIZE)))
+    share = memory_limit // window
+    chunk_size = max(MIN_CHUNK_SIZE, min(COMPRESS_CHUNK_SIZE, share // (4 * QUEUE_DEPTH)))
+    depth = max(1, min(QUEUE_DEPTH, share // (4 * chunk_size)))
+    spool_size = max(chunk_size, min(SPOOL_MAX_SIZE, share - 2 * depth * chunk_size))
+    return window, chunk_size, depth, spool_size
+
+def _readinto(fileobj, buffer):
+    """fileobj.readinto(buffer); SpooledTemporaryFile only has readinto from Python 3.11 on"""
+    if hasattr(fileobj, 'readinto'):
+        return fileobj.readinto(buffer)
+    data = fileobj.read(len(buffer))
+    buffer[:len(data)] = data
+    return len(data)
+
+class _MemberOutput:
+    """
+    Compressed data of one member on its way from a compress worker to the writer
+    
+    Until the writer gets to the member, data is spooled (in memory up to
+    spool_size, then on disk), so compression can run ahead of writing.
+    Once the writer attaches, the rest is handed over through a bounded
+    queue instead. Read buffers of a BufferPool passed along with the data
+    go back to the pool once the data is spooled or written.
+    """
+    def __init__(self, pipeline, depth, spool_size, spool_dir, pool=None):
+        self.pipeline = pipeline
+        self.pool = pool
+        self.spool = tempfile.SpooledTemporaryFile(max_size=spool_size, dir=spool_dir)
+        self.queue = queue.Queue(depth)
+        self.attached = False
+        self.finished = False
+        self._lock = threading.Lock()
+    
+    def write(self, data, buffer=None):
+        """Pass on data, which may be a view of buffer from the pool"""
+        if not data:
+            self._release(buffer)
+            return
+        with self._lock:
+            if not self.attached:
+                self.spool.write(data)
+                self._release(buffer)
+                return
+        self.pipeline.put(self.queue, (data, buffer))
+    
+    def _release(self, buffer):
+        if buffer is not None:
+            self.pool.release(buffer)
+    
+    def finish(self):
+        """Mark the member's data complete"""
+        with self._lock:
+            self.finished = True
+            if not self.attached:
+                return
+        self.pipeline.put(self.queue, None)
+    
+    def attach(self, buffer):
+        """
+        Yield the member's data in order, waiting for the parts not compressed yet
+        
+        Spooled data is read into buffer, so each chunk is only valid until
+        the next one is requested.
+        """
+        with self._lock:
+            self.attached = True
+            finished = self.finished
+        self.spool.seek(0)
+        view = memoryview(buffer)
+        for size in iter(lambda: _readinto(self.spool, buffer), 0):
+            yield view[:size]
+        self.spool.close()
+        if not finished:
+            for data, used in iter(lambda: self.pipeline.get(self.queue), None):
+                yield data
+                self._release(used)
+    
+    def close(self):
+        self.spool.close()
+
+class _MemberJob:
+    """One member moving through the backup pipeline"""
+    def __init__(self, file_path, size, zinfo, codec, chunks, output, direct=False):
+        self.file_path = file_path
+        self.size = size
+        self.zinfo = zinfo
+        self.codec = codec
+        # Read (data, pool buffer or None) chunks waiting for the compress stage, ended by None
+        self.chunks = chunks
+        self.output = output
+        # Copied into the archive by the writer, skipping the read and compress stages
+        self.direct = direct
+        # Decided before the size is known, the way zipfile does for streams
+        self.zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+        self.digest = None
+
+def _write_member_header(zipf, job):
+    """
+    Start a member in zipf; its sizes and CRC follow the data in a data descriptor
+    
+    ZipFile has no public API for writing a member from data compressed
+    elsewhere, so this and _finish_member do the bookkeeping ZipFile.write
+    does (_writecheck, filelist, NameToInfo, start_dir). That is checked
+    on every Python version in SUPPORTED_PYTHON.
+    """
+    zinfo = job.zinfo
+    zipf._writecheck(zinfo)
+    zipf._didModify = True
+    zinfo.header_offset = zipf.fp.tell()
+    zipf.fp.write(zinfo.FileHeader(job.zip64))
+
+def _finish_member(zipf, job):
+    """Write a member's data descriptor and register it like ZipFile.write does"""
+    zinfo = job.zinfo
+    if not job.zip64 and max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT:
+        raise RuntimeError(f"{zinfo.filename} grew past the ZIP64 limit while it was archived")
+    fmt = '<LLQQ' if job.zip64 else '<LLLL'
+    zipf.fp.write(struct.pack(fmt, DATA_DESCRIPTOR_SIGNATURE, zinfo.CRC, zinfo.compress_size, zinfo.file_size))
+    zipf.filelist.append(zinfo)
+    zipf.NameToInfo[zinfo.filename] = zinfo
+    zipf.start_dir = zipf.fp.tell()
+
+def _copy_member(output, job, buffers):
+    """
+    Copy a stored member's file into a local archive in the kernel
+    
+    The CRC and digests are computed from the copy in the archive, so they
+    describe exactly the bytes archived even if the file changes while it
+    is copied.
+    
+    Args:
+        output (HashingWriter): Archive output wrapping a local file
+        job (_MemberJob): Member whose header was just written
+        buffers (list): Two scratch bytearrays for the copy and the read-back
+    
+    Returns:
+        int: Bytes copied
+    """
+    fileobj = output.fileobj
+    fileobj.flush()
+    start = fileobj.tell()
+    digest = new_digest()
+    crc = 0
+    size = 0
+    src_fd = os.open(job.file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        chunks = copy_file_data(src_fd, fileobj.fileno(), start, buffers, limiter)
+        # The next piece is copied on another thread while this one is hashed
+        with ThreadPoolExecutor(max_workers=1) as copier:
+            future = copier.submit(next, chunks, None)
+            while True:
+                data = future.result()
+                if data is None:
+                    break
+                future = copier.submit(next, chunks, None)
+                crc = zlib.crc32(data, crc)
+                digest.update(data)
+                output.digest.update(data)
+                size += len(data)
+    finally:
+        os.close(src_fd)
+    fileobj.seek(start + size)
+    zinfo = job.zinfo
+    zinfo.CRC = crc
+    zinfo.compress_size = zinfo.file_size = size
+    job.digest = digest.hexdigest()
+    return size
+
+def _write_members(zipf, members, workers, read_workers, memory_limit, spool_dir, codec, adaptive,
+                   progress, digests, journal=None, zero_copy=True):
+    """
+    Write members to zipf through a scan -> read -> compress -> write pipeline
+    
+    The scan stage (one thread) orders members largest first, ties broken
+    by name, so the big files start early, and picks each member's codec.
+    read_workers threads read the files in chunks, workers threads compress
+    them and the calling thread writes the members in scan order, so the
+    archive layout only depends on the files. The stages are joined by
+    bounded queues and at most a window of members is in flight, so the
+    data buffered stays within memory_limit however large the files are,
+    see _pipeline_limits. Every member is written with a data descriptor
+    after its data, which lets the writer start a member before it is
+    completely compressed.
+    
+    With zero_copy, files are read with readinto into buffers reused from a
+    BufferPool instead of a new bytes object per chunk. Stored members of
+    at least DIRECT_COPY_MIN_SIZE bypass the read and compress stages when
+    the archive is a local file: the writer has the kernel copy them, see
+    _copy_member.
+    
+    Args:
+        zipf (zipfile.ZipFile): Archive opened in write mode
+        members (list): (file_path, arcname, size, stat) tuples
+        workers (int): Number of compression threads
+        read_workers (int): Number of threads reading files
+        memory_limit (int): Bytes the pipeline may buffer
+        spool_dir (str): Directory for spilled compressed data
+        codec (Codec): Codec to compress with
+        adaptive (bool): Store files that look incompressible as they are
+        progress (Progress): Receives one file event per written member and
+            the 'read_buffers' allocated and 'kernel_copied_bytes' counters
+        digests (dict): Filled with the content digest of every written member
+        journal (Journal): Records every written member, see checkpoint.record_member
+        zero_copy (bool): Use reused buffers and kernel copies; False reads
+            every chunk into a new bytes object
+    
+    Returns:
+        tuple: (stage metrics, bottleneck stage), see pipeline.Pipeline.report
+    """
+    window, chunk_size, depth, spool_size = _pipeline_limits(memory_limit, workers)
+    pipeline = Pipeline()
+    scan = pipeline.stage('scan')
+    read = pipeline.stage('read', read_workers)
+    compress = pipeline.stage('compress', workers)
+    write = pipeline.stage('write')
+    # The window of members in flight bounds these queues
+    slots = threading.Semaphore(window)
+    read_queue = queue.Queue()
+    compress_queue = queue.Queue()
+    write_queue = queue.Queue()
+    pending = deque()
+    # Enough buffers for every chunk that can be queued or held at once, so get() never waits
+    pool = None
+    if zero_copy:
+        pool = BufferPool(pipeline, window * depth + depth + read_workers + workers + 1, chunk_size)
+    local = local_file(zipf.fp) if zero_copy else None
+    
+    def scan_members():
+        for file_path, arcname, size, st in sorted(members, key=lambda m: (-m[2], m[1])):
+            pipeline.acquire(slots)
+            with scan.busy():
+                zinfo = _zip_info(file_path, arcname, st)
+                file_codec = _choose_codec(file_path, size, codec, adaptive)
+                zinfo.compress_type = file_codec.compress_type
+                zinfo.flag_bits |= FLAG_DATA_DESCRIPTOR
+                if zinfo.compress_type == zipfile.ZIP_LZMA:
+                    zinfo.flag_bits |= FLAG_LZMA_END_MARKER
+                if local is not None and file_codec.name == 'store' and size >= DIRECT_COPY_MIN_SIZE:
+                    job = _MemberJob(file_path, size, zinfo, file_codec, None, None, direct=True)
+                else:
+                    job = _MemberJob(file_path, size, zinfo, file_codec, queue.Queue(depth),
+                                     _MemberOutput(pipeline, depth, spool_size, spool_dir, pool))
+            pending.append(job)
+            if not job.direct:
+                read_queue.put(job)
+                compress_queue.put(job)
+            write_queue.put(job)
+            scan.done()
+        for _ in range(read.workers):
+            read_queue.put(None)
+        for _ in range(compress.workers):
+            compress_queue.put(None)
+        write_queue.put(None)
+    
+    def read_members():
+        chunks = 0
+        while True:
+            read.sample(read_queue.qsize())
+            job = pipeline.get(read_queue)
+            if job is None:
+                break
+            with open_throttled(job.file_path) as src:
+                while True:
+                    buffer = pool.get() if pool is not None else None
+                    with read.busy():
+                        if buffer is None:
+                            chunk = src.read(chunk_size)
+                        else:
+                            chunk = memoryview(buffer)[:src.readinto(buffer)]
+                    if not chunk:
+                        if buffer is not None:
+                            pool.release(buffer)
+                        break
+                    chunks += 1
+                    pipeline.put(job.chunks, (chunk, buffer))
+            pipeline.put(job.chunks, None)
+            read.done()
+        if pool is None:
+            # Every plain read allocates a new buffer
+            progress.count('read_buffers', chunks)
+    
+    def compress_members():
+        while True:
+            compress.sample(compress_queue.qsize())
+            job = pipeline.get(compress_queue)
+            if job is None:
+                return
+            wrapped = job.codec.wrapped
+            compressor = job.codec.compressor()
+            digest = new_digest()
+            crc = 0
+            file_size = 0
+            compress_size = 0
+            for chunk, buffer in iter(lambda: pipeline.get(job.chunks), None):
+                with compress.busy():
+                    file_size += len(chunk)
+                    digest.update(chunk)
+                    data = compressor.compress(chunk) if compressor else chunk
+                    # Wrapped codecs are stored frames, so the CRC covers the frame
+                    crc = zlib.crc32(data if wrapped else chunk, crc)
+                compress_size += len(data)
+                if compressor and buffer is not None:
+                    # The compressor has copied what it needs
+                    pool.release(buffer)
+                    buffer = None
+                job.output.write(data, buffer)
+            if compressor:
+                with compress.busy():
+                    data = compressor.flush()
+                    if wrapped:
+                        crc = zlib.crc32(data, crc)
+                compress_size += len(data)
+                job.output.write(data)
+            zinfo = job.zinfo
+            zinfo.CRC = crc
+            zinfo.compress_size = compress_size
+            if wrapped:
+                zinfo.comment = job.codec.name.encode()
+                zinfo.file_size = compress_size
+            else:
+                zinfo.file_size = file_size
+            job.digest = digest.hexdigest()
+            job.output.finish()
+            compress.done()
+    
+    pipeline.spawn(scan, scan_members)
+    pipeline.spawn(read, read_members)
+    pipeline.spawn(compress, compress_members)
+    # The writer's own scratch buffers, for spooled data and kernel copies
+    buffers = [bytearray(chunk_size), bytearray(chunk_size)]
+    copied = 0
+    try:
+        while True:
+            write.sample(write_queue.qsize())
+            job = pipeline.get(write_queue)
+            if job is None:
+                break
+            _write_member_header(zipf, job)
+            if job.direct:
+                with write.busy():
+                    copied += _copy_member(zipf.fp, job, buffers)
+            else:
+                for data in job.output.attach(buffers[0]):
+                    with write.busy():
+                        zipf.fp.write(data)
+            _finish_member(zipf, job)
+            pending.popleft()
+            slots.release()
+            digests[job.zinfo.filename] = job.digest
+            if journal is not None:
+                record_member(journal, zipf, job.zinfo, job.digest)
+            progress.file_done(job.zinfo.filename, job.size, job.zinfo.compress_size)
+            write.done()
+    except PipelineAborted:
+        pass
+    except BaseException as e:
+        pipeline.abort(e)
+    try:
+        pipeline.join()
+    finally:
+        # Release spooled data of members that were never written
+        for job in pending:
+            if job.output is not None:
+                job.output.close()
+    if pool is not None:
+        progress.count('read_buffers', pool.allocated)
+    progress.count('kernel_copied_bytes', copied)
+    return pipeline.report()
+
+def backup_file_name(source_dir, extension='.zip'):
+    """Return a timestamped backup file name for source_dir"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f"backup_{os.path.basename(source_dir)}_{timestamp}{extension}"
+
+def write_backup_archive(source_dir, fileobj, workers=1, members=None, spool_dir=None, codec=None,
+                         adaptive=False, dedup=False, checkpoint=None, read_workers=None,
+                         memory_limit=None, zero_copy=True, progress=None):
+    """
+    Write a ZIP archive of source directory to an open binary file
+    
+    fileobj does not need to be seekable, so this can write straight into a
+    pipe or an upload stream. Errors are raised, not returned.
+    
+    Args:
+        source_dir (str): Path to source directory
+        fileobj (file): Writable binary file object
+        workers (int): Number of compression threads, None uses every CPU core
+        members (list): (file_path, arcname, size) tuples to archive, optionally
+            with the file's os.stat_result as a fourth item so it is not
+            stat'ed again. None archives every file below source_dir
+        spool_dir (str): Directory for compressed data spilled while it waits
+            for the writer. None uses the system temp directory
+        codec (str or Codec): Compression codec, see backup_codecs.get_codec.
+            None uses deflate at the default level
+        adaptive (bool): Decide per file whether to compress. Files with a
+            compressed-format extension, or whose sample block barely
+            shrinks, are stored without compression
+        dedup (bool): Store identical files and hard links once. The other
+            paths are recorded in a reference list that restores recreate
+        checkpoint (str): Path of a journal recording every member written.
+            If it holds a previous attempt with the same files and settings,
+            the members fileobj still has are kept and writing continues
+            after them; the result is byte-identical to an uninterrupted run.
+            fileobj must then be a local file opened 'r+b', or offer
+            committed_bytes() and resume(offset) like S3MultipartWriter.
+            The journal is removed once the archive is complete; for such
+            writers, whose last part can still fail, the caller removes it
+            after completing the upload
+        read_workers (int): Number of threads reading files. None uses
+            up to READ_WORKERS, but no more than workers
+        memory_limit (int): Bytes the pipeline may hold in buffers,
+            DEFAULT_MEMORY_LIMIT if None; larger files are streamed
+            through in chunks or spilled to spool_dir
+        zero_copy (bool): Read files into reused buffers and, for a local
+            fileobj, copy large stored members in the kernel. False reads
+            every chunk into a new bytes object, as a baseline for
+            benchmark.bench_large_file
+        progress (Progress): Receives scan/compress phases, one file event
+            per member and the metrics of the pipeline stages. None reports
+            nothing
+    
+    The archive and every member are hashed while they are written, with
+    integrity.DEFAULT_ALGORITHM, so checksums cost no extra pass over the
+    data. To allow that the archive is always written sequentially, with
+    data descriptors after the members. Members go through the staged
+    pipeline of _write_members, in an order that does not depend on the
+    number of workers.
+    
+    Returns:
+        dict: 'files' and 'bytes' archived, 'stored_files' and 'stored_bytes'
+            that adaptive mode wrote without compression, 'linked_files'
+            and 'linked_bytes' that dedup stored as references, 'paths',
+            the (path, size) of every file a restore recreates, 'algorithm'
+            and 'checksum', the hex digest of the archive (None when it was
+            resumed into a writer that cannot be read back), and 'digests',
+            mapping every path a restore recreates to its content digest
+    """
+    codec = get_codec(codec)
+    source = os.path.abspath(source_dir)
+    progress = progress or Progress()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    read_workers = read_workers or min(workers, READ_WORKERS)
+    memory_limit = memory_limit or DEFAULT_MEMORY_LIMIT
+    if members is None:
+        with progress.phase('scan'):
+            members = _scan_source(source_dir, workers)
+    else:
+        members = [member if len(member) == 4 else (*member, None) for member in members]
+    paths = [(arcname.replace(os.sep, '/'), size) for _, arcname, size, _ in members]
+    journal = None
+    if checkpoint is not None:
+        # Some codecs frame their output by the chunks they are given
+        chunk_size = _pipeline_limits(memory_limit, workers)[1]
+        journal = Journal(checkpoint, {'archive': archive_fingerprint(
+            members, codec=codec.spec, adaptive=adaptive, dedup=dedup, chunk_size=chunk_size)})
+    links = {}
+    linked_bytes = 0
+    if dedup:
+        with progress.phase('dedup'):
+            unique, links = find_duplicates(members, workers)
+            linked_bytes = sum(member[2] for member in members) - sum(member[2] for member in unique)
+            members = unique
+    total_bytes = sum(member[2] for member in members)
+    progress.set_total(len(members), total_bytes)
+    archived = members
+    try:
+        stats = _write_archive(fileobj, members, workers, read_workers, memory_limit, zero_copy, spool_dir,
+                               codec, adaptive, source, links, journal, progress)
+    except BaseException:
+        if journal is not None:
+            journal.close()
+        raise
+    stats.update({'files': len(archived), 'bytes': total_bytes, 'linked_files': len(links),
+                  'linked_bytes': linked_bytes, 'paths': paths})
+    progress.count('stored_files', stats['stored_files'])
+    progress.count('stored_bytes', stats['stored_bytes'])
+    progress.count('linked_files', stats['linked_files'])
+    progress.count('linked_bytes', stats['linked_bytes'])
+    # Referenced paths restore to the content of the member they point at
+    for name in links:
+        target = name
+        while target in links:
+            target = links[target]['target']
+        stats['digests'][name] = stats['digests'].get(target)
+    if journal is not None:
+        if hasattr(fileobj, 'resume'):
+            journal.close()
+        else:
+            journal.remove()
+    return stats
+
+def _write_archive(fileobj, members, workers, read_workers, memory_limit, zero_copy, spool_dir, codec,
+                   adaptive, source, links, journal, progress):
+    """
+    Write the ZIP archive for write_backup_archive, resuming from journal if given
+    
+    Returns:
+        dict: 'stored_files' and 'stored_bytes' written without compression,
+            'algorithm', 'checksum' and 'digests' of the archive and members
+    """
+    done = []
+    digests = {}
+    offset = 0
+    if journal is not None:
+        offset, done = resume_archive(journal, fileobj)
+        digests = {entry['member']['filename']: entry.get('digest') for entry in journal.entries}
+        if done:
+            progress.message(f"Resuming archive after {len(done)} members ({offset / (1024 * 1024):.2f} MB)")
+            progress.count('resumed_files', len(done))
+    output = HashingWriter(fileobj)
+    hashed = True
+    if offset:
+        # The kept part of a local archive is read back once; writers' data is gone
+        hashed = getattr(fileobj, 'readable', lambda: False)()
+        if hashed:
+            fileobj.seek(0)
+            remaining = offset
+            while remaining:
+                chunk = fileobj.read(min(COMPRESS_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise EOFError("Archive is shorter than its journal")
+                output.digest.update(chunk)
+                remaining -= len(chunk)
+    with progress.phase('compress'), zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        # Record the codec so restores know how members were written
+        zipf.comment = archive_comment(codec, source=source)
+        # Members kept from an interrupted attempt only need their central directory entries
+        for zinfo in done:
+            zipf.filelist.append(zinfo)
+            zipf.NameToInfo[zinfo.filename] = zinfo
+        if done:
+            members = [member for member in members if member[1].replace(os.sep, '/') not in zipf.NameToInfo]
+        if members:
+            stages, bottleneck = _write_members(zipf, members, workers, read_workers, memory_limit,
+                                                spool_dir, codec, adaptive, progress, digests, journal,
+                                                zero_copy)
+            progress.set_stages(stages, bottleneck)
+            progress.message(f"Pipeline bottleneck: {bottleneck} "
+                             f"({stages[bottleneck]['utilization']:.0%} busy)")
+        
+        if links:
+            zipf.comment = archive_comment(codec, source=source, links=write_links(zipf, links))
+        
+        stats = {'stored_files': 0, 'stored_bytes': 0}
+        if codec.name != 'store':
+            for zinfo in zipf.filelist:
+                if zinfo.compress_type == zipfile.ZIP_STORED and not zinfo.comment:
+                    stats['stored_files'] += 1
+                    stats['stored_bytes'] += zinfo.file_size
+    stats.update({'algorithm': output.algorithm, 'checksum': output.hexdigest() if hashed else None,
+                  'digests': digests})
+    return stats
+
+def write_sharded_backup(source_dir, index_path, shard_size=None, shard_files=None, workers=1, members=None,
+                         codec=None, adaptive=False, dedup=False, read_workers=None, memory_limit=None,
+                         progress=None):
+    """
+    Write a backup as independent ZIP shards next to a shard index
+    
+    Members are split into shards of contiguous paths (see
+    shards.plan_shards) and every shard is a complete archive with its own
+    checksums file, written by its own pipeline. Up to workers shards are
+    written at the same time, sharing the compression threads and the
+    memory limit, so a large backup is not held up by a single writer.
+    The index, written last, maps path ranges to shards. Duplicates are
+    only found within a shard. Errors are raised, not returned.
+    
+    Args:
+        source_dir (str): Path to source directory
+        index_path (str): Path of the index; shards are named after it
+        shard_size (int): Target bytes of file content per shard
+        shard_files (int): Most files per shard
+        workers (int): Number of compression threads, None uses every CPU core
+        members (list): Members to archive, see write_backup_archive
+        codec, adaptive, dedup, read_workers: See write_backup_archive
+        memory_limit (int): Bytes all shards together may hold in buffers
+        progress (Progress): Receives the file events of every shard and
+            the merged metrics of their pipelines
+    
+    Returns:
+        dict: write_backup_archive's statistics added up over the shards,
+            with 'checksum' None, and 'index', the shard index
+    """
+    codec = get_codec(codec)
+    progress = progress or Progress()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if members is None:
+        with progress.phase('scan'):
+            members = _scan_source(source_dir, workers)
+    plan = plan_shards(members, shard_size, shard_files)
+    parallel = max(1, min(len(plan), workers))
+    shard_workers = max(1, workers // parallel)
+    shard_memory = max(3 * MIN_CHUNK_SIZE, (memory_limit or DEFAULT_MEMORY_LIMIT) // parallel)
+    progress.set_total(len(members), sum(member[2] for member in members))
+    progress.message(f"Writing {len(plan)} shards, {parallel} at a time")
+    
+    def write_shard(number, shard_members):
+        path = shard_path(index_path, number)
+        part = progress.part(os.path.basename(path))
+        with open(path, 'w+b') as f:
+            stats = write_backup_archive(source_dir, f, workers=shard_workers, members=shard_members,
+                                         spool_dir=os.path.dirname(index_path) or None, codec=codec,
+                                         adaptive=adaptive, dedup=dedup,
+                                         read_workers=read_workers and max(1, read_workers // parallel),
+                                         memory_limit=shard_memory, progress=part)
+        size = os.path.getsize(path)
+        save_checksums(path, checksums_document(stats, size))
+        entry = shard_entry(path, shard_members, size, format_checksum(stats['algorithm'], stats['checksum']))
+        return entry, stats, part
+    
+    with progress.phase('compress'), ThreadPoolExecutor(max_workers=parallel) as executor:
+        results = list(executor.map(write_shard, range(1, len(plan) + 1), plan))
+    
+    totals = {'algorithm': results[0][1]['algorithm'], 'checksum': None, 'paths': [], 'digests': {}}
+    for _, stats, _ in results:
+        for field in ('files', 'bytes', 'stored_files', 'stored_bytes', 'linked_files', 'linked_bytes'):
+            totals[field] = totals.get(field, 0) + stats[field]
+        totals['paths'] += stats['paths']
+        totals['digests'].update(stats['digests'])
+    stages, bottleneck = merge_reports([(part.stages, part.bottleneck) for _, _, part in results])
+    if stages:
+        progress.set_stages(stages, bottleneck)
+        progress.message(f"Pipeline bottleneck: {bottleneck} "
+                         f"({stages[bottleneck]['utilization']:.0%} busy)")
+    totals['index'] = shard_index([entry for entry, _, _ in results], os.path.abspath(source_dir), codec.spec)
+    save_shard_index(index_path, totals['index'])
+    return totals
+
+class _PaddedReader:
+    """
+    Read exactly size bytes of a file for tarfile, hashing them
+    
+    A file that shrank after it was scanned is padded with zeros, and one
+    that grew is cut at size, so the tar header written up front stays true.
+    """
+    def __init__(self, fileobj, size, algorithm):
+        self.fileobj = fileobj
+        self.remaining = size
+        self.digest = new_digest(algorithm)
+        self.padded = 0
+    
+    def read(self, n=-1):
+        n = self.remaining if n is None or n < 0 else min(n, self.remaining)
+        data = self.fileobj.read(n) if n else b''
+        if len(data) < n:
+            self.padded += n - len(data)
+            data += bytes(n - len(data))
+        self.remaining -= n
+        self.digest.update(data)
+        return data
+
+def write_tar_archive(source_dir, fileobj, format='tar.zst', workers=1, members=None, progress=None):
+    """
+    Write a compressed tar archive of source directory to an open binary file
+    
+    Unlike ZIP, nothing is ever sought or patched: the archive is written
+    strictly in order, so fileobj can be stdout, a pipe or an upload
+    stream. The archive ends with an index member listing every file with
+    its digest, compressed in a frame of its own and located by a trailer,
+    see tar_format. Errors are raised, not returned.
+    
+    Args:
+        source_dir (str): Path to source directory
+        fileobj (file): Writable binary file object
+        format (str or TarFormat): 'tar.zst[:level]' or 'tar.gz[:level]'
+        workers (int): Number of zstd compression threads, None uses every
+            CPU core. gzip always compresses on one thread
+        members (list): (file_path, arcname, size) tuples to archive, as for
+            write_backup_archive. None archives every file below source_dir
+        progress (Progress): Receives scan/compress phases and one file
+            event per member. None reports nothing
+    
+    Returns:
+        dict: Same keys as write_backup_archive; 'stored_files',
+            'stored_bytes', 'linked_files' and 'linked_bytes' are always 0
+    """
+    tar_format = get_tar_format(format)
+    if tar_format is None:
+        raise ValueError("write_tar_archive needs a tar format, not 'zip'")
+    source = os.path.abspath(source_dir)
+    progress = progress or Progress()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if members is None:
+        with progress.phase('scan'):
+            members = _scan_source(source_dir, workers)
+    else:
+        members = [member if len(member) == 4 else (*member, None) for member in members]
+    total_bytes = sum(member[2] for member in members)
+    progress.set_total(len(members), total_bytes)
+    
+    output = HashingWriter(fileobj)
+    writer = FrameWriter(output, tar_format, workers)
+    digests = {}
+    entries = []
+    paths = []
+    with progress.phase('compress'):
+        tar = tarfile.open(fileobj=writer, mode='w', format=tarfile.PAX_FORMAT,
+                           pax_headers=archive_header(tar_format, source, output.algorithm))
+        tar.copybufsize = COMPRESS_CHUNK_SIZE
+        for file_path, arcname, size, st in members:
+            arcname = arcname.replace(os.sep, '/')
+            if st is None:
+                st = os.stat(file_path)
+            tarinfo = tarfile.TarInfo(arcname)
+            tarinfo.size = size
+            tarinfo.mtime = int(st.st_mtime)
+            tarinfo.mode = st.st_mode & 0o7777
+            start = writer.offset
+            with open_throttled(file_path) as f:
+                reader = _PaddedReader(f, size, output.algorithm)
+                tar.addfile(tarinfo, reader)
+            if reader.padded:
+                progress.message(f"{arcname} shrank while it was archived, padded with "
+                                 f"{reader.padded} zero bytes")
+            digests[arcname] = reader.digest.hexdigest()
+            entries.append([arcname, size, tarinfo.mtime, digests[arcname]])
+            paths.append((arcname, size))
+            # Compressed bytes are only approximate per file while the compressor buffers
+            progress.file_done(arcname, size, writer.offset - start)
+        # The index and the end of the tar get a frame of their own, so listings decompress only them
+        index_offset = writer.end_frame()
+        tarinfo, data = index_member(build_index(tar_format, entries, source, output.algorithm))
+        tar.addfile(tarinfo, io.BytesIO(data))
+        tar.close()
+        index_end = writer.end_frame()
+        writer.write_raw(tar_format.trailer(index_offset, index_end - index_offset))
+    output.flush()
+    return {'files': len(members), 'bytes': total_bytes, 'stored_files': 0, 'stored_bytes': 0,
+            'linked_files': 0, 'linked_bytes': 0, 'paths': paths, 'algorithm': output.algorithm,
+            'checksum': output.hexdigest(), 'digests': digests}
+
+@tracked('create_backup')
+def create_backup(source_dir, target_dir, workers=1, incremental=False, use_hash=False, codec=None,
+                  adaptive=False, dedup=False, catalog=None, resume=False, read_workers=None,
+                  memory_limit=None, shard_size=None, shard_files=None, format='zip', progress=None):
+    """
+    Create a backup of source directory in ZIP or compressed tar format
     
     Args:
         source_dir (str): Path to source directory
         target_dir (str): Path to target directory where backup will be saved
+        workers (int): Number of threads compressing files in parallel,
+            None uses every CPU core
+        incremental (bool): Only archive files that are new or changed since the
+            latest backup of source_dir in target_dir and save a manifest next to
+            the backup. Without a previous manifest a full backup is made
+        use_hash (bool): In incremental mode, compare SHA-256 content hashes instead
+            of metadata, so files that were only touched are not archived again
+            and edits that kept size and mtime are not missed
+        codec (str): Compression codec: 'store', 'deflate[:level]', 'bzip2[:level]',
+            'lzma', 'zstd[:level]' or 'lz4[:level]'. Defaults to deflate
+        adaptive (bool): Store already-compressed files (media, archives,
+            parquet, ...) without running them through the codec
+        dedup (bool): Store byte-identical files and hard links only once;
+            restore_backup recreates the other paths from the first copy
+        catalog (str or BackupCatalog): Catalog to record the backup in, e.g.
+            catalog.DEFAULT_CATALOG; see catalog.BackupCatalog. None, the
+            default, records nothing
+        resume (bool): Journal written members next to the archive. If an
+            earlier run with resume was interrupted, its archive is
+            completed instead of starting a new one
+        read_workers (int): Number of threads reading source files, see
+            write_backup_archive
+        memory_limit (int): Bytes the backup may hold in buffers, see
+            write_backup_archive
+        shard_size (int): Split the backup into ZIP shards holding about
+            this many bytes of files each, see write_sharded_backup
+        shard_files (int): Split the backup into ZIP shards of at most this
+            many files each. Sharded backups cannot be resumed
+        format (str): 'zip', or 'tar.zst[:level]' / 'tar.gz[:level]' for an
+            archive written strictly sequentially, see write_tar_archive.
+            Tar archives compress the whole stream, so codec, adaptive,
+            dedup, resume and sharding only apply to ZIP
+        progress (Progress): Receives progress events and the run report.
+            None runs quietly
+    
+    The checksums of the archive and of every file are saved next to it,
+    see integrity.save_checksums; restore_backup verifies files against them.
     
     Returns:
-        str: Path to created backup file or error message
+        str: Path to created backup file (the shard index of a sharded
+            backup) or error message
     """
     try:
         # Validate source directory
         if not os.path.exists(source_dir):
             return f"Error: Source directory '{source_dir}' does not exist"
         
+        tar_format = get_tar_format(format)
+        sharded = bool(shard_size or shard_files)
+        if sharded and resume:
+            return "Error: Sharded backups cannot be resumed"
+        if tar_format and (sharded or resume or dedup or adaptive or codec is not None):
+            return (f"Error: {tar_format.name} archives cannot be sharded, resumed or deduplicated and "
+                    f"take no codec or adaptive mode; set the level in format, e.g. '{tar_format.name}:19'")
+        codec = get_codec(codec)
+        
         # Create target directory if it doesn't exist
         os.makedirs(target_dir, exist_ok=True)
         
         # Generate backup filename with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_name = f"backup_{os.path.basename(source_dir)}_{timestamp}.zip"
+        backup_prefix = f"backup_{os.path.basename(source_dir)}_"
+        extension = tar_format.extension if tar_format else '.zip'
+        backup_name = backup_file_name(source_dir, extension)
         backup_path = os.path.join(target_dir, backup_name)
+        # Never overwrite an earlier backup taken within the same second
+        base_name = backup_name[:-len(extension)]
+        counter = 1
+        while os.path.exists(backup_path) or os.path.exists(shard_index_path(backup_path)):
+            backup_path = os.path.join(target_dir, f"{base_name}_{counter}{extension}")
+            counter += 1
+        
+        # Pick up an archive an interrupted run left behind
+        unfinished = find_unfinished_archive(target_dir, backup_prefix) if resume else None
+        if unfinished:
+            backup_path = unfinished
+            progress.message(f"Resuming interrupted backup: {backup_path}")
+        
+        # Decide which files go into the archive
+        members = None
+        if incremental:
+            with progress.phase('scan'):
+                files = scan_files(source_dir, workers or os.cpu_count() or 1)
+            parent_file, parent_manifest = find_latest_manifest(target_dir, backup_prefix)
+            if parent_manifest and parent_manifest['source'] != os.path.abspath(source_dir):
+                parent_file, parent_manifest = None, None
+            if parent_manifest:
+                changed, deleted = diff_files(source_dir, parent_manifest['files'], files, use_hash)
+                progress.message(f"Incremental backup on top of {os.path.basename(parent_file)}: "
+                                 f"{len(changed)} changed, {len(deleted)} deleted")
+            else:
+                changed, deleted = diff_files(source_dir, {}, files, use_hash)
+                progress.message("No previous manifest found, creating full backup")
+            members = [(os.path.join(source_dir, *arcname.split('/')), arcname, files[arcname]['size'])
+                       for arcname in changed]
         
-        # Create ZIP archive
-        print(f"Creating backup: {backup_path}")
-        with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Walk through directory
-            for root, dirs, files in os.walk(source_dir):
-                for file in files:
-                    # Get full file path
-                    file_path = os.path.join(root, file)
-                    # Get archive path (relative to source directory)
-                    arcname = os.path.relpath(file_path, source_dir)
-                    # Add file to ZIP
-                    print(f"Adding file: {arcname}")
-                    zipf.write(file_path, arcname)
+        if sharded:
+            # Shards carry their own checksums, the index maps paths to them
+            backup_path = shard_index_path(backup_path)
+            progress.message(f"Creating sharded backup: {backup_path}")
+            stats = write_sharded_backup(source_dir, backup_path, shard_size, shard_files, workers=workers,
+                                         members=members, codec=codec, adaptive=adaptive, dedup=dedup,
+                                         read_workers=read_workers, memory_limit=memory_limit,
+                                         progress=progress)
+            size = stats['index']['size']
+        elif tar_format:
+            progress.message(f"Creating backup: {backup_path}")
+            with open(backup_path, 'wb') as f:
+                stats = write_tar_archive(source_dir, f, tar_format, workers=workers, members=members,
+                                          progress=progress)
+            size = os.path.getsize(backup_path)
+            save_checksums(backup_path, checksums_document(stats, size))
+        else:
+            # Create ZIP archive
+            progress.message(f"Creating backup: {backup_path}")
+            # Readable, so large stored members can be copied in by the kernel and read back
+            with open(backup_path, 'r+b' if unfinished else 'w+b') as f:
+                stats = write_backup_archive(source_dir, f, workers=workers, members=members,
+                                             spool_dir=target_dir, codec=codec, adaptive=adaptive,
+                                             dedup=dedup,
+                                             checkpoint=journal_path(backup_path) if resume else None,
+                                             read_workers=read_workers, memory_limit=memory_limit,
+                                             progress=progress)
+            size = os.path.getsize(backup_path)
+            # Checksums computed while writing, so restores can verify every member
+            save_checksums(backup_path, checksums_document(stats, size))
+        
+        if incremental:
+            parent_name = os.path.basename(parent_file) if parent_manifest else None
+            save_manifest(backup_path, source_dir, files, parent=parent_name, deleted=deleted)
         
         # Verify backup size
-        backup_size = os.path.getsize(backup_path) / (1024 * 1024)  # Size in MB
-        print(f"\nBackup completed successfully!")
-        print(f"Location: {backup_path}")
-        print(f"Size: {backup_size:.2f} MB")
+        backup_size = size / (1024 * 1024)  # Size in MB
+        
+        # Record the backup so it can be found without listing directories or buckets
+        update_catalog(catalog, lambda c: c.record(
+            backup_path, os.path.abspath(source_dir), size=size,
+            codec=tar_format.spec if tar_format else codec.spec,
+            checksum=format_checksum(stats['algorithm'], stats['checksum']),
+            members=stats['paths']), progress)
+        progress.message("Backup completed successfully!")
+        progress.message(f"Location: {backup_path}")
+        progress.message(f"Size: {backup_size:.2f} MB")
+        if adaptive:
+            progress.message(f"Stored without compression: {stats['stored_files']} files, "
+                             f"{stats['stored_bytes'] / (1024 * 1024):.2f} MB of "
+                             f"{stats['bytes'] / (1024 * 1024):.2f} MB")
+        if dedup:
+            progress.message(f"Stored as references: {stats['linked_files']} files, "
+                             f"{stats['linked_bytes'] / (1024 * 1024):.2f} MB")
         
         return backup_path
         
     except Exception as e:
         return f"Error creating backup: {str(e)}"
 
-def restore_backup(backup_file, restore_dir):
+def member_target(restore_dir, filename):
     """
-    Restore a backup from ZIP file
+    Return the path extractall would write a member to
+    
+    Absolute paths, drive letters and '..' components are dropped, so a
+    member can never land outside restore_dir.
+    """
+    arcname = filename.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    arcname = os.path.sep.join(part for part in arcname.split(os.path.sep)
+                               if part not in ('', os.path.curdir, os.path.pardir))
+    return os.path.normpath(os.path.join(restore_dir, arcname))
+
+def extract_member(zipf, zinfo, restore_dir, checksums=None):
+    """
+    Extract one member the way ZipFile.extract does, decoding wrapped codecs
+    
+    Args:
+        zipf (zipfile.ZipFile): Open archive
+        zinfo (zipfile.ZipInfo): Member to extract
+        restore_dir (str): Directory to extract into
+        checksums (dict): Checksums document of the archive; the member's
+            content is verified against it while it is written
+    
+    Returns:
+        str: Path of the extracted file or directory
+    
+    Raises:
+        integrity.ChecksumError: If the content does not match its checksum
+    """
+    if member_codec(zinfo) is None and (zinfo.is_dir() or checksums is None):
+        return zipf.extract(zinfo, restore_dir)
+    target = member_target(restore_dir, zinfo.filename)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with zipf.open(zinfo) as src, open(target, 'wb') as dst:
+        out = member_writer(dst, checksums, zinfo.filename)
+        copy_member_data(src, out, zinfo)
+        out.check()
+    return target
+
+def extract_parallel(members, extract_member, restore_dir, workers=8, progress=None):
+    """
+    Extract archive members on a pool of worker threads
+    
+    All directories are created up front so workers never race on them,
+    then members are handed out largest first. A failing member does not
+    stop the others.
+    
+    Args:
+        members (list): ZipInfo objects to extract
+        extract_member (callable): Called with a ZipInfo inside a worker;
+            must write that member below restore_dir
+        restore_dir (str): Directory members are extracted into
+        workers (int): Number of extraction threads
+        progress (Progress): Receives the extract phase and one file event per
+            member, carrying the error for members that failed
+    
+    Returns:
+        list: (ZipInfo, exception) pairs for members that failed
+    """
+    for zinfo in members:
+        target = member_target(restore_dir, zinfo.filename)
+        os.makedirs(target if zinfo.is_dir() else os.path.dirname(target), exist_ok=True)
+    
+    files = sorted((zinfo for zinfo in members if not zinfo.is_dir()),
+                   key=lambda zinfo: -zinfo.file_size)
+    progress = progress or Progress()
+    errors = []
+    with progress.phase('extract'), ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(extract_member, zinfo): zinfo for zinfo in files}
+        for future in as_completed(futures):
+            zinfo = futures[future]
+            error = future.exception()
+            if error is not None:
+                errors.append((zinfo, error))
+            progress.file_done(zinfo.filename, zinfo.compress_size, zinfo.file_size, error)
+    return errors
+
+def extract_archive_parallel(backup_file, restore_dir, workers=8, members=None, checksums=None,
+                             progress=None):
+    """
+    Extract a local ZIP archive with extract_parallel
+    
+    Every worker thread opens its own handle on the archive, so reads and
+    decompression of different members never contend for one file object.
     
     Args:
         backup_file (str): Path to backup ZIP file
+        restore_dir (str): Directory where the archive should be extracted
+        workers (int): Number of extraction threads
+        members (list): ZipInfo objects to extract. None extracts everything
+        checksums (dict): Checksums document to verify members against
+        progress (Progress): Per-member progress, see extract_parallel
+    
+    Returns:
+        list: (ZipInfo, exception) pairs for members that failed
+    """
+    if members is None:
+        with zipfile.ZipFile(backup_file, 'r') as zipf:
+            members = zipf.infolist()
+    
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+    
+    def extract_in_worker(zinfo):
+        zipf = getattr(local, 'zipf', None)
+        if zipf is None:
+            zipf = local.zipf = zipfile.ZipFile(backup_file, 'r')
+            with handles_lock:
+                handles.append(zipf)
+        extract_member(zipf, zinfo, restore_dir, checksums)
+    
+    try:
+        return extract_parallel(members, extract_in_worker, restore_dir, workers, progress)
+    finally:
+        for zipf in handles:
+            zipf.close()
+
+def path_matches(name, paths):
+    """
+    Check whether an archive path is selected by a list of paths or globs
+    
+    A pattern selects a path when it is equal to it, is one of its parent
+    directories, or matches it as an fnmatch glob (where '*' also crosses
+    '/'). Leading slashes are ignored.
+    """
+    name = name.rstrip('/')
+    for pattern in paths:
+        pattern = pattern.replace(os.sep, '/').strip('/')
+        if name == pattern or name.startswith(pattern + '/') or fnmatch.fnmatchcase(name, pattern):
+            return True
+    return False
+
+def select_members(members, paths):
+    """Return the ZipInfo objects whose names match paths (all of them if paths is None)"""
+    if paths is None:
+        return list(members)
+    return [zinfo for zinfo in members if path_matches(zinfo.filename, paths)]
+
+def select_restore_set(zipf, paths):
+    """
+    Work out what to extract from an archive, including deduplicated paths
+    
+    A selected path stored as a reference needs its target too. Targets
+    that were not selected themselves are extracted anyway and reported as
+    extra, so restore_links can remove them again.
+    
+    Args:
+        zipf (zipfile.ZipFile): Open archive
+        paths (list): Paths or globs to restore, None for everything
+    
+    Returns:
+        tuple: (ZipInfo members to extract, links to recreate, set of extra names)
+    """
+    metadata_name = links_member(zipf)
+    infos = {zinfo.filename: zinfo for zinfo in zipf.infolist() if zinfo.filename != metadata_name}
+    members = select_members(infos.values(), paths)
+    links = read_links(zipf)
+    if paths is None or not links:
+        return members, links, set()
+    
+    selected = {name: link for name, link in links.items() if path_matches(name, paths)}
+    names = {zinfo.filename for zinfo in members} | set(selected)
+    extra = set()
+    pending = [link['target'] for link in selected.values()]
+    while pending:
+        target = pending.pop()
+        if target in names:
+            continue
+        names.add(target)
+        extra.add(target)
+        if target in links:
+            # A hard link to a file that is itself a copy of another
+            selected[target] = links[target]
+            pending.append(links[target]['target'])
+        elif target in infos:
+            members.append(infos[target])
+    return members, selected, extra
+
+def restore_links(links, restore_dir, extra=(), link_duplicates=False):
+    """
+    Recreate the paths a deduplicated backup stored as references
+    
+    Hard links are recreated as hard links, identical files as copies
+    (or hard links with link_duplicates). Where the filesystem does not
+    support hard links, files are copied.
+    
+    Args:
+        links (dict): arcname -> {'target', 'type'} from select_restore_set
+        restore_dir (str): Directory the archive was extracted into
+        extra (set): Extracted targets that were not selected, removed afterwards
+        link_duplicates (bool): Hard link identical files instead of copying them
+    """
+    # Copies point at stored files, hard links may point at copies
+    for name, link in sorted(links.items(), key=lambda item: (item[1]['type'] != 'copy', item[0])):
+        source = member_target(restore_dir, link['target'])
+        target = member_target(restore_dir, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.lexists(target):
+            os.remove(target)
+        if link['type'] == 'hardlink' or link_duplicates:
+            try:
+                os.link(source, target)
+                continue
+            except OSError:
+                pass
+        shutil.copy2(source, target)
+    for name in extra:
+        target = member_target(restore_dir, name)
+        os.remove(target)
+        # Drop directories that only existed for the removed file
+        parent = os.path.dirname(target)
+        while parent != os.path.normpath(restore_dir) and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+
+def extract_archive(archive_file, restore_dir, workers=1, paths=None, progress=None):
+    """
+    Extract the members of one local archive, or one shard, that paths select
+    
+    Files are verified against the checksums saved next to the archive.
+    Paths the archive stored as references are left to restore_links.
+    
+    Args:
+        archive_file (str): Path to the ZIP archive
+        restore_dir (str): Directory to extract into
+        workers (int): Number of extraction threads
+        paths (list): Paths, directories or globs to extract, None for everything
+        progress (Progress): Receives the extract phase and per-member progress
+    
+    Returns:
+        tuple: (number of members and links selected, links, extra), the
+            last two as returned by select_restore_set
+    
+    Raises:
+        RuntimeError: If members failed to extract
+    """
+    progress = progress or Progress()
+    checksums = load_checksums(archive_file)
+    with zipfile.ZipFile(archive_file, 'r') as zipf:
+        members, links, extra = select_restore_set(zipf, paths)
+        if workers > 1:
+            errors = extract_archive_parallel(archive_file, restore_dir, workers, members, checksums,
+                                              progress)
+            if errors:
+                names = ', '.join(zinfo.filename for zinfo, _ in errors[:5])
+                raise RuntimeError(f"{len(errors)} members failed ({names})")
+        else:
+            with progress.phase('extract'):
+                for zinfo in members:
+                    extract_member(zipf, zinfo, restore_dir, checksums)
+                    progress.file_done(zinfo.filename, zinfo.compress_size, zinfo.file_size)
+    progress.count('verified_files', count_verified(checksums, members))
+    return len(members) + len(links), links, extra
+
+def restore_shards(index_path, restore_dir, workers=1, paths=None, progress=None):
+    """
+    Extract the shards of a sharded backup, several at a time
+    
+    Only shards whose path range paths can select are opened. Up to
+    workers shards are extracted at the same time, sharing the workers
+    extraction threads, each through extract_archive.
+    
+    Args:
+        index_path (str): Path to the shard index, with the shards next to it
+        restore_dir (str): Directory to extract into
+        workers (int): Number of extraction threads
+        paths (list): Paths, directories or globs to extract, None for everything
+        progress (Progress): Receives the extract phase and per-member progress
+    
+    Returns:
+        list: extract_archive's result for every shard read
+    """
+    progress = progress or Progress()
+    selected = select_shards(load_shard_index(index_path), paths)
+    parallel = max(1, min(len(selected), workers))
+    
+    def extract_shard(shard):
+        shard_file = os.path.join(os.path.dirname(index_path), shard['name'])
+        return extract_archive(shard_file, restore_dir, max(1, workers // parallel), paths,
+                               progress.part(shard['name']))
+    
+    with progress.phase('extract'), ThreadPoolExecutor(max_workers=parallel) as executor:
+        return list(executor.map(extract_shard, selected))
+
+def extract_tar_stream(fileobj, restore_dir, paths=None, format=None, progress=None):
+    """
+    Extract a tar backup from a stream, reading it once from start to end
+    
+    Nothing is sought and nothing is spooled, so fileobj can be stdin or
+    an S3 StreamingBody. Every file is hashed while it is written and the
+    digests are compared with the index at the end of the archive; tar
+    files written by other tools are extracted without verification.
+    
+    Args:
+        fileobj (file): Readable binary stream of the compressed archive
+        restore_dir (str): Directory to extract into
+        paths (list): Paths, directories or globs to extract, None for everything
+        format (str or TarFormat): Format of the archive, None detects it
+        progress (Progress): Receives the extract phase and per-member progress
+    
+    Returns:
+        tuple: (number of files extracted, {}, set()), like extract_archive,
+            as tar backups hold no references
+    
+    Raises:
+        integrity.ChecksumError: If restored files do not match the index
+        EOFError: If a backup's stream ends before its index
+    """
+    progress = progress or Progress()
+    digests = {}
+    index = None
+    metadata = {}
+    with progress.phase('extract'), tarfile.open(fileobj=open_tar_stream(fileobj, format), mode='r|',
+                                                 copybufsize=COMPRESS_CHUNK_SIZE) as tar:
+        for tarinfo in tar:
+            if not metadata:
+                metadata = header_metadata(tar.pax_headers)
+            if is_index_member(tarinfo):
+                index = json.load(tar.extractfile(tarinfo))
+                continue
+            if not tarinfo.isreg() or (paths is not None and not path_matches(tarinfo.name, paths)):
+                continue
+            target = member_target(restore_dir, tarinfo.name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            algorithm = metadata.get('algorithm')
+            digest = new_digest(algorithm) if algorithm and algorithm_available(algorithm) else None
+            src = tar.extractfile(tarinfo)
+            with open(target, 'wb') as dst:
+                while True:
+                    chunk = src.read(COMPRESS_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if digest is not None:
+                        digest.update(chunk)
+                    dst.write(chunk)
+            os.chmod(target, tarinfo.mode)
+            os.utime(target, (tarinfo.mtime, tarinfo.mtime))
+            digests[tarinfo.name] = digest.hexdigest() if digest is not None else None
+            progress.file_done(tarinfo.name, tarinfo.size, tarinfo.size)
+    if metadata and index is None:
+        raise EOFError("Archive ended before its index, it is truncated")
+    if index is not None:
+        expected = {name: digest for name, _, _, digest in index['members']}
+        verified = [name for name, digest in digests.items() if digest is not None]
+        failed = [name for name in verified if expected.get(name) != digests[name]]
+        if failed:
+            raise ChecksumError(f"Checksum mismatch for {len(failed)} files ({', '.join(failed[:5])})")
+        progress.count('verified_files', len(verified))
+    return len(digests), {}, set()
+
+def extract_tar_archive(archive_file, restore_dir, paths=None, progress=None):
+    """Extract a local tar backup with extract_tar_stream"""
+    with open(archive_file, 'rb') as f:
+        return extract_tar_stream(f, restore_dir, paths, progress=progress)
+
+@tracked('restore_backup')
+def restore_backup(backup_file, restore_dir, workers=1, paths=None, link_duplicates=False, progress=None):
+    """
+    Restore a backup from ZIP file
+    
+    If the backup is incremental, the full backup and every incremental in
+    its chain are applied in order, including recorded deletions. Members
+    written with zstd or lz4 are decoded automatically. Archives with saved
+    checksums have every restored file verified while it is written.
+    
+    Args:
+        backup_file (str): Path to backup ZIP file, a tar.zst or tar.gz
+            backup, which is read in one sequential pass, or the shard index
+            of a sharded backup, whose shards are extracted concurrently
         restore_dir (str): Directory where backup should be restored
+        workers (int): Number of threads extracting members in parallel.
+            1 extracts one member at a time, None uses every CPU core
+        paths (list): Only restore these paths, directories or glob patterns
+            (e.g. ['etc/app.conf', 'logs/*.log']). Only the central directory
+            and the matching members are read. None restores everything
+        link_duplicates (bool): Restore files a deduplicated backup stored
+            once as hard links to each other instead of separate copies
+        progress (Progress): Receives progress events and the run report.
+            None runs quietly
     
     Returns:
         str: Success message or error message
@@ -71,17 +1399,147 @@ def restore_backup(backup_file, restore_dir):
         # Create restore directory if it doesn't exist
         os.makedirs(restore_dir, exist_ok=True)
         
+        if workers is None:
+            workers = os.cpu_count() or 1
+        
+        # Incremental backups are replayed on top of their full backup
+        manifest = load_manifest(backup_file)
+        if manifest and manifest['type'] == 'incremental':
+            chain = backup_chain(backup_file)
+        else:
+            chain = [(backup_file, manifest)]
+        
         # Extract ZIP archive
-        print(f"Restoring backup to: {restore_dir}")
-        with zipfile.ZipFile(backup_file, 'r') as zipf:
-            zipf.extractall(restore_dir)
+        progress.message(f"Restoring backup to: {restore_dir}")
+        matched = 0
+        for archive_file, archive_manifest in chain:
+            if len(chain) > 1:
+                progress.message(f"Applying {os.path.basename(archive_file)}")
+            if archive_manifest:
+                for arcname in archive_manifest['deleted']:
+                    if paths is not None and not path_matches(arcname, paths):
+                        continue
+                    deleted_path = os.path.join(restore_dir, *arcname.split('/'))
+                    if os.path.isfile(deleted_path):
+                        os.remove(deleted_path)
+            if is_shard_index(archive_file):
+                restored = restore_shards(archive_file, restore_dir, workers, paths, progress)
+            elif is_tar_archive(archive_file):
+                restored = [extract_tar_archive(archive_file, restore_dir, paths, progress)]
+            else:
+                restored = [extract_archive(archive_file, restore_dir, workers, paths, progress)]
+            # Extra targets are removed only once every shard is extracted
+            for count, links, extra in restored:
+                matched += count
+                restore_links(links, restore_dir, extra, link_duplicates)
+                progress.count('linked_files', len(links))
         
-        print("\nRestore completed successfully!")
+        if paths is not None and not matched:
+            return f"Error: No files in '{backup_file}' match {paths}"
+        
+        progress.message("Restore completed successfully!")
         return f"Backup restored to: {restore_dir}"
         
     except Exception as e:
         return f"Error restoring backup: {str(e)}"
 
+@tracked('create_repo_backup')
+def create_repo_backup(source_dir, repo_dir, progress=None):
+    """
+    Back up source directory into a deduplicating chunk repository
+    
+    Files are split into content-defined chunks and only chunks the
+    repository does not already hold are stored.
+    
+    Args:
+        source_dir (str): Path to source directory
+        repo_dir (str): Path to the repository (created if it doesn't exist)
+        progress (Progress): Receives progress events and the run report
+    
+    Returns:
+        str: Snapshot id or error message
+    """
+    try:
+        # Validate source directory
+        if not os.path.exists(source_dir):
+            return f"Error: Source directory '{source_dir}' does not exist"
+        
+        progress.message(f"Creating snapshot of {source_dir} in repository: {repo_dir}")
+        new_bytes = 0
+        total_bytes = 0
+        files = {}
+        with ChunkRepository(repo_dir) as repo:
+            for file_path, arcname, _, st in _scan_source(source_dir):
+                arcname = arcname.replace(os.sep, '/')
+                chunks = []
+                file_new_bytes = 0
+                with open_throttled(file_path) as f:
+                    for data in repo.split(f):
+                        chunk_id, is_new = repo.add_chunk(data)
+                        chunks.append(chunk_id)
+                        if is_new:
+                            file_new_bytes += len(data)
+                total_bytes += st.st_size
+                new_bytes += file_new_bytes
+                # Bytes out are the bytes of chunks the repository did not have yet
+                progress.file_done(arcname, st.st_size, file_new_bytes)
+                files[arcname] = {
+                    'size': st.st_size,
+                    'mode': st.st_mode & 0o7777,
+                    'mtime': st.st_mtime,
+                    'chunks': chunks,
+                }
+            snapshot_id = repo.save_snapshot(source_dir, files)
+        
+        progress.count('new_bytes', new_bytes)
+        progress.message("Snapshot completed successfully!")
+        progress.message(f"Snapshot: {snapshot_id}")
+        progress.message(f"New data: {new_bytes / (1024 * 1024):.2f} MB of {total_bytes / (1024 * 1024):.2f} MB")
+        
+        return snapshot_id
+        
+    except Exception as e:
+        return f"Error creating repository backup: {str(e)}"
+
+@tracked('restore_repo_backup')
+def restore_repo_backup(repo_dir, restore_dir, snapshot_id=None, progress=None):
+    """
+    Restore a snapshot from a deduplicating chunk repository
+    
+    Args:
+        repo_dir (str): Path to the repository
+        restore_dir (str): Directory where the snapshot should be restored
+        snapshot_id (str): Snapshot to restore. None restores the latest one
+        progress (Progress): Receives progress events and the run report
+    
+    Returns:
+        str: Success message or error message
+    """
+    try:
+        # Validate repository
+        if not os.path.isdir(os.path.join(repo_dir, 'snapshots')):
+            return f"Error: Repository '{repo_dir}' does not exist"
+        
+        with ChunkRepository(repo_dir) as repo:
+            snapshot_id, snapshot = repo.load_snapshot(snapshot_id)
+            progress.message(f"Restoring snapshot {snapshot_id} to: {restore_dir}")
+            os.makedirs(restore_dir, exist_ok=True)
+            for arcname, entry in snapshot['files'].items():
+                target = os.path.join(restore_dir, *arcname.split('/'))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as f:
+                    for chunk_id in entry['chunks']:
+                        f.write(repo.read_chunk(chunk_id))
+                os.chmod(target, entry['mode'])
+                os.utime(target, (entry['mtime'], entry['mtime']))
+                progress.file_done(arcname, entry['size'], entry['size'])
+        
+        progress.message("Restore completed successfully!")
+        return f"Snapshot {snapshot_id} restored to: {restore_dir}"
+        
+    except Exception as e:
+        return f"Error restoring repository backup: {str(e)}"
+
 # Example usage
 if __name__ == "__main__":
     # Example paths (modify these as needed)
@@ -96,17 +1554,20 @@ if __name__ == "__main__":
         with open(os.path.join(source_directory, "test2.txt"), "w") as f:
             f.write("Test file 2")
     
-    # Create backup
-    backup_file = create_backup(source_directory, backup_directory)
+    # Create backup, showing progress and writing a JSON run report
+    progress = Progress(ConsoleRenderer(), report_path="./backup_report.json")
+    backup_file = create_backup(source_directory, backup_directory, progress=progress)
     print(f"\nBackup result: {backup_file}")
     
     # Restore backup (to a different directory)
     restore_directory = "./restored_backup"
     if isinstance(backup_file, str) and os.path.exists(backup_file):
-        result = restore_backup(backup_file, restore_directory)
+        result = restore_backup(backup_file, restore_directory, progress=Progress(ConsoleRenderer()))
         print(f"\nRestore result: {result}")
     
     # Cleanup (comment out if you want to keep the test files)
     shutil.rmtree(source_directory, ignore_errors=True)
     shutil.rmtree(backup_directory, ignore_errors=True)
     shutil.rmtree(restore_directory, ignore_errors=True)
+    if os.path.exists("./backup_report.json"):
+        os.remove("./backup_report.json")
@@ -0,0 +1,240 @@
+import os
+import bz2
+import json
+import zlib
+import zipfile
+
+# Optional codecs, only available when their libraries are installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+DEFAULT_CODEC = 'deflate'
+
+# Codec name -> (ZIP compression method, default level)
+NATIVE_CODECS = {
+    'store': (zipfile.ZIP_STORED, None),
+    'deflate': (zipfile.ZIP_DEFLATED, None),
+    'bzip2': (zipfile.ZIP_BZIP2, 9),
+    'lzma': (zipfile.ZIP_LZMA, None),
+}
+# Codecs zipfile cannot read; their members are stored as compressed frames
+WRAPPED_CODECS = {
+    'zstd': 3,
+    'lz4': 0,
+}
+
+# Formats that are already compressed; adaptive mode stores them as they are
+INCOMPRESSIBLE_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif', '.heic',
+    '.mp4', '.mkv', '.mov', '.avi', '.webm', '.mp3', '.aac', '.ogg', '.flac', '.m4a',
+    '.gz', '.tgz', '.bz2', '.xz', '.zst', '.lz4', '.zip', '.7z', '.rar', '.jar', '.whl',
+    '.parquet', '.orc', '.avro', '.pdf', '.docx', '.xlsx', '.pptx',
+}
+# Size of the block test-compressed for files without an extension hint
+SAMPLE_SIZE = 64 * 1024
+# A sample must shrink by at least this fraction to be worth compressing
+MIN_SAVING = 0.05
+
+class _LZ4Compressor:
+    """Give lz4.frame's compressor the compress()/flush() interface of zlib"""
+    def __init__(self, level):
+        self._compressor = lz4_frame.LZ4FrameCompressor(compression_level=level)
+        self._header = self._compressor.begin()
+
+    def compress(self, data):
+        header, self._header = self._header, b''
+        return header + self._compressor.compress(data)
+
+    def flush(self):
+        header, self._header = self._header, b''
+        return header + self._compressor.flush()
+
+class _FlushlessDecompressor:
+    """Add a no-op flush() to decompressors that do not have one"""
+    def __init__(self, decompressor):
+        self._decompressor = decompressor
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+
+    def flush(self):
+        return b''
+
+class Codec:
+    """
+    Compression codec for backup members
+
+    Native codecs (store, deflate, bzip2, lzma) use the matching ZIP
+    compression method, so any ZIP tool can read them. Wrapped codecs
+    (zstd, lz4) store each member as a compressed frame with the ZIP_STORED
+    method and mark it by putting the codec name in the member comment;
+    restore_backup decodes those members automatically.
+    """
+    def __init__(self, name, level=None):
+        if name in NATIVE_CODECS:
+            self.compress_type, default_level = NATIVE_CODECS[name]
+            self.wrapped = False
+        elif name in WRAPPED_CODECS:
+            self.compress_type, default_level = zipfile.ZIP_STORED, WRAPPED_CODECS[name]
+            self.wrapped = True
+        else:
+            known = ', '.join(list(NATIVE_CODECS) + list(WRAPPED_CODECS))
+            raise ValueError(f"Unknown codec '{name}' (known codecs: {known})")
+        if name == 'zstd' and zstandard is None:
+            raise ValueError("The zstd codec requires the 'zstandard' package")
+        if name == 'lz4' and lz4_frame is None:
+            raise ValueError("The lz4 codec requires the 'lz4' package")
+        self.name = name
+        self.level = default_level if level is None else level
+
+    @property
+    def spec(self):
+        """Codec name with level, e.g. 'deflate:9'"""
+        return self.name if self.level is None else f"{self.name}:{self.level}"
+
+    def __repr__(self):
+        return f"Codec({self.spec!r})"
+
+    def compressor(self):
+        """
+        Create a compressor producing this codec's member data
+
+        Returns:
+            object: Has compress(data) and flush(), or None for 'store'
+        """
+        if self.name == 'store':
+            return None
+        if self.name == 'deflate':
+            level = zlib.Z_DEFAULT_COMPRESSION if self.level is None else self.level
+            return zlib.compressobj(level, zlib.DEFLATED, -15)
+        if self.name == 'bzip2':
+            return bz2.BZ2Compressor(self.level)
+        if self.name == 'lzma':
+            return zipfile.LZMACompressor()
+        if self.name == 'zstd':
+            return zstandard.ZstdCompressor(level=self.level).compressobj()
+        return _LZ4Compressor(self.level)
+
+    def decompressor(self):
+        """Create a decompressor for a wrapped codec's frames"""
+        if self.name == 'zstd':
+            return _FlushlessDecompressor(zstandard.ZstdDecompressor().decompressobj())
+        if self.name == 'lz4':
+            return _FlushlessDecompressor(lz4_frame.LZ4FrameDecompressor())
+        raise ValueError(f"Codec '{self.name}' is handled by zipfile itself")
+
+def get_codec(codec=None):
+    """
+    Resolve a codec spec
+
+    Args:
+        codec (str or Codec): 'store', 'deflate', 'deflate:9', 'bzip2', 'lzma',
+            'zstd', 'zstd:19', 'lz4', ... None gives the default codec
+
+    Returns:
+        Codec: Resolved codec
+
+    Raises:
+        ValueError: If the codec is unknown or its library is not installed
+    """
+    if isinstance(codec, Codec):
+        return codec
+    name, _, level = (codec or DEFAULT_CODEC).partition(':')
+    return Codec(name, int(level) if level else None)
+
+def is_incompressible(file_path, size):
+    """
+    Guess whether compressing a file would be wasted CPU
+
+    Files with a known compressed extension are skipped straight away.
+    Otherwise a block from the middle of the file (headers are often not
+    representative) is compressed with fast zlib; if it shrinks by less
+    than MIN_SAVING the file is treated as incompressible. Files smaller
+    than one sample are always compressed, as testing costs as much as
+    compressing them.
+
+    Args:
+        file_path (str): Path to the file
+        size (int): File size in bytes
+
+    Returns:
+        bool: True if the file should be stored uncompressed
+    """
+    if os.path.splitext(file_path)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+        return True
+    if size < SAMPLE_SIZE:
+        return False
+    with open(file_path, 'rb') as f:
+        f.seek((size - SAMPLE_SIZE) // 2)
+        sample = f.read(SAMPLE_SIZE)
+    return len(zlib.compress(sample, 1)) > len(sample) * (1 - MIN_SAVING)
+
+def available_codecs():
+    """Return the names of all codecs usable in this environment"""
+    names = list(NATIVE_CODECS)
+    if zstandard is not None:
+        names.append('zstd')
+    if lz4_frame is not None:
+        names.append('lz4')
+    return names
+
+def archive_comment(codec, **metadata):
+    """Build the archive comment recording the codec and other backup metadata"""
+    return json.dumps(dict(metadata, codec=codec.spec)).encode()
+
+def archive_metadata(zipf):
+    """
+    Read the metadata recorded in an archive's comment
+
+    Returns:
+        dict: Metadata, empty for archives written without it
+    """
+    try:
+        metadata = json.loads(zipf.comment.decode())
+    except ValueError:
+        return {}
+    return metadata if isinstance(metadata, dict) else {}
+
+def archive_codec(zipf):
+    """
+    Read the codec recorded in an archive's comment
+
+    Returns:
+        str: Codec spec, or None for archives without codec metadata
+    """
+    return archive_metadata(zipf).get('codec')
+
+def member_codec(zinfo):
+    """Return the wrapped codec a member was stored with, or None"""
+    name = zinfo.comment.decode(errors='replace')
+    return Codec(name) if name in WRAPPED_CODECS else None
+
+def copy_member_data(src, dst, zinfo, chunk_size=1024 * 1024):
+    """
+    Copy a member's data from an open ZIP member stream to dst
+
+    Frames of wrapped codecs are decompressed on the way, other members
+    are copied as they are.
+
+    Args:
+        src (file): Stream returned by ZipFile.open or zipfile.ZipExtFile
+        dst (file): Writable binary file
+        zinfo (zipfile.ZipInfo): Member being copied
+        chunk_size (int): Read size in bytes
+    """
+    codec = member_codec(zinfo)
+    decompressor = codec.decompressor() if codec else None
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+        dst.write(decompressor.decompress(chunk) if decompressor else chunk)
+    if decompressor:
+        dst.write(decompressor.flush())
@@ -0,0 +1,670 @@
+import os
+import time
+import json
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import sys
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from backup import create_backup, restore_backup, write_backup_archive
+from backup_codecs import available_codecs
+from walker import walk
+import chunk_repo
+
+# Peak RSS is read from getrusage, which Windows does not have
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Local S3 stand-in for the S3 cases, skipped when moto is not installed
+try:
+    from moto.server import ThreadedMotoServer
+except ImportError:
+    ThreadedMotoServer = None
+
+BLOCK_SIZE = 1024 * 1024
+S3_BUCKET = 'benchmark'
+
+def make_sample_tree(root, file_count=64, file_size=4 * 1024 * 1024, seed=0):
+    """
+    Generate a reproducible tree of compressible files with mixed sizes
+
+    Args:
+        root (str): Directory to create the files in
+        file_count (int): Number of files to write
+        file_size (int): Size in bytes of the largest file
+        seed (int): Random seed so every run produces the same data
+    """
+    rng = random.Random(seed)
+    words = [bytes(rng.choices(b'abcdefghijklmnopqrstuvwxyz', k=rng.randint(3, 9))) for _ in range(512)]
+    os.makedirs(root, exist_ok=True)
+    for i in range(file_count):
+        size = max(1, file_size >> (i % 6))
+        chunks = []
+        written = 0
+        while written < size:
+            line = b' '.join(rng.choices(words, k=12)) + b'\n'
+            chunks.append(line)
+            written += len(line)
+        subdir = os.path.join(root, f"dir{i % 8}")
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, f"file{i}.txt"), 'wb') as f:
+            f.write(b''.join(chunks)[:size])
+
+def bench_parallel_compression(source_dir, worker_counts=None):
+    """
+    Time create_backup for several worker counts and report the speedup
+
+    Args:
+        source_dir (str): Directory to back up
+        worker_counts (list): Worker counts to try. Defaults to powers of two up to the CPU count
+
+    Returns:
+        list: (workers, seconds, speedup) tuples
+    """
+    cpus = os.cpu_count() or 1
+    if worker_counts is None:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= cpus:
+            worker_counts.append(worker_counts[-1] * 2)
+        if worker_counts[-1] != cpus:
+            worker_counts.append(cpus)
+
+    results = []
+    baseline = None
+    for workers in worker_counts:
+        target_dir = tempfile.mkdtemp(prefix='bench_backup_')
+        restore_dir = tempfile.mkdtemp(prefix='bench_restore_')
+        try:
+            start = time.perf_counter()
+            backup_file = create_backup(source_dir, target_dir, workers=workers, catalog=None)
+            elapsed = time.perf_counter() - start
+            restored = restore_backup(backup_file, restore_dir)
+            if restored.startswith('Error'):
+                raise RuntimeError(restored)
+        finally:
+            shutil.rmtree(target_dir, ignore_errors=True)
+            shutil.rmtree(restore_dir, ignore_errors=True)
+        if baseline is None:
+            baseline = elapsed
+        results.append((workers, elapsed, baseline / elapsed))
+    return results
+
+def bench_codecs(source_dir, codecs=None, workers=1):
+    """
+    Compare compression throughput and ratio of backup codecs
+
+    Args:
+        source_dir (str): Directory to back up
+        codecs (list): Codec specs to try. Defaults to every available codec
+        workers (int): Number of compression threads
+
+    Returns:
+        list: (codec, seconds, MB/s, ratio) tuples, ratio being input / output size
+    """
+    if codecs is None:
+        codecs = available_codecs()
+    total = sum(os.path.getsize(os.path.join(root, name))
+                for root, dirs, files in os.walk(source_dir) for name in files)
+    results = []
+    for codec in codecs:
+        with tempfile.TemporaryFile() as f:
+            start = time.perf_counter()
+            write_backup_archive(source_dir, f, workers=workers, codec=codec)
+            elapsed = time.perf_counter() - start
+            size = f.tell()
+        results.append((codec, elapsed, total / (1024 * 1024) / elapsed, total / size))
+    return results
+
+def bench_walk(source_dir, worker_counts=(1, 4, 16)):
+    """
+    Compare os.walk plus os.stat with walker.walk at several thread counts
+
+    Args:
+        source_dir (str): Directory to walk
+        worker_counts (tuple): Thread counts to try with walker.walk
+
+    Returns:
+        list: (method, files, seconds) tuples, os.walk first
+    """
+    start = time.perf_counter()
+    files = 0
+    for root, dirs, names in os.walk(source_dir):
+        for name in names:
+            os.stat(os.path.join(root, name))
+            files += 1
+    results = [('os.walk+stat', files, time.perf_counter() - start)]
+    for workers in worker_counts:
+        start = time.perf_counter()
+        files = sum(1 for entry in walk(source_dir, workers) if not entry.is_dir)
+        results.append((f"walker x{workers}", files, time.perf_counter() - start))
+    return results
+
+def bench_chunking(size=16 * 1024 * 1024, seed=0):
+    """
+    Compare the numpy and pure-Python chunk boundary search on random data
+
+    Args:
+        size (int): Bytes of random data to split into chunks
+        seed (int): Random seed for the data
+
+    Returns:
+        list: (method, chunks, seconds, MB/s) tuples; numpy is skipped when
+            it is not installed
+    """
+    data = random.Random(seed).randbytes(size)
+    methods = [('python', chunk_repo._find_boundary_python)]
+    if chunk_repo.numpy is not None:
+        methods.insert(0, ('numpy', chunk_repo._find_boundary_numpy))
+    results = []
+    for method, find_boundary in methods:
+        view = memoryview(data)
+        chunks = 0
+        start = time.perf_counter()
+        while view:
+            cut = find_boundary(view[:chunk_repo.MAX_CHUNK_SIZE], chunk_repo.MIN_CHUNK_SIZE,
+                                chunk_repo.AVG_CHUNK_SIZE, chunk_repo.MAX_CHUNK_SIZE)
+            view = view[cut:]
+            chunks += 1
+        elapsed = time.perf_counter() - start
+        results.append((method, chunks, elapsed, size / (1024 * 1024) / elapsed))
+    return results
+
+def _text_block(rng, words, size):
+    chunks = []
+    written = 0
+    while written < size:
+        line = b' '.join(rng.choices(words, k=12)) + b'\n'
+        chunks.append(line)
+        written += len(line)
+    return b''.join(chunks)[:size]
+
+class _DataSource:
+    """Reproducible compressible and random data, cut from a few pre-built blocks"""
+    def __init__(self, seed, blocks=8):
+        rng = random.Random(seed)
+        words = [bytes(rng.choices(b'abcdefghijklmnopqrstuvwxyz', k=rng.randint(3, 9))) for _ in range(512)]
+        self.rng = rng
+        self.text_blocks = [_text_block(rng, words, BLOCK_SIZE) for _ in range(blocks)]
+        self.random_blocks = [rng.randbytes(BLOCK_SIZE) for _ in range(blocks)]
+
+    def write(self, path, size, compressible=True):
+        """Write size bytes of text-like or random data to path"""
+        blocks = self.text_blocks if compressible else self.random_blocks
+        with open(path, 'wb') as f:
+            while size > 0:
+                block = self.rng.choice(blocks)
+                offset = self.rng.randrange(BLOCK_SIZE // 2)
+                piece = block[offset:offset + min(size, BLOCK_SIZE - offset)]
+                f.write(piece)
+                size -= len(piece)
+
+def make_tiny_files_tree(root, file_count=1000000, max_size=4096, seed=0):
+    """
+    Generate many tiny files spread over 1000-file directories
+
+    Args:
+        root (str): Directory to create the files in
+        file_count (int): Number of files to write
+        max_size (int): Largest file size in bytes; sizes are uniform from 0
+        seed (int): Random seed so every run produces the same data
+    """
+    data = _DataSource(seed)
+    for i in range(file_count):
+        subdir = os.path.join(root, f"d{i // 1000:04d}")
+        if i % 1000 == 0:
+            os.makedirs(subdir, exist_ok=True)
+        data.write(os.path.join(subdir, f"f{i}.txt"), data.rng.randint(0, max_size))
+
+def make_huge_files_tree(root, file_count=4, file_size=1024 * 1024 * 1024, seed=0):
+    """
+    Generate a few huge files, alternating compressible and random data
+
+    Args:
+        root (str): Directory to create the files in
+        file_count (int): Number of files to write
+        file_size (int): Size of each file in bytes
+        seed (int): Random seed so every run produces the same data
+    """
+    data = _DataSource(seed)
+    os.makedirs(root, exist_ok=True)
+    for i in range(file_count):
+        compressible = i % 2 == 0
+        name = f"huge{i}.log" if compressible else f"huge{i}.bin"
+        data.write(os.path.join(root, name), file_size, compressible)
+
+def make_deep_tree(root, file_count=100000, depth=64, file_size=1024, seed=0):
+    """
+    Generate files in deeply nested directory chains
+
+    Args:
+        root (str): Directory to create the files in
+        file_count (int): Number of files to write
+        depth (int): Nesting depth of every chain
+        file_size (int): Size of each file in bytes
+        seed (int): Random seed so every run produces the same data
+    """
+    data = _DataSource(seed)
+    chains = max(1, file_count // (depth * 4))
+    for i in range(file_count):
+        chain = i % chains
+        level = (i // chains) % depth
+        subdir = os.path.join(root, f"chain{chain}", *(f"l{n}" for n in range(level + 1)))
+        os.makedirs(subdir, exist_ok=True)
+        data.write(os.path.join(subdir, f"f{i}.txt"), file_size)
+
+def make_mixed_tree(root, file_count=20000, max_size=4 * 1024 * 1024, seed=0):
+    """
+    Generate a realistic mix: sizes spread log-uniformly up to max_size,
+    about a third of the files random data with media extensions
+
+    Args:
+        root (str): Directory to create the files in
+        file_count (int): Number of files to write
+        max_size (int): Largest file size in bytes
+        seed (int): Random seed so every run produces the same data
+    """
+    data = _DataSource(seed)
+    for i in range(file_count):
+        subdir = os.path.join(root, f"dir{i % 16}", f"sub{i % 7}")
+        os.makedirs(subdir, exist_ok=True)
+        size = int(2 ** data.rng.uniform(6, max(6, max_size.bit_length() - 1)))
+        if data.rng.random() < 1 / 3:
+            data.write(os.path.join(subdir, f"media{i}.jpg"), size, compressible=False)
+        else:
+            data.write(os.path.join(subdir, f"doc{i}.txt"), size)
+
+# Tree name -> (generator, keyword arguments at scale 1.0 that are scaled down)
+TREES = {
+    'tiny': (make_tiny_files_tree, {'file_count': 1000000}),
+    'huge': (make_huge_files_tree, {'file_size': 1024 * 1024 * 1024}),
+    'deep': (make_deep_tree, {'file_count': 100000}),
+    'mixed': (make_mixed_tree, {'file_count': 20000}),
+}
+OPERATIONS = ['backup', 'restore', 'backup_to_s3', 'restore_from_s3']
+
+def make_tree(name, root, scale=1.0, seed=0):
+    """
+    Generate one of the TREES at the given scale
+
+    Args:
+        name (str): Key of TREES
+        root (str): Directory to create the tree in
+        scale (float): Multiplier for the tree's file count or file size
+        seed (int): Random seed so every run produces the same data
+
+    Returns:
+        dict: Number of files and total bytes generated
+    """
+    generator, scaled = TREES[name]
+    generator(root, seed=seed, **{key: max(1, int(value * scale)) for key, value in scaled.items()})
+    files = 0
+    total = 0
+    for dirpath, dirs, names in os.walk(root):
+        for filename in names:
+            files += 1
+            total += os.path.getsize(os.path.join(dirpath, filename))
+    return {'files': files, 'bytes': total}
+
+def _start_s3_server():
+    """Start a local moto S3 server with an empty S3_BUCKET; returns (server, endpoint_url)"""
+    import boto3
+    # The server logs every request through werkzeug
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint_url = f"http://{host}:{port}"
+    boto3.client('s3', endpoint_url=endpoint_url, region_name='us-east-1',
+                 aws_access_key_id='benchmark',
+                 aws_secret_access_key='benchmark').create_bucket(Bucket=S3_BUCKET)
+    return server, endpoint_url
+
+def bench_s3_clients(calls=200):
+    """
+    Compare per-call latency of a new S3 client per call with the cached client
+
+    Every call does what upload_to_s3 and download_from_s3 do before
+    transferring: get a client, then send one small request to a local
+    moto server.
+
+    Args:
+        calls (int): Number of calls per variant
+
+    Returns:
+        list: (variant, mean ms, p50 ms, p95 ms) tuples, or an empty list
+            when moto is not installed
+    """
+    if ThreadedMotoServer is None:
+        return []
+    import boto3
+    from s3_backup import AWSConfig
+    server, endpoint_url = _start_s3_server()
+    try:
+        config = AWSConfig('benchmark', 'benchmark', 'us-east-1', endpoint_url)
+        config.get_client().put_object(Bucket=S3_BUCKET, Key='probe', Body=b'x')
+
+        def fresh_client():
+            return boto3.client('s3', aws_access_key_id='benchmark', aws_secret_access_key='benchmark',
+                                region_name='us-east-1', endpoint_url=endpoint_url)
+
+        results = []
+        for variant, get_client in (('new client', fresh_client), ('cached client', config.get_client)):
+            if variant == 'cached client':
+                config.warm_up(S3_BUCKET)
+            timings = []
+            for _ in range(calls):
+                start = time.perf_counter()
+                get_client().head_object(Bucket=S3_BUCKET, Key='probe')
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            results.append((variant, sum(timings) / calls, timings[calls // 2], timings[int(calls * 0.95)]))
+        return results
+    finally:
+        server.stop()
+
+def _peak_rss():
+    # VmHWM starts fresh in a new process image, while ru_maxrss on Linux
+    # keeps the high-water mark of the process that spawned us
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def _run_operation(operation, source_dir, work_dir, workers, endpoint_url):
+    """Run one benchmark operation; executed in a fresh process"""
+    if endpoint_url:
+        import s3_backup
+        s3_backup.aws_config = s3_backup.AWSConfig('benchmark', 'benchmark', 'us-east-1', endpoint_url)
+
+    archive_dir = os.path.join(work_dir, 'archive')
+    restore_dir = os.path.join(work_dir, 'restore')
+    s3_prefix = os.path.basename(work_dir)
+    start = time.perf_counter()
+    if operation == 'backup':
+        result = create_backup(source_dir, archive_dir, workers=workers, catalog=None)
+    elif operation == 'restore':
+        shutil.rmtree(restore_dir, ignore_errors=True)
+        archive = next(name for name in os.listdir(archive_dir) if name.endswith('.zip'))
+        result = restore_backup(os.path.join(archive_dir, archive), restore_dir, workers=workers)
+    elif operation == 'backup_to_s3':
+        result = s3_backup.backup_to_s3(source_dir, S3_BUCKET, s3_prefix, stream=True, workers=workers,
+                                        catalog=None)
+    else:
+        shutil.rmtree(restore_dir, ignore_errors=True)
+        listing = s3_backup.aws_config.get_client().list_objects_v2(Bucket=S3_BUCKET, Prefix=s3_prefix)
+        s3_key = next(item['Key'] for item in listing['Contents'] if item['Key'].endswith('.zip'))
+        result = s3_backup.restore_from_s3(S3_BUCKET, s3_key, restore_dir, stream=True, workers=workers)
+    seconds = time.perf_counter() - start
+    if isinstance(result, str) and 'Error' in result.split(':', 1)[0]:
+        raise RuntimeError(result)
+    return {'seconds': seconds, 'peak_rss': _peak_rss()}
+
+def _write_large_file(source_dir, archive_path, codec, zero_copy):
+    """Archive source_dir to a local file once; executed in a fresh process"""
+    from progress import Progress
+    progress = Progress()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    with open(archive_path, 'w+b') as f:
+        write_backup_archive(source_dir, f, codec=codec, zero_copy=zero_copy, progress=progress)
+    return {
+        'seconds': time.perf_counter() - start,
+        'cpu_seconds': time.process_time() - cpu_start,
+        'read_buffers': progress.counters.get('read_buffers', 0),
+        'kernel_copied_bytes': progress.counters.get('kernel_copied_bytes', 0),
+        'peak_rss': _peak_rss(),
+    }
+
+def bench_large_file(size=10 * 1024 * 1024 * 1024, codecs=('store', 'deflate'), work_root=None, seed=0):
+    """
+    Compare plain reads with reused buffers and kernel copies on one large file
+
+    Each codec archives the file twice, with write_backup_archive's
+    zero_copy off and on, each time in a fresh process so peak RSS is its
+    own. read_buffers counts the chunk buffers allocated for reading; with
+    zero_copy stored members are copied by the kernel and need none.
+
+    Args:
+        size (int): Size of the generated file in bytes; 10 GB and more
+            keep it from fitting in the page cache of most machines
+        codecs (tuple): Codec specs to try
+        work_root (str): Directory for the file and archives. Defaults to a temp dir
+        seed (int): Random seed for the file's content
+
+    Returns:
+        list: dicts with 'codec', 'zero_copy', 'seconds', 'mb_per_s',
+            'cpu_seconds', 'read_buffers', 'kernel_copied_bytes' and 'peak_rss'
+    """
+    owns_root = work_root is None
+    work_root = work_root or tempfile.mkdtemp(prefix='bench_large_')
+    source_dir = os.path.join(work_root, 'source')
+    archive_path = os.path.join(work_root, 'archive.zip')
+    results = []
+    try:
+        os.makedirs(source_dir, exist_ok=True)
+        _DataSource(seed).write(os.path.join(source_dir, 'large.log'), size)
+        context = multiprocessing.get_context('spawn')
+        for codec in codecs:
+            for zero_copy in (False, True):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    measured = executor.submit(_write_large_file, source_dir, archive_path, codec,
+                                               zero_copy).result()
+                os.remove(archive_path)
+                seconds = measured['seconds']
+                measured.update({'codec': codec, 'zero_copy': zero_copy,
+                                 'mb_per_s': size / (1024 * 1024) / seconds if seconds else None})
+                results.append(measured)
+    finally:
+        if owns_root:
+            shutil.rmtree(work_root, ignore_errors=True)
+    return results
+
+def run_suite(trees=None, operations=None, scale=0.01, workers=1, work_root=None, seed=0):
+    """
+    Benchmark backup and restore operations on generated trees
+
+    Every operation runs in a fresh process, so its peak RSS is not
+    inflated by earlier runs. S3 operations go to a local moto server and
+    are skipped when moto is not installed.
+
+    Args:
+        trees (list): Names from TREES. Defaults to all of them
+        operations (list): Names from OPERATIONS. Defaults to all of them
+        scale (float): Tree size multiplier; 1.0 means millions of tiny files
+            and gigabyte-sized huge files
+        workers (int): Worker threads passed to every operation
+        work_root (str): Directory for trees and archives. Defaults to a temp dir
+        seed (int): Random seed for the tree generators
+
+    Returns:
+        dict: 'meta' describing the machine and run, 'results' with one entry
+            per tree and operation
+    """
+    trees = trees or list(TREES)
+    operations = operations or list(OPERATIONS)
+    s3_operations = [op for op in operations if op.endswith('_s3')]
+    if s3_operations and ThreadedMotoServer is None:
+        print("moto is not installed, skipping S3 benchmarks")
+        operations = [op for op in operations if op not in s3_operations]
+        s3_operations = []
+
+    owns_root = work_root is None
+    work_root = work_root or tempfile.mkdtemp(prefix='bench_suite_')
+    server = None
+    endpoint_url = None
+    results = []
+    try:
+        if s3_operations:
+            server, endpoint_url = _start_s3_server()
+
+        context = multiprocessing.get_context('spawn')
+        for tree in trees:
+            work_dir = os.path.join(work_root, tree)
+            source_dir = os.path.join(work_dir, 'source')
+            size = make_tree(tree, source_dir, scale, seed)
+            for operation in operations:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    measured = executor.submit(
+                        _run_operation, operation, source_dir, work_dir, workers,
+                        endpoint_url if operation in s3_operations else None).result()
+                seconds = measured['seconds']
+                results.append({
+                    'tree': tree,
+                    'operation': operation,
+                    'files': size['files'],
+                    'bytes': size['bytes'],
+                    'seconds': seconds,
+                    'mb_per_s': size['bytes'] / (1024 * 1024) / seconds if seconds else None,
+                    'files_per_s': size['files'] / seconds if seconds else None,
+                    'peak_rss': measured['peak_rss'],
+                })
+            shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        if server is not None:
+            server.stop()
+        if owns_root:
+            shutil.rmtree(work_root, ignore_errors=True)
+
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'scale': scale,
+            'workers': workers,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+def compare_results(current, baseline, tolerance=0.2):
+    """
+    Flag regressions against a stored baseline
+
+    A case regresses when its wall time or peak RSS is more than tolerance
+    (a fraction) above the baseline. Cases missing from either run are ignored.
+
+    Args:
+        current (dict): Output of run_suite
+        baseline (dict): Earlier output of run_suite
+        tolerance (float): Allowed slowdown or memory growth, 0.2 = 20%
+
+    Returns:
+        list: (tree, operation, metric, baseline value, current value) tuples
+    """
+    previous = {(entry['tree'], entry['operation']): entry for entry in baseline['results']}
+    regressions = []
+    for entry in current['results']:
+        old = previous.get((entry['tree'], entry['operation']))
+        if old is None:
+            continue
+        for metric in ('seconds', 'peak_rss'):
+            if old.get(metric) and entry.get(metric) and entry[metric] > old[metric] * (1 + tolerance):
+                regressions.append((entry['tree'], entry['operation'], metric, old[metric], entry[metric]))
+    return regressions
+
+def _print_suite(results):
+    print(f"{'tree':>6} {'operation':>16} {'files':>9} {'MB':>9} {'seconds':>9} {'MB/s':>8} {'files/s':>9} {'RSS MB':>8}")
+    for entry in results['results']:
+        rss = f"{entry['peak_rss'] / (1024 * 1024):>8.1f}" if entry['peak_rss'] else f"{'-':>8}"
+        print(f"{entry['tree']:>6} {entry['operation']:>16} {entry['files']:>9} "
+              f"{entry['bytes'] / (1024 * 1024):>9.1f} {entry['seconds']:>9.2f} "
+              f"{entry['mb_per_s']:>8.1f} {entry['files_per_s']:>9.0f} {rss}")
+
+# Example usage
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backup and restore benchmarks")
+    parser.add_argument('source', nargs='?',
+                        help="Tree for the compression benchmarks (default: a generated sample)")
+    parser.add_argument('--suite', action='store_true',
+                        help="Run the backup/restore suite on generated trees instead")
+    parser.add_argument('--clients', action='store_true',
+                        help="Compare new and cached S3 client latency against a local server")
+    parser.add_argument('--trees', default=','.join(TREES), help="Comma separated TREES to generate")
+    parser.add_argument('--operations', default=','.join(OPERATIONS), help="Comma separated operations")
+    parser.add_argument('--scale', type=float, default=0.01, help="Tree size multiplier (1.0 = full size)")
+    parser.add_argument('--workers', type=int, default=1, help="Worker threads per operation")
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to write the JSON results")
+    parser.add_argument('--baseline', help="Earlier results to compare against")
+    parser.add_argument('--large-file', type=float, metavar='GB',
+                        help="Compare plain and zero-copy reads on one generated file of this size")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed regression, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    if args.suite:
+        results = run_suite(args.trees.split(','), args.operations.split(','), args.scale, args.workers)
+        _print_suite(results)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare_results(results, json.load(f), args.tolerance)
+            for tree, operation, metric, old, new in regressions:
+                print(f"REGRESSION {tree}/{operation} {metric}: {old:.2f} -> {new:.2f} ({new / old - 1:+.0%})")
+            if regressions:
+                sys.exit(1)
+            print("No regressions against the baseline")
+        sys.exit(0)
+
+    if args.large_file:
+        print(f"{'codec':>8} {'zero-copy':>9} {'seconds':>9} {'MB/s':>8} {'CPU s':>8} {'buffers':>8} "
+              f"{'kernel MB':>10} {'RSS MB':>8}")
+        for entry in bench_large_file(int(args.large_file * 1024 ** 3)):
+            rss = f"{entry['peak_rss'] / (1024 * 1024):>8.1f}" if entry['peak_rss'] else f"{'-':>8}"
+            print(f"{entry['codec']:>8} {str(entry['zero_copy']):>9} {entry['seconds']:>9.2f} "
+                  f"{entry['mb_per_s']:>8.1f} {entry['cpu_seconds']:>8.2f} {entry['read_buffers']:>8} "
+                  f"{entry['kernel_copied_bytes'] / (1024 * 1024):>10.1f} {rss}")
+        sys.exit(0)
+
+    if args.clients:
+        print(f"{'variant':>14} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8}")
+        for variant, mean, p50, p95 in bench_s3_clients():
+            print(f"{variant:>14} {mean:>9.2f} {p50:>8.2f} {p95:>8.2f}")
+        sys.exit(0)
+
+    # Benchmark a real tree when one is given, otherwise a generated sample
+    generated = args.source is None
+    source_directory = tempfile.mkdtemp(prefix='bench_source_') if generated else args.source
+    try:
+        if generated:
+            print(f"Generating sample tree in {source_directory}")
+            make_sample_tree(source_directory)
+
+        print("\nParallel compression (create_backup workers=N)")
+        print(f"{'workers':>8} {'seconds':>10} {'speedup':>8}")
+        for workers, seconds, speedup in bench_parallel_compression(source_directory):
+            print(f"{workers:>8} {seconds:>10.2f} {speedup:>7.2f}x")
+
+        print("\nDirectory walk")
+        print(f"{'method':>14} {'files':>9} {'seconds':>10}")
+        for method, files, seconds in bench_walk(source_directory):
+            print(f"{method:>14} {files:>9} {seconds:>10.3f}")
+
+        print("\nCodecs")
+        print(f"{'codec':>10} {'seconds':>10} {'MB/s':>8} {'ratio':>7}")
+        for codec, seconds, throughput, ratio in bench_codecs(source_directory):
+            print(f"{codec:>10} {seconds:>10.2f} {throughput:>8.1f} {ratio:>7.2f}")
+
+        print("\nChunk boundaries (16 MB of random data)")
+        print(f"{'method':>10} {'chunks':>7} {'seconds':>10} {'MB/s':>8}")
+        for method, chunks, seconds, throughput in bench_chunking():
+            print(f"{method:>10} {chunks:>7} {seconds:>10.2f} {throughput:>8.1f}")
+    finally:
+        if generated:
+            shutil.rmtree(source_directory, ignore_errors=True)
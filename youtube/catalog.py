@@ -0,0 +1,278 @@
+import os
+import time
+import sqlite3
+import threading
+
+def _data_dir():
+    """Per-user data directory: XDG_DATA_HOME, %LOCALAPPDATA% on Windows, else ~/.local/share"""
+    if os.environ.get('XDG_DATA_HOME'):
+        return os.environ['XDG_DATA_HOME']
+    if os.name == 'nt' and os.environ.get('LOCALAPPDATA'):
+        return os.environ['LOCALAPPDATA']
+    return os.path.join(os.path.expanduser('~'), '.local', 'share')
+
+# Per-user catalog for BackupCatalog() and resync_catalog. Backups are only
+# recorded when given a catalog, e.g. create_backup(..., catalog=DEFAULT_CATALOG)
+DEFAULT_CATALOG = os.path.join(_data_dir(), 'backup', 'catalog.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    id INTEGER PRIMARY KEY,
+    bucket TEXT NOT NULL DEFAULT '',
+    key TEXT NOT NULL,
+    source TEXT,
+    name TEXT,
+    created REAL NOT NULL,
+    size INTEGER,
+    codec TEXT,
+    checksum TEXT,
+    files INTEGER,
+    UNIQUE (bucket, key)
+);
+CREATE INDEX IF NOT EXISTS backups_source ON backups (source, created);
+CREATE INDEX IF NOT EXISTS backups_name ON backups (name, created);
+CREATE INDEX IF NOT EXISTS backups_created ON backups (created);
+CREATE TABLE IF NOT EXISTS members (
+    backup_id INTEGER NOT NULL REFERENCES backups (id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS members_path ON members (path);
+CREATE INDEX IF NOT EXISTS members_backup ON members (backup_id);
+CREATE TABLE IF NOT EXISTS resyncs (
+    bucket TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    synced REAL NOT NULL,
+    PRIMARY KEY (bucket, prefix)
+);
+"""
+
+class BackupCatalog:
+    """
+    Local SQLite index of backups, so finding one needs no S3 LIST call
+
+    Every backup is one row keyed by (bucket, key); local archives use an
+    empty bucket and their absolute path as key. The archive's member paths
+    are stored in an indexed table, so the latest backup of a source and
+    the backups holding a given file are single index lookups. Rows are
+    returned as dicts with the columns of the backups table.
+
+    The catalog only knows about backups made through it; use
+    s3_backup.resync_catalog to pick up archives written elsewhere and to
+    drop deleted ones.
+    """
+    def __init__(self, db_path=DEFAULT_CATALOG):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def record(self, key, source=None, created=None, size=None, codec=None, checksum=None,
+               members=None, bucket=''):
+        """
+        Add or replace the entry of one backup
+
+        Args:
+            key (str): S3 key, or the path of a local archive
+            source (str): Directory that was backed up
+            created (float): Backup time as a Unix timestamp. None uses now
+            size (int): Archive size in bytes
+            codec (str): Codec spec the archive was written with
+            checksum (str): Digest of the archive as 'algorithm:hex', if known
+            members (list): (path, size) of every file the backup restores
+            bucket (str): S3 bucket, '' for local archives
+
+        Returns:
+            int: Row id of the backup
+        """
+        if not bucket:
+            key = os.path.abspath(key)
+        name = os.path.basename(os.path.normpath(source)) if source else None
+        members = list(members or [])
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM backups WHERE bucket = ? AND key = ?", (bucket, key))
+            cursor = self._conn.execute(
+                "INSERT INTO backups (bucket, key, source, name, created, size, codec, checksum, files) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (bucket, key, source, name, created if created is not None else time.time(), size, codec,
+                 checksum, len(members)))
+            backup_id = cursor.lastrowid
+            self._conn.executemany("INSERT INTO members (backup_id, path, size) VALUES (?, ?, ?)",
+                                   ((backup_id, path, member_size) for path, member_size in members))
+        return backup_id
+
+    def relocate(self, key, new_key, new_bucket='', bucket=''):
+        """
+        Point an entry at the archive's new location, e.g. after uploading it
+
+        Returns:
+            bool: Whether an entry was found
+        """
+        if not bucket:
+            key = os.path.abspath(key)
+        if not new_bucket:
+            new_key = os.path.abspath(new_key)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM backups WHERE bucket = ? AND key = ?", (new_bucket, new_key))
+            cursor = self._conn.execute("UPDATE backups SET bucket = ?, key = ? WHERE bucket = ? AND key = ?",
+                                        (new_bucket, new_key, bucket, key))
+        return cursor.rowcount > 0
+
+    def remove(self, key, bucket=''):
+        """Forget one backup; returns whether it was in the catalog"""
+        if not bucket:
+            key = os.path.abspath(key)
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM backups WHERE bucket = ? AND key = ?", (bucket, key))
+        return cursor.rowcount > 0
+
+    def get(self, key, bucket=''):
+        """Return the entry of one backup, or None"""
+        if not bucket:
+            key = os.path.abspath(key)
+        rows = self._query("SELECT * FROM backups WHERE bucket = ? AND key = ?", (bucket, key))
+        return rows[0] if rows else None
+
+    def _filters(self, source, bucket, since, until):
+        clauses, params = [], []
+        if source is not None:
+            # A path matches the source exactly, a bare name any source of that name
+            if os.sep in source or (os.altsep and os.altsep in source):
+                clauses.append("source = ?")
+                params.append(os.path.abspath(source))
+            else:
+                clauses.append("name = ?")
+                params.append(source)
+        if bucket is not None:
+            clauses.append("bucket = ?")
+            params.append(bucket)
+        if since is not None:
+            clauses.append("created >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created < ?")
+            params.append(until)
+        return clauses, params
+
+    def find(self, source=None, bucket=None, since=None, until=None, limit=None):
+        """
+        List backups, newest first
+
+        Args:
+            source (str): Source directory path, or just its name
+            bucket (str): Only backups in this bucket ('' for local ones)
+            since (float): Only backups created at or after this Unix time
+            until (float): Only backups created before this Unix time
+            limit (int): Return at most this many
+
+        Returns:
+            list: Backup entries
+        """
+        clauses, params = self._filters(source, bucket, since, until)
+        sql = "SELECT * FROM backups"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._query(sql, params)
+
+    def latest(self, source=None, bucket=None):
+        """Return the newest backup of a source, or None; see find()"""
+        rows = self.find(source, bucket, limit=1)
+        return rows[0] if rows else None
+
+    def containing(self, path, source=None, bucket=None, since=None, until=None):
+        """
+        List the backups that hold a file, newest first
+
+        Args:
+            path (str): Path of the file inside the backup, e.g. 'docs/a.txt'
+            source, bucket, since, until: Filters, see find()
+
+        Returns:
+            list: Backup entries
+        """
+        clauses, params = self._filters(source, bucket, since, until)
+        sql = ("SELECT backups.* FROM members JOIN backups ON backups.id = members.backup_id "
+               "WHERE members.path = ?")
+        for clause in clauses:
+            sql += " AND backups." + clause
+        sql += " ORDER BY backups.created DESC"
+        return self._query(sql, [path.replace(os.sep, '/')] + params)
+
+    def members(self, key, bucket=''):
+        """Return (path, size) of every file in one backup"""
+        if not bucket:
+            key = os.path.abspath(key)
+        rows = self._query("SELECT members.path, members.size FROM members "
+                           "JOIN backups ON backups.id = members.backup_id "
+                           "WHERE backups.bucket = ? AND backups.key = ? ORDER BY members.path",
+                           (bucket, key))
+        return [(row['path'], row['size']) for row in rows]
+
+    def keys(self, bucket, prefix=''):
+        """Return the keys catalogued below a prefix of a bucket"""
+        rows = self._query("SELECT key FROM backups WHERE bucket = ? AND substr(key, 1, ?) = ?",
+                           (bucket, len(prefix), prefix))
+        return {row['key'] for row in rows}
+
+    def last_resync(self, bucket, prefix=''):
+        """Return the Unix time of the last resync of a prefix, or None"""
+        rows = self._query("SELECT synced FROM resyncs WHERE bucket = ? AND prefix = ?", (bucket, prefix))
+        return rows[0]['synced'] if rows else None
+
+    def mark_resynced(self, bucket, prefix='', synced=None):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO resyncs (bucket, prefix, synced) VALUES (?, ?, ?)",
+                               (bucket, prefix, synced if synced is not None else time.time()))
+
+def open_catalog(catalog):
+    """Return a BackupCatalog for a path or catalog object; None stays None"""
+    if catalog is None or isinstance(catalog, BackupCatalog):
+        return catalog
+    return BackupCatalog(catalog)
+
+def update_catalog(catalog, update, progress=None):
+    """
+    Apply update(BackupCatalog) to a catalog given as path or object
+
+    A catalog that cannot be written must not fail the backup that was
+    just made, so errors are reported to progress and swallowed.
+
+    Returns:
+        The result of update, or None when there is no catalog or it failed
+    """
+    if catalog is None:
+        return None
+    try:
+        opened = open_catalog(catalog)
+        try:
+            return update(opened)
+        finally:
+            if opened is not catalog:
+                opened.close()
+    except (sqlite3.Error, OSError) as e:
+        if progress is not None:
+            progress.message(f"Could not update backup catalog: {str(e)}")
+        return None
@@ -0,0 +1,205 @@
+import os
+import glob
+import json
+import time
+import base64
+import hashlib
+import threading
+import zipfile
+
+JOURNAL_VERSION = 2
+JOURNAL_SUFFIX = '.journal'
+# Journals are fsync'ed at most this often; a crash loses at most this much progress
+SYNC_INTERVAL = 5.0
+
+# ZipInfo attributes saved for every member, enough to rebuild the central directory
+_ZINFO_FIELDS = ('filename', 'compress_type', '_compresslevel', 'create_system', 'create_version',
+                 'extract_version', 'reserved', 'flag_bits', 'volume', 'internal_attr', 'external_attr',
+                 'header_offset', 'CRC', 'compress_size', 'file_size')
+
+class Journal:
+    """
+    Append-only JSON lines file recording the progress of a long operation
+
+    The first line is a header describing the operation. Opening a journal
+    whose header matches resumes it: entries holds every complete line
+    written before, and a line cut short by a crash is dropped. Any other
+    file at path is replaced by a new journal. Lines are flushed when
+    appended, so a killed process loses nothing; they reach the disk at
+    least every sync_interval seconds, which bounds what a power cut loses.
+    """
+    def __init__(self, path, header, sync_interval=SYNC_INTERVAL):
+        self.path = path
+        self.header = dict(header, version=JOURNAL_VERSION)
+        self.sync_interval = sync_interval
+        self.entries = []
+        self.resumed = False
+        self._ends = []
+        self._lock = threading.Lock()
+        self._last_sync = time.monotonic()
+        end = self._load()
+        if end is None:
+            self.entries = []
+            self._ends = []
+            self._file = open(path, 'wb')
+            self._file.write(self._line(self.header))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._start = self._file.tell()
+        else:
+            self.resumed = True
+            self._file = open(path, 'r+b')
+            self._file.seek(end)
+            self._file.truncate()
+
+    @staticmethod
+    def _line(entry):
+        return (json.dumps(entry, separators=(',', ':')) + '\n').encode()
+
+    def _load(self):
+        """Read an existing journal; returns the offset after its last good line, or None"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            line = f.readline()
+            try:
+                if not line.endswith(b'\n') or json.loads(line) != self.header:
+                    return None
+            except ValueError:
+                return None
+            end = self._start = len(line)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                end += len(line)
+                self.entries.append(entry)
+                self._ends.append(end)
+        return end
+
+    def append(self, entry, sync=False):
+        """Add one entry; sync forces it to disk right away"""
+        line = self._line(entry)
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.entries.append(entry)
+            self._ends.append(self._file.tell())
+            now = time.monotonic()
+            if sync or now - self._last_sync >= self.sync_interval:
+                os.fsync(self._file.fileno())
+                self._last_sync = now
+
+    def truncate(self, count):
+        """Keep only the first count entries"""
+        with self._lock:
+            self._file.seek(self._ends[count - 1] if count else self._start)
+            self._file.truncate()
+            del self.entries[count:]
+            del self._ends[count:]
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def remove(self):
+        """Close and delete the journal, once the operation has completed"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+def journal_path(file_path):
+    """Return the path of the journal kept next to an archive or upload"""
+    return file_path + JOURNAL_SUFFIX
+
+def find_unfinished_archive(target_dir, backup_prefix):
+    """
+    Find the most recent archive in target_dir that an interrupted run left behind
+
+    Returns:
+        str: Path of the archive, or None
+    """
+    pattern = os.path.join(glob.escape(target_dir), glob.escape(backup_prefix) + '*.zip' + JOURNAL_SUFFIX)
+    for path in sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True):
+        archive = path[:-len(JOURNAL_SUFFIX)]
+        if os.path.exists(archive):
+            return archive
+    return None
+
+def zinfo_state(zinfo):
+    """Return a JSON-serialisable dict of a written member's ZipInfo"""
+    state = {field: getattr(zinfo, field) for field in _ZINFO_FIELDS}
+    state['date_time'] = list(zinfo.date_time)
+    state['comment'] = base64.b64encode(zinfo.comment).decode()
+    state['extra'] = base64.b64encode(zinfo.extra).decode()
+    return state
+
+def zinfo_from_state(state):
+    """Rebuild a ZipInfo saved by zinfo_state"""
+    zinfo = zipfile.ZipInfo(state['filename'], tuple(state['date_time']))
+    for field in _ZINFO_FIELDS:
+        setattr(zinfo, field, state[field])
+    zinfo.comment = base64.b64decode(state['comment'])
+    zinfo.extra = base64.b64decode(state['extra'])
+    return zinfo
+
+def archive_fingerprint(members, **settings):
+    """
+    Identify an archive by its inputs: member names, sizes, mtimes and settings
+
+    A journal is only resumed while this is unchanged, so a resumed archive
+    is byte-identical to one written in a single run.
+    """
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode())
+    for file_path, arcname, size, st in members:
+        mtime = (st if st is not None else os.stat(file_path)).st_mtime_ns
+        digest.update(f"{arcname}\0{size}\0{mtime}\n".encode())
+    return digest.hexdigest()
+
+def record_member(journal, zipf, zinfo, digest=None):
+    """Journal a member, with the digest of its content, once its data is written and flushed"""
+    zipf.fp.flush()
+    journal.append({'member': zinfo_state(zinfo), 'end': zipf.start_dir, 'digest': digest})
+
+def resume_archive(journal, fileobj):
+    """
+    Position fileobj where an archive journal left off
+
+    Members are kept up to the last one whose data fileobj still holds:
+    the file size for local files, or committed_bytes() for writers that
+    offer it (e.g. a resumed multipart upload). Those writers are moved with
+    resume(offset, committed), telling them which of their bytes are still
+    valid; other files are truncated at offset.
+
+    Returns:
+        tuple: (offset, list of ZipInfo of the members kept)
+    """
+    writer = hasattr(fileobj, 'resume')
+    if not journal.resumed:
+        # Bytes from an attempt with other inputs are useless
+        limit = 0
+    elif writer:
+        limit = fileobj.committed_bytes()
+    else:
+        limit = fileobj.seek(0, os.SEEK_END)
+    kept = 0
+    offset = 0
+    for entry in journal.entries:
+        if entry['end'] > limit:
+            break
+        kept += 1
+        offset = entry['end']
+    journal.truncate(kept)
+    if writer:
+        fileobj.resume(offset, limit)
+    else:
+        fileobj.seek(offset)
+        fileobj.truncate()
+    return offset, [zinfo_from_state(entry['member']) for entry in journal.entries]
@@ -0,0 +1,330 @@
+import os
+import json
+import glob
+import zlib
+import random
+import hashlib
+import tempfile
+from datetime import datetime
+
+# Vectorized boundary detection when numpy is installed; the pure-Python
+# loop finds the same boundaries, only slower
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Content-defined chunk sizes (average must be a power of two)
+MIN_CHUNK_SIZE = 256 * 1024
+AVG_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+# Packs are closed once they grow past this size
+PACK_TARGET_SIZE = 16 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+
+_MASK64 = (1 << 64) - 1
+# Fixed random table for the gear rolling hash; must never change or chunk
+# boundaries (and therefore deduplication) shift for existing repositories
+_GEAR = [random.Random(0x6765617200 + i).getrandbits(64) for i in range(256)]
+_GEAR_ARRAY = numpy.array(_GEAR, dtype=numpy.uint64) if numpy is not None else None
+# Bytes hashed per numpy pass; boundaries are about AVG_CHUNK_SIZE apart, so
+# scanning the whole max_size window at once would mostly be wasted work
+_SCAN_BLOCK = 64 * 1024
+
+def _find_boundary(buf, min_size, avg_size, max_size):
+    """
+    Return the length of the next chunk at the start of buf
+
+    Uses a gear rolling hash: a boundary is declared where the top bits of
+    the hash are all zero, which happens on average every avg_size bytes and
+    depends only on the last 64 bytes of content. Inserting or removing data
+    therefore only moves the boundaries close to the edit.
+    """
+    if numpy is not None:
+        return _find_boundary_numpy(buf, min_size, avg_size, max_size)
+    return _find_boundary_python(buf, min_size, avg_size, max_size)
+
+def _boundary_mask(avg_size):
+    bits = avg_size.bit_length() - 1
+    return ((1 << bits) - 1) << (64 - bits)
+
+def _find_boundary_python(buf, min_size, avg_size, max_size):
+    """_find_boundary one byte at a time, for when numpy is not installed"""
+    length = len(buf)
+    if length <= min_size:
+        return length
+    end = min(length, max_size)
+    mask = _boundary_mask(avg_size)
+    gear = _GEAR
+    h = 0
+    for i in range(min_size, end):
+        h = ((h << 1) + gear[buf[i]]) & _MASK64
+        if not h & mask:
+            return i + 1
+    return end
+
+def _find_boundary_numpy(buf, min_size, avg_size, max_size):
+    """
+    _find_boundary over whole blocks of bytes at once
+
+    As every step shifts the hash left by one, the 64-bit hash at a byte is
+    the sum of the gear values of the last 64 bytes, each shifted by its
+    distance. Each pass of the loop below adds the sums of the previous
+    window shifted by its width, doubling the window, so six passes give
+    every byte's hash without walking the bytes one at a time.
+    """
+    length = len(buf)
+    if length <= min_size:
+        return length
+    end = min(length, max_size)
+    mask = numpy.uint64(_boundary_mask(avg_size))
+    start = min_size
+    while start < end:
+        stop = min(end, start + _SCAN_BLOCK)
+        # The 63 bytes before the block complete the window of its first
+        # hashes; the hash starts from zero at min_size, as in the loop
+        lead = min(start - min_size, 63)
+        h = _GEAR_ARRAY[numpy.frombuffer(buf, numpy.uint8, stop - start + lead, start - lead)]
+        for shift in (1, 2, 4, 8, 16, 32):
+            h[shift:] += h[:-shift] << numpy.uint64(shift)
+        hits = numpy.flatnonzero((h[lead:] & mask) == 0)
+        if hits.size:
+            return start + int(hits[0]) + 1
+        start = stop
+    return end
+
+def iter_chunks(fileobj, min_size=MIN_CHUNK_SIZE, avg_size=AVG_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE):
+    """
+    Split a binary stream into content-defined chunks
+
+    Args:
+        fileobj (file): Readable binary file
+        min_size (int): Smallest chunk except the last one
+        avg_size (int): Target average chunk size (power of two)
+        max_size (int): Largest chunk
+
+    Yields:
+        bytes: Chunk data
+    """
+    buf = bytearray()
+    eof = False
+    while not eof:
+        data = fileobj.read(READ_SIZE)
+        if data:
+            buf += data
+        else:
+            eof = True
+        # Only cut once a full max_size window is buffered, so the boundary
+        # does not depend on how the stream happened to be read
+        while len(buf) >= max_size or (eof and buf):
+            cut = _find_boundary(buf, min_size, avg_size, max_size)
+            yield bytes(buf[:cut])
+            del buf[:cut]
+
+class ChunkRepository:
+    """
+    Deduplicating backup repository
+
+    Layout of repo_dir:
+        config.json              chunker parameters
+        packs/<pack_id>.pack     compressed chunks appended back to back
+        index/<pack_id>.json     chunk id -> [offset, length] within the pack
+        snapshots/<id>.json      file tree of one backup as lists of chunk ids
+
+    Every unique chunk (identified by the SHA-256 of its content) is stored
+    only once, so repeated backups of mostly identical data only add the
+    chunks that changed.
+    """
+    def __init__(self, repo_dir):
+        self.repo_dir = repo_dir
+        self.chunks = {}
+        self.new_packs = []
+        self._pack_file = None
+        self._pack_path = None
+        self._pack_hash = None
+        self._pack_entries = None
+        self._readers = {}
+
+    def _path(self, *parts):
+        return os.path.join(self.repo_dir, *parts)
+
+    def open(self):
+        """Create the repository layout if needed and load the chunk index"""
+        for sub in ('packs', 'index', 'snapshots'):
+            os.makedirs(self._path(sub), exist_ok=True)
+        config_path = self._path('config.json')
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                self.config = json.load(f)
+        else:
+            self.config = {
+                'version': 1,
+                'min_chunk_size': MIN_CHUNK_SIZE,
+                'avg_chunk_size': AVG_CHUNK_SIZE,
+                'max_chunk_size': MAX_CHUNK_SIZE,
+            }
+            with open(config_path, 'w') as f:
+                json.dump(self.config, f)
+        self.chunks = {}
+        for index_path in glob.glob(self._path('index', '*.json')):
+            pack_id = os.path.basename(index_path)[:-len('.json')]
+            with open(index_path) as f:
+                for chunk_id, (offset, length) in json.load(f).items():
+                    self.chunks[chunk_id] = (pack_id, offset, length)
+        return self
+
+    def close(self):
+        """Finish the pack being written and close open pack readers"""
+        self._finish_pack()
+        for reader in self._readers.values():
+            reader.close()
+        self._readers = {}
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def split(self, fileobj):
+        """Split a stream with the repository's chunker parameters"""
+        return iter_chunks(fileobj, self.config['min_chunk_size'],
+                           self.config['avg_chunk_size'], self.config['max_chunk_size'])
+
+    def add_chunk(self, data):
+        """
+        Store a chunk unless the repository already has it
+
+        Args:
+            data (bytes): Chunk content
+
+        Returns:
+            tuple: (chunk id, True if the chunk was new)
+        """
+        chunk_id = hashlib.sha256(data).hexdigest()
+        if chunk_id in self.chunks:
+            return chunk_id, False
+        if self._pack_file is None:
+            self._start_pack()
+        packed = zlib.compress(data)
+        offset = self._pack_file.tell()
+        self._pack_file.write(packed)
+        self._pack_hash.update(packed)
+        self._pack_entries[chunk_id] = [offset, len(packed)]
+        # Pack id is only known once the pack is finished
+        self.chunks[chunk_id] = (None, offset, len(packed))
+        if self._pack_file.tell() >= PACK_TARGET_SIZE:
+            self._finish_pack()
+        return chunk_id, True
+
+    def _start_pack(self):
+        # A unique name, so writers sharing the repository never append to the
+        # same file, and not *.pack, so an unfinished pack is never uploaded
+        fd, self._pack_path = tempfile.mkstemp(prefix='incoming-', suffix='.tmp',
+                                               dir=self._path('packs'))
+        self._pack_file = os.fdopen(fd, 'wb')
+        self._pack_hash = hashlib.sha256()
+        self._pack_entries = {}
+
+    def _finish_pack(self):
+        if self._pack_file is None:
+            return
+        self._pack_file.close()
+        pack_id = self._pack_hash.hexdigest()
+        os.replace(self._pack_path, self._path('packs', f"{pack_id}.pack"))
+        # Index is written after the pack, so a crash never leaves an index
+        # entry pointing at missing data
+        index_path = self._path('index', f"{pack_id}.json")
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump(self._pack_entries, f)
+        os.replace(index_path + '.tmp', index_path)
+        for chunk_id, (offset, length) in self._pack_entries.items():
+            self.chunks[chunk_id] = (pack_id, offset, length)
+        self.new_packs.append(pack_id)
+        self._pack_file = None
+        self._pack_entries = None
+
+    def read_chunk(self, chunk_id):
+        """
+        Return the content of a stored chunk, verifying its hash
+
+        Raises:
+            KeyError: If the chunk is not in the repository
+            ValueError: If the stored data does not match its id
+        """
+        pack_id, offset, length = self.chunks[chunk_id]
+        if pack_id is None:
+            self._finish_pack()
+            pack_id, offset, length = self.chunks[chunk_id]
+        reader = self._readers.get(pack_id)
+        if reader is None:
+            reader = open(self._path('packs', f"{pack_id}.pack"), 'rb')
+            self._readers[pack_id] = reader
+        reader.seek(offset)
+        data = zlib.decompress(reader.read(length))
+        if hashlib.sha256(data).hexdigest() != chunk_id:
+            raise ValueError(f"Chunk {chunk_id} in pack {pack_id} is corrupt")
+        return data
+
+    def save_snapshot(self, source_dir, files):
+        """
+        Record a snapshot
+
+        Args:
+            source_dir (str): Directory that was backed up
+            files (dict): Archive path -> {'size', 'mode', 'mtime', 'chunks'}
+
+        Returns:
+            str: Snapshot id
+        """
+        self._finish_pack()
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        document = {
+            'source': os.path.abspath(source_dir),
+            'created': timestamp,
+            'files': files,
+        }
+        body = json.dumps(document, sort_keys=True)
+        snapshot_id = f"{timestamp}_{hashlib.sha256(body.encode()).hexdigest()[:8]}"
+        path = self._path('snapshots', f"{snapshot_id}.json")
+        with open(path + '.tmp', 'w') as f:
+            f.write(body)
+        os.replace(path + '.tmp', path)
+        return snapshot_id
+
+    def list_snapshots(self):
+        """Return snapshot ids, oldest first"""
+        names = os.listdir(self._path('snapshots'))
+        return sorted(name[:-len('.json')] for name in names if name.endswith('.json'))
+
+    def load_snapshot(self, snapshot_id=None):
+        """
+        Load a snapshot document
+
+        Args:
+            snapshot_id (str): Snapshot to load. None loads the latest one
+
+        Returns:
+            tuple: (snapshot id, snapshot document)
+
+        Raises:
+            FileNotFoundError: If the snapshot does not exist
+        """
+        if snapshot_id is None:
+            snapshots = self.list_snapshots()
+            if not snapshots:
+                raise FileNotFoundError(f"Repository '{self.repo_dir}' has no snapshots")
+            snapshot_id = snapshots[-1]
+        path = self._path('snapshots', f"{snapshot_id}.json")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Snapshot '{snapshot_id}' does not exist")
+        with open(path) as f:
+            return snapshot_id, json.load(f)
+
+    def packs_for(self, snapshot):
+        """Return the ids of the packs a snapshot's chunks live in"""
+        packs = set()
+        for entry in snapshot['files'].values():
+            for chunk_id in entry['chunks']:
+                packs.add(self.chunks[chunk_id][0])
+        return packs
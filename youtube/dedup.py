@@ -0,0 +1,120 @@
+import os
+import json
+import hashlib
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from manifest import hash_file
+from backup_codecs import archive_metadata
+
+# Archive member listing the paths that were stored as references
+LINKS_MEMBER = '.backup_links.json'
+# Smaller files are always stored; a reference would save next to nothing
+MIN_DEDUP_SIZE = 4096
+# Bytes read from each end of a file for the fast hash
+FAST_HASH_SIZE = 64 * 1024
+
+def fast_hash(file_path, size):
+    """
+    Hash the first and last FAST_HASH_SIZE bytes of a file
+
+    Files with different fast hashes cannot be identical, so only files
+    that collide here need a full content hash.
+    """
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(file_path, 'rb') as f:
+        digest.update(f.read(FAST_HASH_SIZE))
+        if size > FAST_HASH_SIZE:
+            f.seek(max(FAST_HASH_SIZE, size - FAST_HASH_SIZE))
+            digest.update(f.read(FAST_HASH_SIZE))
+    return digest.hexdigest()
+
+def _group_by(members, key, workers):
+    """Group members by key(member), computed on a thread pool; returns groups with duplicates"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        keys = list(executor.map(key, members))
+    groups = defaultdict(list)
+    for member, value in zip(members, keys):
+        groups[value].append(member)
+    return [group for group in groups.values() if len(group) > 1]
+
+def find_duplicates(members, workers=1, min_size=MIN_DEDUP_SIZE):
+    """
+    Split backup members into files to store and references to them
+
+    Hard links are recognised by device and inode. The remaining files are
+    compared by size, then by a fast hash of both ends, then by a full
+    SHA-256, so only real candidates are read completely. The first path
+    of each group (by name) keeps the data.
+
+    Args:
+        members (list): (file_path, arcname, size, stat) tuples; stat may be None
+        workers (int): Number of threads hashing files
+        min_size (int): Files smaller than this are never deduplicated
+
+    Returns:
+        tuple: (members to store, links) where links maps the arcname of
+            every skipped file to {'target': arcname, 'type': 'hardlink' or 'copy'}
+    """
+    members = [(file_path, arcname, size, st if st is not None else os.stat(file_path))
+               for file_path, arcname, size, st in members]
+    links = {}
+
+    # Hard links: same file, several names
+    by_inode = defaultdict(list)
+    for member in members:
+        st = member[3]
+        if st.st_nlink > 1:
+            by_inode[(st.st_dev, st.st_ino)].append(member)
+    for group in by_inode.values():
+        group.sort(key=lambda m: m[1])
+        for member in group[1:]:
+            links[member[1]] = {'target': group[0][1], 'type': 'hardlink'}
+
+    # Identical content: size, then fast hash, then full hash
+    candidates = [m for m in members if m[1] not in links and m[2] >= min_size]
+    by_size = defaultdict(list)
+    for member in candidates:
+        by_size[member[2]].append(member)
+    same_size = [m for group in by_size.values() if len(group) > 1 for m in group]
+    for group in _group_by(same_size, lambda m: (m[2], fast_hash(m[0], m[2])), workers):
+        for same in _group_by(group, lambda m: hash_file(m[0]), workers):
+            same.sort(key=lambda m: m[1])
+            for member in same[1:]:
+                links[member[1]] = {'target': same[0][1], 'type': 'copy'}
+
+    # Names are stored with '/' like every other member
+    links = {name.replace(os.sep, '/'): {'target': link['target'].replace(os.sep, '/'), 'type': link['type']}
+             for name, link in links.items()}
+    unique = [m for m in members if m[1].replace(os.sep, '/') not in links]
+    return unique, links
+
+def write_links(zipf, links):
+    """
+    Store the reference list in an open archive
+
+    Returns:
+        str: Name of the member holding it, to be recorded in the archive
+            comment as 'links' so restores know the member is metadata
+    """
+    # A fixed timestamp keeps archives of the same files byte-identical
+    zinfo = zipfile.ZipInfo(LINKS_MEMBER)
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zipf.writestr(zinfo, json.dumps(links, indent=2, sort_keys=True))
+    return LINKS_MEMBER
+
+def links_member(zipf):
+    """Return the name of the archive's reference list member, or None"""
+    return archive_metadata(zipf).get('links')
+
+def read_links(zipf):
+    """
+    Read the reference list of an archive
+
+    Returns:
+        dict: arcname -> {'target', 'type'}, empty for archives without one
+    """
+    name = links_member(zipf)
+    if name is None:
+        return {}
+    return json.loads(zipf.read(name).decode())
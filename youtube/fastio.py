@@ -0,0 +1,114 @@
+import os
+import stat
+import errno
+import itertools
+
+# Errors meaning a kernel copy call does not work for these files, so the next method is tried
+_UNSUPPORTED = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP}
+# Kernel copy calls that failed once in this process are not tried again
+_broken = set()
+
+def local_file(fileobj):
+    """
+    Return fileobj if it is a local regular file the kernel can copy into, else None
+
+    Wrappers exposing the file as .fileobj (like integrity.HashingWriter) are
+    looked through. The file must also be readable ('w+b' or 'r+b'), so
+    copies can be read back. Pipes, sockets, in-memory files and upload
+    streams are not local files.
+    """
+    fileobj = getattr(fileobj, 'fileobj', fileobj)
+    if not hasattr(os, 'pread'):
+        return None
+    try:
+        if not fileobj.readable():
+            return None
+        return fileobj if stat.S_ISREG(os.fstat(fileobj.fileno()).st_mode) else None
+    except (AttributeError, OSError, ValueError):
+        return None
+
+def _copy_chunk(src_fd, dst_fd, src_offset, dst_offset, view):
+    """
+    Copy up to len(view) bytes between offsets with the cheapest call that works
+
+    Returns:
+        tuple: (bytes copied, whether they went through view)
+    """
+    count = len(view)
+    if 'copy_file_range' not in _broken and hasattr(os, 'copy_file_range'):
+        try:
+            return os.copy_file_range(src_fd, dst_fd, count, src_offset, dst_offset), False
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            _broken.add('copy_file_range')
+    if 'sendfile' not in _broken and hasattr(os, 'sendfile'):
+        try:
+            # sendfile writes at the file position of dst_fd
+            os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+            return os.sendfile(dst_fd, src_fd, src_offset, count), False
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            _broken.add('sendfile')
+    n = _pread_into(src_fd, view, src_offset)
+    written = 0
+    while written < n:
+        written += os.pwrite(dst_fd, view[written:n], dst_offset + written)
+    return n, True
+
+def _pread_into(fd, view, offset):
+    """Read into view at offset until it is full or the file ends; returns bytes read"""
+    done = 0
+    while done < len(view):
+        if hasattr(os, 'preadv'):
+            n = os.preadv(fd, [view[done:]], offset + done)
+        else:
+            data = os.pread(fd, len(view) - done, offset + done)
+            n = len(data)
+            view[done:done + n] = data
+        if not n:
+            break
+        done += n
+    return done
+
+def copy_file_data(src_fd, dst_fd, dst_offset, buffers, rate_limiter=None):
+    """
+    Copy a file from its start to dst_fd at dst_offset until its end
+
+    The data is moved by copy_file_range (which may even share the blocks
+    on copy-on-write filesystems) or sendfile, without passing through
+    Python. Where neither works, it goes through the buffers with pread
+    and pwrite. The file positions of both descriptors are left alone, except
+    that sendfile moves dst_fd's.
+
+    Every piece is read back from dst_fd right after it is copied, while it
+    is still in the page cache, so callers can hash exactly what was
+    written without reading the file a second time from disk.
+
+    Args:
+        src_fd (int): Descriptor of the file to copy, read from offset 0
+        dst_fd (int): Descriptor of a readable regular file to copy into
+        dst_offset (int): Where the copy starts in dst_fd
+        buffers (list): Equally sized scratch bytearrays, used in turn; their
+            size is the size of each copy call. With two, a piece can be
+            hashed while the next one is copied
+        rate_limiter (throttle.RateLimiter): Holds the copy to its 'read' limit
+
+    Yields:
+        memoryview: Each piece copied, a view of one of the buffers, valid
+            until that buffer comes round again
+    """
+    views = [memoryview(buffer) for buffer in buffers]
+    copied = 0
+    for index in itertools.count():
+        view = views[index % len(views)]
+        n, in_buffer = _copy_chunk(src_fd, dst_fd, copied, dst_offset + copied, view)
+        if not n:
+            return
+        if not in_buffer and _pread_into(dst_fd, view[:n], dst_offset + copied) != n:
+            raise EOFError("Copied data could not be read back")
+        copied += n
+        if rate_limiter is not None:
+            rate_limiter.throttle('read', n)
+        yield view[:n]
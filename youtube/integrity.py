@@ -0,0 +1,264 @@
+import io
+import os
+import json
+import base64
+import hashlib
+
+# BLAKE3 is used for new checksums when its library is installed
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+CHECKSUMS_SUFFIX = '.checksums.json'
+CHECKSUMS_VERSION = 1
+DEFAULT_ALGORITHM = 'blake3' if blake3 is not None else 'sha256'
+
+class ChecksumError(ValueError):
+    """Raised when restored data does not match its recorded checksum"""
+
+def new_digest(algorithm=None):
+    """
+    Create a hash object for a checksum algorithm
+
+    Args:
+        algorithm (str): 'sha256' or 'blake3'. None uses DEFAULT_ALGORITHM
+
+    Returns:
+        object: Has update() and hexdigest()
+    """
+    algorithm = algorithm or DEFAULT_ALGORITHM
+    if algorithm == 'sha256':
+        return hashlib.sha256()
+    if algorithm == 'blake3':
+        if blake3 is None:
+            raise ValueError("The blake3 checksum requires the 'blake3' package")
+        return blake3.blake3()
+    raise ValueError(f"Unknown checksum algorithm '{algorithm}'")
+
+def algorithm_available(algorithm):
+    """Check whether checksums of an algorithm can be computed here"""
+    return algorithm == 'sha256' or (algorithm == 'blake3' and blake3 is not None)
+
+def part_checksum(data):
+    """Return the base64 SHA-256 S3 expects as ChecksumSHA256 of an uploaded part"""
+    return base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+class HashingWriter:
+    """
+    Write-only, non-seekable file object hashing everything passed through it
+
+    Wrapping the archive output lets the archive checksum be computed while
+    it is written. As the wrapper cannot seek, zipfile writes members with
+    data descriptors instead of going back to patch their headers, so every
+    byte is hashed exactly once and in order. With expected set, check()
+    compares the digest once writing is done.
+    """
+    def __init__(self, fileobj, algorithm=None, expected=None, name=None):
+        self.fileobj = fileobj
+        self.algorithm = algorithm or DEFAULT_ALGORITHM
+        self.digest = new_digest(self.algorithm)
+        self.expected = expected
+        self.name = name
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.fileobj.write(data)
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def seek(self, offset, whence=0):
+        raise io.UnsupportedOperation("HashingWriter is not seekable")
+
+    def seekable(self):
+        return False
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+    def check(self):
+        """Raise ChecksumError if the data written does not match expected"""
+        if self.expected is not None and self.hexdigest() != self.expected:
+            raise ChecksumError(f"Checksum mismatch for {self.name}: expected {self.expected}, "
+                                f"got {self.hexdigest()}")
+
+def member_writer(fileobj, checksums, name):
+    """
+    Wrap a restore target so its content is verified against a checksums document
+
+    Members the document does not list, or whose algorithm is not
+    available here, are written unchecked: check() then does nothing.
+
+    Args:
+        fileobj (file): Writable binary file the member is restored to
+        checksums (dict): Document from load_checksums, or None
+        name (str): Member name inside the archive
+
+    Returns:
+        HashingWriter or file: Call check() on it after the last write
+    """
+    expected = (checksums or {}).get('members', {}).get(name)
+    if expected is None or not algorithm_available(checksums['algorithm']):
+        return _UncheckedWriter(fileobj)
+    return HashingWriter(fileobj, checksums['algorithm'], expected, name)
+
+class _UncheckedWriter:
+    """Pass writes through, for members without a recorded checksum"""
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def write(self, data):
+        return self.fileobj.write(data)
+
+    def check(self):
+        pass
+
+class ArchiveVerifier:
+    """
+    Check a whole archive against its checksums document as its bytes pass by
+
+    Feed update() every byte of the archive, in order, while it is
+    downloaded or streamed; check() then compares size and archive digest.
+    When the document lists the parts of a multipart upload, each part is
+    compared with its SHA-256 as soon as it is complete, so corruption is
+    reported early and located to a part. A mismatch is raised again by
+    every later call, so a caller that survived one error still fails.
+    """
+    def __init__(self, checksums, name=None):
+        self.name = name
+        self.size = checksums['archive']['size']
+        self.expected = checksums['archive']['digest']
+        algorithm = checksums['algorithm']
+        self.digest = new_digest(algorithm) if algorithm_available(algorithm) else None
+        parts = checksums.get('parts') or {}
+        self.part_size = parts.get('size')
+        self.part_checksums = parts.get('sha256') or []
+        self.nbytes = 0
+        self._part = hashlib.sha256()
+        self._part_fill = 0
+        self._parts_done = 0
+        self.error = None
+
+    def update(self, data):
+        if self.error is not None:
+            raise self.error
+        self.nbytes += len(data)
+        if self.digest is not None:
+            self.digest.update(data)
+        if not self.part_checksums:
+            return
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.part_size - self._part_fill)
+            self._part.update(view[:take])
+            self._part_fill += take
+            view = view[take:]
+            if self._part_fill == self.part_size:
+                self._check_part()
+
+    def _check_part(self):
+        number = self._parts_done + 1
+        actual = base64.b64encode(self._part.digest()).decode()
+        if number > len(self.part_checksums) or self.part_checksums[number - 1] != actual:
+            self.error = ChecksumError(f"Checksum mismatch for part {number} of {self.name}")
+            raise self.error
+        self._parts_done = number
+        self._part = hashlib.sha256()
+        self._part_fill = 0
+
+    def check(self):
+        """Raise ChecksumError unless the data passed in is the whole recorded archive"""
+        if self.error is not None:
+            raise self.error
+        if self.nbytes != self.size:
+            raise ChecksumError(f"Size mismatch for {self.name}: expected {self.size} bytes, "
+                                f"got {self.nbytes}")
+        if self.part_checksums:
+            if self._part_fill or not self._parts_done:
+                self._check_part()
+            if self._parts_done != len(self.part_checksums):
+                raise ChecksumError(f"Part count mismatch for {self.name}: expected "
+                                    f"{len(self.part_checksums)}, got {self._parts_done}")
+        if self.digest is not None and self.digest.hexdigest() != self.expected:
+            raise ChecksumError(f"Checksum mismatch for {self.name}: expected {self.expected}, "
+                                f"got {self.digest.hexdigest()}")
+
+def archive_verifier(checksums, name):
+    """
+    Return an ArchiveVerifier for a checksums document, or None when it has no archive digest
+
+    Args:
+        checksums (dict): Document from load_checksums or get_checksums, or None
+        name (str): Archive name for error messages
+    """
+    if not checksums or not checksums.get('archive', {}).get('digest'):
+        return None
+    return ArchiveVerifier(checksums, name)
+
+def count_verified(checksums, members):
+    """Return how many of the restored members a checksums document covers"""
+    if not checksums:
+        return 0
+    return sum(1 for zinfo in members if zinfo.filename in checksums['members'])
+
+def checksums_path(backup_file):
+    """Return the path of the checksums stored next to a backup file or S3 key"""
+    return backup_file + CHECKSUMS_SUFFIX
+
+def checksums_document(stats, size, parts=None, part_size=None):
+    """
+    Build the checksums document of a written archive
+
+    Args:
+        stats (dict): Result of backup.write_backup_archive
+        size (int): Archive size in bytes
+        parts (list): Parts of the multipart upload, with 'ChecksumSHA256'
+        part_size (int): Size of the parts
+
+    Returns:
+        dict: Document for save_checksums or upload
+    """
+    document = {
+        'version': CHECKSUMS_VERSION,
+        'algorithm': stats['algorithm'],
+        'archive': {'size': size, 'digest': stats['checksum']},
+        'members': stats['digests'],
+    }
+    if parts is not None:
+        document['parts'] = {'size': part_size, 'sha256': [part['ChecksumSHA256'] for part in parts]}
+    return document
+
+def save_checksums(backup_file, document):
+    """
+    Write the checksums document next to a backup file
+
+    Returns:
+        str: Path to the checksums file
+    """
+    path = checksums_path(backup_file)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(document, f)
+    os.replace(tmp_path, path)
+    return path
+
+def load_checksums(backup_file):
+    """
+    Load the checksums stored next to a backup file
+
+    Returns:
+        dict: Checksums document, or None if the backup has none
+    """
+    path = checksums_path(backup_file)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def format_checksum(algorithm, hexdigest):
+    """Return an archive digest as 'algorithm:hex', the form the catalog stores"""
+    return f"{algorithm}:{hexdigest}" if hexdigest else None
@@ -0,0 +1,180 @@
+import os
+import json
+import glob
+import hashlib
+from walker import iter_files
+from throttle import open_throttled
+
+MANIFEST_SUFFIX = '.manifest.json'
+MANIFEST_VERSION = 1
+
+def manifest_path(backup_file):
+    """Return the path of the manifest stored next to a backup file"""
+    return backup_file + MANIFEST_SUFFIX
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """
+    Compute the SHA-256 of a file's content
+
+    Args:
+        file_path (str): Path to the file
+        chunk_size (int): Read size in bytes
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    with open_throttled(file_path) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def scan_files(source_dir, workers=1):
+    """
+    Record path, size, mtime and inode of every file below source_dir
+
+    Args:
+        source_dir (str): Path to source directory
+        workers (int): Number of threads listing directories
+
+    Returns:
+        dict: Archive path (with '/' separators) -> file entry
+    """
+    files = {}
+    for entry in iter_files(source_dir, workers):
+        files[entry.relpath.replace(os.sep, '/')] = {
+            'size': entry.stat.st_size,
+            'mtime_ns': entry.stat.st_mtime_ns,
+            'inode': entry.stat.st_ino,
+        }
+    return files
+
+def diff_files(source_dir, previous, current, use_hash=False):
+    """
+    Work out which files changed since the previous manifest
+
+    A file counts as unchanged when size, mtime and inode all match. With
+    use_hash, every file is hashed and compared by content instead, so files
+    that were only touched are skipped and edits that kept size and mtime
+    are still caught; metadata decides only for files the previous manifest
+    has no hash for. Without use_hash, hashes of unchanged files are carried
+    over so a later use_hash run can compare against them.
+
+    Args:
+        source_dir (str): Path to source directory
+        previous (dict): Files from the previous manifest
+        current (dict): Files from scan_files, updated in place with hashes
+        use_hash (bool): Compare content hashes instead of metadata
+
+    Returns:
+        tuple: (changed paths, deleted paths), both sorted
+    """
+    changed = []
+    for arcname, entry in current.items():
+        old = previous.get(arcname)
+        same_meta = old is not None and all(
+            old.get(key) == entry[key] for key in ('size', 'mtime_ns', 'inode'))
+        if use_hash:
+            entry['sha256'] = hash_file(os.path.join(source_dir, arcname))
+            if old is not None and 'sha256' in old:
+                if old['sha256'] != entry['sha256']:
+                    changed.append(arcname)
+                continue
+        elif same_meta and 'sha256' in old:
+            entry['sha256'] = old['sha256']
+        if not same_meta:
+            changed.append(arcname)
+    deleted = [arcname for arcname in previous if arcname not in current]
+    return sorted(changed), sorted(deleted)
+
+def save_manifest(backup_file, source_dir, files, parent=None, deleted=None):
+    """
+    Write the manifest for a backup file
+
+    Args:
+        backup_file (str): Path to the backup the manifest describes
+        source_dir (str): Directory that was backed up
+        files (dict): Full file state of source_dir at backup time
+        parent (str): File name of the previous backup in the chain, None for a full backup
+        deleted (list): Paths removed since the parent backup
+
+    Returns:
+        str: Path to the manifest
+    """
+    path = manifest_path(backup_file)
+    document = {
+        'version': MANIFEST_VERSION,
+        'type': 'incremental' if parent else 'full',
+        'source': os.path.abspath(source_dir),
+        'backup': os.path.basename(backup_file),
+        'parent': parent,
+        'deleted': deleted or [],
+        'files': files,
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(document, f)
+    os.replace(tmp_path, path)
+    return path
+
+def load_manifest(backup_file):
+    """
+    Load the manifest stored next to a backup file
+
+    Returns:
+        dict: Manifest document, or None if the backup has no manifest
+    """
+    path = manifest_path(backup_file)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def find_latest_manifest(target_dir, backup_prefix):
+    """
+    Find the most recent backup in target_dir that has a manifest
+
+    Args:
+        target_dir (str): Directory holding the backups
+        backup_prefix (str): Backup file name prefix, e.g. 'backup_photos_'
+
+    Returns:
+        tuple: (backup file path, manifest document) or (None, None)
+    """
+    pattern = os.path.join(glob.escape(target_dir), glob.escape(backup_prefix) + '*' + MANIFEST_SUFFIX)
+    candidates = sorted(glob.glob(pattern), key=os.path.getmtime)
+    for path in reversed(candidates):
+        backup_file = path[:-len(MANIFEST_SUFFIX)]
+        if os.path.exists(backup_file):
+            return backup_file, load_manifest(backup_file)
+    return None, None
+
+def backup_chain(backup_file):
+    """
+    Resolve the chain of backups needed to restore backup_file
+
+    Args:
+        backup_file (str): Path to a full or incremental backup
+
+    Returns:
+        list: (backup file path, manifest) pairs, starting with the full backup
+
+    Raises:
+        FileNotFoundError: If a backup or manifest in the chain is missing
+    """
+    chain = []
+    current = backup_file
+    while current:
+        manifest = load_manifest(current)
+        if manifest is None:
+            raise FileNotFoundError(f"Manifest for '{current}' does not exist")
+        if not os.path.exists(current):
+            raise FileNotFoundError(f"Backup file '{current}' in chain does not exist")
+        chain.append((current, manifest))
+        parent = manifest.get('parent')
+        current = os.path.join(os.path.dirname(current), parent) if parent else None
+    chain.reverse()
+    return chain
@@ -0,0 +1,222 @@
+import time
+import queue
+import threading
+from contextlib import contextmanager
+
+# Blocked queue operations wake up this often to notice an aborted pipeline
+POLL_INTERVAL = 0.1
+
+class PipelineAborted(Exception):
+    """Raised in every stage once another stage of the pipeline has failed"""
+
+class Stage:
+    """
+    Metrics of one pipeline stage
+
+    Workers time their actual work with busy(); everything else they
+    spend waiting for input or for room downstream counts as idle. The
+    consumer samples its input queue with sample() before each item.
+    """
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self._busy = 0.0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._depth_max = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def busy(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._busy += elapsed
+
+    def sample(self, depth):
+        """Record the depth of the stage's input queue"""
+        with self._lock:
+            self._depth_total += depth
+            self._depth_samples += 1
+            self._depth_max = max(self._depth_max, depth)
+
+    def done(self, count=1):
+        with self._lock:
+            self.items += count
+
+    def metrics(self, wall):
+        """
+        Summarise the stage over a run of wall seconds
+
+        Returns:
+            dict: workers, items, busy and idle seconds (summed over the
+                workers), utilization (busy share of the workers' time) and
+                average and maximum input queue depth
+        """
+        capacity = self.workers * wall
+        return {
+            'workers': self.workers,
+            'items': self.items,
+            'busy': self._busy,
+            'idle': max(0.0, capacity - self._busy),
+            'utilization': self._busy / capacity if capacity else 0.0,
+            'queue_avg': self._depth_total / self._depth_samples if self._depth_samples else 0.0,
+            'queue_max': self._depth_max,
+        }
+
+class BufferPool:
+    """
+    Reusable bytearrays, so stages read with readinto instead of allocating per chunk
+
+    Buffers are created on demand, up to count, and given back with
+    release() once their data is consumed. get() waits for a released one
+    when all count are in use.
+    """
+    def __init__(self, pipeline, count, size):
+        self.pipeline = pipeline
+        self.count = count
+        self.size = size
+        self.allocated = 0
+        self._free = queue.Queue()
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self.allocated < self.count:
+                self.allocated += 1
+                return bytearray(self.size)
+        return self.pipeline.get(self._free)
+
+    def release(self, buffer):
+        self._free.put(buffer)
+
+class Pipeline:
+    """
+    Stages running on their own threads, joined by bounded queues
+
+    Bounded queues give backpressure: a fast stage blocks on put() once its
+    output queue is full, so memory stays bounded by the queue sizes and the
+    slowest stage sets the pace. A worker that raises aborts the pipeline:
+    every blocked get()/put() in the other stages raises PipelineAborted,
+    and join() re-raises the original error.
+    """
+    def __init__(self):
+        self.stages = {}
+        self._threads = []
+        self._error = None
+        self._aborted = threading.Event()
+        self._started = time.perf_counter()
+
+    def stage(self, name, workers=1):
+        """Add a stage and return its Stage metrics object"""
+        self.stages[name] = Stage(name, workers)
+        return self.stages[name]
+
+    def spawn(self, stage, target, *args):
+        """Start stage.workers threads running target(*args)"""
+        def run():
+            try:
+                target(*args)
+            except PipelineAborted:
+                pass
+            except BaseException as e:
+                self.abort(e)
+        for index in range(stage.workers):
+            thread = threading.Thread(target=run, name=f"{stage.name}-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def abort(self, error):
+        """Stop every stage; the first error wins"""
+        if self._error is None:
+            self._error = error
+        self._aborted.set()
+
+    def check(self):
+        if self._aborted.is_set():
+            raise PipelineAborted()
+
+    def put(self, q, item):
+        """Put an item on a bounded queue, waiting for room"""
+        while True:
+            self.check()
+            try:
+                q.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def get(self, q):
+        """Take the next item from a queue, waiting for one"""
+        while True:
+            self.check()
+            try:
+                return q.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+
+    def acquire(self, semaphore):
+        """Acquire a semaphore, e.g. a slot of an in-flight window"""
+        while not semaphore.acquire(timeout=POLL_INTERVAL):
+            self.check()
+
+    def join(self):
+        """Wait for every worker; re-raises the error that aborted the pipeline"""
+        for thread in self._threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def report(self):
+        """
+        Metrics of every stage and the stage limiting throughput
+
+        The bottleneck is the stage whose workers were busy the largest
+        share of the time: adding workers there (or speeding it up) is
+        what would make the whole pipeline faster.
+
+        Returns:
+            tuple: (dict of stage name -> Stage.metrics(), bottleneck name)
+        """
+        wall = time.perf_counter() - self._started
+        stages = {name: stage.metrics(wall) for name, stage in self.stages.items()}
+        bottleneck = max(stages, key=lambda name: stages[name]['utilization']) if stages else None
+        return stages, bottleneck
+
+def merge_reports(reports):
+    """
+    Combine the reports of pipelines that ran side by side, e.g. one per shard
+
+    Stages of the same name are added up; their utilization is the busy
+    share of all their workers' time.
+
+    Args:
+        reports (list): (stages, bottleneck) tuples from Pipeline.report()
+
+    Returns:
+        tuple: (dict of stage name -> merged metrics, bottleneck name)
+    """
+    stages = {}
+    for report, _ in reports:
+        for name, metrics in report.items():
+            merged = stages.setdefault(name, {'workers': 0, 'items': 0, 'busy': 0.0, 'idle': 0.0,
+                                              'utilization': 0.0, 'queue_avg': 0.0, 'queue_max': 0,
+                                              'pipelines': 0})
+            for field in ('workers', 'items', 'busy', 'idle', 'queue_avg'):
+                merged[field] += metrics[field]
+            merged['queue_max'] = max(merged['queue_max'], metrics['queue_max'])
+            merged['pipelines'] += 1
+    for merged in stages.values():
+        capacity = merged['busy'] + merged['idle']
+        merged['utilization'] = merged['busy'] / capacity if capacity else 0.0
+        merged['queue_avg'] /= merged.pop('pipelines')
+    bottleneck = max(stages, key=lambda name: stages[name]['utilization']) if stages else None
+    return stages, bottleneck
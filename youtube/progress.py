@@ -0,0 +1,318 @@
+import sys
+import json
+import time
+import inspect
+import functools
+import threading
+from contextlib import contextmanager
+
+class Progress:
+    """
+    Progress and throughput tracking for one backup or restore job
+
+    Backup and restore functions report what they do through this object
+    instead of printing. Every report becomes an event dict that is passed
+    to callback(progress, event); without a callback nothing is shown.
+
+    Event types:
+        job_start / job_end      the outermost job started or finished
+        phase_start / phase_end  a phase (scan, compress, upload, ...) changed
+        file                     one file was processed ('error' set on failure)
+        transfer                 bytes were uploaded or downloaded
+        message                  human readable status text
+        error                    the job failed
+
+    When the outermost job ends, a run report (see report()) is built and,
+    if report_path is set, written there as JSON.
+    """
+    def __init__(self, callback=None, report_path=None):
+        self.callback = callback
+        self.report_path = report_path
+        self.job_name = None
+        self.status = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.total_files = None
+        self.total_bytes = None
+        self.files = 0
+        self.failed_files = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.transferred = {}
+        self.phases = {}
+        self.counters = {}
+        self.stages = {}
+        self.bottleneck = None
+        self.current_phase = None
+        self._depth = 0
+        self._lock = threading.Lock()
+
+    def _emit(self, event_type, **fields):
+        if self.callback is not None:
+            fields['type'] = event_type
+            fields['time'] = time.time()
+            self.callback(self, fields)
+
+    @contextmanager
+    def job(self, name):
+        """Run a job; nested jobs (e.g. create_backup inside backup_to_s3) share one report"""
+        self._depth += 1
+        if self._depth == 1:
+            self.job_name = name
+            self.status = 'running'
+            self.started = time.time()
+            self._emit('job_start', job=name)
+        try:
+            yield self
+        except BaseException as e:
+            self.fail(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.finish()
+
+    @contextmanager
+    def phase(self, name):
+        """Time a phase of the job; repeated phases accumulate"""
+        previous = self.current_phase
+        self.current_phase = name
+        self._emit('phase_start', phase=name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase_time(name, time.perf_counter() - start)
+            self.current_phase = previous
+            self._emit('phase_end', phase=name)
+
+    def add_phase_time(self, name, seconds):
+        """Add time spent in a phase that runs on background threads"""
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def set_total(self, files=None, total_bytes=None):
+        """Record the amount of work expected, used for the ETA"""
+        self.total_files = files
+        self.total_bytes = total_bytes
+
+    def file_done(self, name, bytes_in=0, bytes_out=0, error=None):
+        """Record one processed file"""
+        with self._lock:
+            if error is None:
+                self.files += 1
+                self.bytes_in += bytes_in
+                self.bytes_out += bytes_out
+            else:
+                self.failed_files += 1
+        self._emit('file', name=name, bytes_in=bytes_in, bytes_out=bytes_out,
+                   error=None if error is None else str(error))
+
+    def transfer(self, direction, nbytes):
+        """Record bytes sent to or received from S3 (direction 'upload' or 'download')"""
+        with self._lock:
+            self.transferred[direction] = self.transferred.get(direction, 0) + nbytes
+        self._emit('transfer', direction=direction, bytes=nbytes)
+
+    def count(self, name, amount=1):
+        """Increase a free-form counter that ends up in the run report"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_stages(self, stages, bottleneck=None):
+        """Record the metrics of pipeline stages and the stage that limited throughput"""
+        with self._lock:
+            self.stages = dict(stages)
+            self.bottleneck = bottleneck
+
+    def message(self, text):
+        """Report a human readable status message"""
+        self._emit('message', text=text)
+
+    def part(self, name):
+        """
+        Progress for one of several parts of the job running at the same time
+
+        Files, transfers, counters and messages (prefixed with name) of the
+        part are passed on to this object. Its phases, totals and stage
+        metrics stay with the part, so parts, e.g. the shards of a sharded
+        backup, do not overwrite each other's.
+        """
+        return _PartProgress(self, name)
+
+    def fail(self, message):
+        """Mark the job as failed and return message, so callers can 'return progress.fail(...)'"""
+        if self.error is None:
+            self.error = message
+            self._emit('error', message=message)
+        return message
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def stats(self):
+        """
+        Current throughput figures
+
+        Returns:
+            dict: files, bytes in/out, rates per second and ETA in seconds
+                (None when the total amount of work is unknown)
+        """
+        elapsed = self.elapsed()
+        files_per_s = self.files / elapsed if elapsed else 0.0
+        bytes_per_s = self.bytes_in / elapsed if elapsed else 0.0
+        eta = None
+        if self.total_bytes and bytes_per_s:
+            eta = max(0.0, (self.total_bytes - self.bytes_in) / bytes_per_s)
+        elif self.total_files and files_per_s:
+            eta = max(0.0, (self.total_files - self.files) / files_per_s)
+        return {
+            'elapsed': elapsed,
+            'files': self.files,
+            'failed_files': self.failed_files,
+            'total_files': self.total_files,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'total_bytes': self.total_bytes,
+            'files_per_s': files_per_s,
+            'bytes_per_s': bytes_per_s,
+            'eta': eta,
+        }
+
+    def report(self):
+        """
+        Run report of the job
+
+        Returns:
+            dict: JSON-serialisable summary with status, timings, counters,
+                per-phase seconds and, for pipelined jobs, per-stage metrics
+                and the bottleneck stage
+        """
+        report = {
+            'job': self.job_name,
+            'status': self.status,
+            'error': self.error,
+            'started': self.started,
+            'finished': self.finished,
+        }
+        report.update(self.stats())
+        report['transferred'] = dict(self.transferred)
+        report['phases'] = dict(self.phases)
+        report['counters'] = dict(self.counters)
+        if self.stages:
+            report['stages'] = dict(self.stages)
+            report['bottleneck'] = self.bottleneck
+        return report
+
+    def finish(self):
+        """End the job, emit job_end and write the JSON run report"""
+        self.finished = time.time()
+        self.status = 'error' if self.error else 'ok'
+        report = self.report()
+        if self.report_path:
+            with open(self.report_path, 'w') as f:
+                json.dump(report, f, indent=2)
+        self._emit('job_end', job=self.job_name, report=report)
+        return report
+
+class _PartProgress(Progress):
+    """Progress of one part of a job, see Progress.part"""
+    def __init__(self, parent, name):
+        super().__init__()
+        self.parent = parent
+        self.name = name
+
+    def file_done(self, name, bytes_in=0, bytes_out=0, error=None):
+        super().file_done(name, bytes_in, bytes_out, error)
+        self.parent.file_done(name, bytes_in, bytes_out, error)
+
+    def transfer(self, direction, nbytes):
+        super().transfer(direction, nbytes)
+        self.parent.transfer(direction, nbytes)
+
+    def count(self, name, amount=1):
+        super().count(name, amount)
+        self.parent.count(name, amount)
+
+    def message(self, text):
+        self.parent.message(f"{self.name}: {text}")
+
+def _format_bytes(nbytes):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if abs(nbytes) < 1024 or unit == 'TB':
+            return f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+
+class ConsoleRenderer:
+    """
+    Progress callback that prints a status line at most every interval seconds
+
+    Messages and failed files are printed immediately, per-file events are
+    folded into the periodic status line, so terminal output stays cheap
+    even for millions of files.
+    """
+    def __init__(self, interval=1.0, stream=None):
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self._last = 0.0
+
+    def status_line(self, progress):
+        stats = progress.stats()
+        line = (f"{stats['files']} files ({stats['files_per_s']:.0f}/s) | "
+                f"{_format_bytes(stats['bytes_in'])} in -> {_format_bytes(stats['bytes_out'])} out | "
+                f"{_format_bytes(stats['bytes_per_s'])}/s")
+        for direction, nbytes in sorted(progress.transferred.items()):
+            line += f" | {direction} {_format_bytes(nbytes)}"
+        if progress.current_phase:
+            line += f" | {progress.current_phase}"
+        if stats['eta'] is not None:
+            line += f" | ETA {int(stats['eta']) // 60}:{int(stats['eta']) % 60:02d}"
+        return line
+
+    def __call__(self, progress, event):
+        event_type = event['type']
+        if event_type == 'message':
+            print(event['text'], file=self.stream)
+        elif event_type == 'error':
+            print(event['message'], file=self.stream)
+        elif event_type == 'file' and event['error']:
+            print(f"Failed: {event['name']}: {event['error']}", file=self.stream)
+        elif event_type == 'job_end':
+            print(self.status_line(progress), file=self.stream)
+        elif event['time'] - self._last >= self.interval:
+            self._last = event['time']
+            print(self.status_line(progress), file=self.stream)
+
+def tracked(job_name):
+    """
+    Decorator running a public backup/restore function as a Progress job
+
+    The wrapped function receives a Progress object in its 'progress'
+    argument (a quiet one when the caller passes none). Returned strings
+    starting with an error prefix mark the job as failed. Coroutine
+    functions are wrapped in a coroutine function.
+    """
+    def check(progress, result):
+        if isinstance(result, str) and 'Error' in result.split(':', 1)[0]:
+            progress.fail(result)
+        return result
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, progress=None, **kwargs):
+                progress = progress or Progress()
+                with progress.job(job_name):
+                    return check(progress, await func(*args, progress=progress, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, progress=None, **kwargs):
+            progress = progress or Progress()
+            with progress.job(job_name):
+                return check(progress, func(*args, progress=progress, **kwargs))
+        return wrapper
+    return decorator
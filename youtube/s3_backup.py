@@ -1,29 +1,810 @@
+import io
 import os
+import glob
+import json
+import hashlib
 import shutil
+import struct
+import zipfile
+import tempfile
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from backup import create_backup, restore_backup
+from chunk_repo import ChunkRepository
+from manifest import hash_file
+from walker import iter_files
+from backup_codecs import get_codec, copy_member_data, archive_metadata
+from dedup import read_links
+from catalog import DEFAULT_CATALOG, open_catalog, update_catalog
+from progress import Progress, ConsoleRenderer, tracked
+from throttle import limiter, open_throttled
+from checkpoint import Journal, journal_path
+from integrity import (part_checksum, member_writer, checksums_path, checksums_document, load_checksums,
+                       save_checksums, format_checksum, count_verified, archive_verifier)
+from shards import is_shard_index, is_shard, load_shard_index, check_shard_index, select_shards
+from tar_format import get_tar_format, is_tar_archive, read_tar_index
+from backup import (create_backup, restore_backup, create_repo_backup, restore_repo_backup,
+                    backup_file_name, write_backup_archive, member_target, extract_parallel,
+                    select_restore_set, restore_links, extract_archive, write_tar_archive,
+                    extract_tar_stream)
+
+# AWSConfig settings the session and clients are created with
+CLIENT_SETTINGS = ('aws_access_key_id', 'aws_secret_access_key', 'region_name', 'endpoint_url')
 
 class AWSConfig:
-    """AWS Configuration class"""
-    def __init__(self, aws_access_key_id=None, aws_secret_access_key=None, region_name=None):
+    """
+    AWS Configuration class
+    
+    Keeps one boto3 session and one S3 client per region and endpoint.
+    boto3 clients are thread-safe, so every upload, download and worker
+    thread shares the same client and its pool of open connections instead
+    of paying for a new client and TLS handshakes on each call.
+    
+    The transfer settings are the defaults for upload_file/download_file
+    (see get_transfer_config). multipart_chunksize and max_concurrency
+    accept 'auto': the part size then follows the file size and the
+    concurrency the CPU count.
+    """
+    def __init__(self, aws_access_key_id=None, aws_secret_access_key=None, region_name=None,
+                 endpoint_url=None, max_pool_connections=None, multipart_threshold=8 * 1024 * 1024,
+                 multipart_chunksize='auto', max_concurrency='auto', io_chunksize=256 * 1024,
+                 max_io_queue=100, transfer_memory=1024 * 1024 * 1024):
         self.aws_access_key_id = aws_access_key_id or 'your-access-key-id'
         self.aws_secret_access_key = aws_secret_access_key or 'your-secret-access-key'
         self.region_name = region_name or 'your-region'  # e.g., 'us-east-1'
+        self.endpoint_url = endpoint_url  # e.g., a local S3-compatible server
+        # None sizes the connection pool to the transfer concurrency
+        self.max_pool_connections = max_pool_connections
+        # Files larger than this are transferred in parts
+        self.multipart_threshold = multipart_threshold
+        # Part size in bytes, or 'auto'
+        self.multipart_chunksize = multipart_chunksize
+        # Parts transferred at the same time, or 'auto'
+        self.max_concurrency = max_concurrency
+        # Downloads buffer up to max_io_queue reads of io_chunksize bytes
+        self.io_chunksize = io_chunksize
+        self.max_io_queue = max_io_queue
+        # Upper bound for parts held in memory at once when picking part sizes
+        self.transfer_memory = transfer_memory
+        self._session = None
+        self._clients = {}
+        self._lock = threading.Lock()
+    
+    def get_session(self):
+        """Return the boto3 session holding the configured credentials"""
+        with self._lock:
+            if self._session is None:
+                self._session = boto3.session.Session(
+                    aws_access_key_id=self.aws_access_key_id,
+                    aws_secret_access_key=self.aws_secret_access_key,
+                    region_name=self.region_name
+                )
+            return self._session
+    
+    def get_client(self, region_name=None, endpoint_url=None):
+        """
+        Return the cached S3 client for a region and endpoint, creating it once
+        
+        Args:
+            region_name (str): Region of the client. None uses the configured one
+            endpoint_url (str): S3 endpoint. None uses the configured one
+        
+        Returns:
+            S3 client shared by all callers
+        """
+        key = (region_name or self.region_name, endpoint_url or self.endpoint_url)
+        client = self._clients.get(key)
+        if client is None:
+            session = self.get_session()
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = session.client(
+                        's3',
+                        region_name=key[0],
+                        endpoint_url=key[1],
+                        config=Config(max_pool_connections=self.pool_size())
+                    )
+                    self._clients[key] = client
+        return client
+    
+    def warm_up(self, bucket_name=None, connections=1):
+        """
+        Create the client and open connections before the first transfer
+        
+        Args:
+            bucket_name (str): Bucket to send HEAD requests to. Without one,
+                only the client is created
+            connections (int): Number of connections to open in parallel,
+                at most max_pool_connections
+        
+        Returns:
+            S3 client
+        """
+        client = self.get_client()
+        if bucket_name:
+            connections = max(1, min(connections, self.pool_size()))
+            with ThreadPoolExecutor(max_workers=connections) as executor:
+                list(executor.map(lambda _: client.head_bucket(Bucket=bucket_name), range(connections)))
+        return client
     
-    def get_client(self):
-        """Create and return an S3 client with the configured credentials"""
-        return boto3.client(
-            's3',
-            aws_access_key_id=self.aws_access_key_id,
-            aws_secret_access_key=self.aws_secret_access_key,
-            region_name=self.region_name
-        )
+    def concurrency(self):
+        """Return max_concurrency, resolving 'auto' from the CPU count"""
+        if self.max_concurrency == 'auto':
+            return auto_concurrency()
+        return self.max_concurrency
+    
+    def pool_size(self):
+        """Return the connection pool size of new clients"""
+        return self.max_pool_connections or max(10, self.concurrency())
+    
+    def get_transfer_config(self, file_size=None, **overrides):
+        """
+        Build the TransferConfig for one upload_file/download_file call
+        
+        Args:
+            file_size (int): Size of the object, used by the 'auto' part size.
+                None falls back to boto3's default part size
+            **overrides: multipart_threshold, multipart_chunksize,
+                max_concurrency, io_chunksize or max_io_queue for this call
+        
+        Returns:
+            TransferConfig: Resolved settings
+        """
+        settings = {
+            'multipart_threshold': self.multipart_threshold,
+            'multipart_chunksize': self.multipart_chunksize,
+            'max_concurrency': self.max_concurrency,
+            'io_chunksize': self.io_chunksize,
+            'max_io_queue': self.max_io_queue,
+        }
+        settings.update((name, value) for name, value in overrides.items() if value is not None)
+        if settings['max_concurrency'] == 'auto':
+            settings['max_concurrency'] = auto_concurrency()
+        if settings['multipart_chunksize'] == 'auto':
+            if file_size is None:
+                settings['multipart_chunksize'] = AUTO_MIN_PART_SIZE
+            else:
+                settings['multipart_chunksize'] = auto_part_size(
+                    file_size, settings['max_concurrency'], self.transfer_memory)
+        return TransferConfig(**settings)
+    
+    def clear_clients(self):
+        """Forget cached clients, e.g. after changing credentials"""
+        with self._lock:
+            self._session = None
+            self._clients = {}
+    
+    def configure(self, **settings):
+        """
+        Change settings of a configuration that may already be in use
+        
+        Cached clients are kept when only transfer settings change. When the
+        credentials, region, endpoint or connection pool size change, they
+        are dropped and the next get_client() creates and caches a new one.
+        
+        Args:
+            **settings: Any of the __init__ arguments
+        
+        Raises:
+            TypeError: If a setting is unknown
+        """
+        for name in settings:
+            if name.startswith('_') or name not in vars(self):
+                raise TypeError(f"Unknown AWSConfig setting '{name}'")
+        before = [getattr(self, name) for name in CLIENT_SETTINGS] + [self.pool_size()]
+        for name, value in settings.items():
+            setattr(self, name, value)
+        if [getattr(self, name) for name in CLIENT_SETTINGS] + [self.pool_size()] != before:
+            self.clear_clients()
 
 # Global AWS configuration
 aws_config = AWSConfig()
 
-def upload_to_s3(local_file, bucket_name, s3_key=None):
+# S3 multipart limits
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PART_SIZE = 5 * 1024 * 1024 * 1024
+MAX_PARTS = 10000
+
+# Bounds of the 'auto' transfer settings
+AUTO_MIN_PART_SIZE = 8 * 1024 * 1024
+AUTO_PARTS_PER_THREAD = 4
+AUTO_MAX_CONCURRENCY = 64
+
+def auto_concurrency():
+    """Pick a transfer concurrency from the CPU count; transfers wait on the network, not the CPU"""
+    return min(AUTO_MAX_CONCURRENCY, max(4, (os.cpu_count() or 1) * 4))
+
+def auto_part_size(file_size, concurrency, memory=1024 * 1024 * 1024):
+    """
+    Pick a multipart part size for a file
+    
+    Parts are sized so every thread gets a few of them, but no smaller than
+    AUTO_MIN_PART_SIZE and no larger than memory / concurrency, as boto3
+    buffers one part per thread. Above all the upload must fit in MAX_PARTS
+    parts, so very large files get larger parts regardless.
+    
+    Args:
+        file_size (int): Size of the object in bytes
+        concurrency (int): Number of parts transferred at the same time
+        memory (int): Bytes of part buffers allowed at once
+    
+    Returns:
+        int: Part size in bytes, rounded up to a whole MB
+    """
+    part_size = file_size // (concurrency * AUTO_PARTS_PER_THREAD)
+    part_size = min(max(part_size, AUTO_MIN_PART_SIZE), max(AUTO_MIN_PART_SIZE, memory // concurrency))
+    part_size = max(part_size, -(-file_size // MAX_PARTS))
+    mb = 1024 * 1024
+    return min(-(-part_size // mb) * mb, MAX_PART_SIZE)
+
+def _transfer(progress, direction, nbytes):
+    """Transfer callback: hold the transfer to the rate limit and report the bytes"""
+    limiter.throttle(direction, nbytes)
+    progress.transfer(direction, nbytes)
+
+def _log_throughput(progress, direction, nbytes, seconds, part_size=None, concurrency=None):
+    """Report the throughput a transfer achieved"""
+    rate = nbytes / (1024 * 1024) / seconds if seconds else 0.0
+    text = (f"{direction.capitalize()}ed {nbytes / (1024 * 1024):.2f} MB in {seconds:.2f} s "
+            f"({rate:.2f} MB/s")
+    if part_size:
+        text += f", {part_size / (1024 * 1024):.0f} MB parts"
+    if concurrency:
+        text += f", {concurrency} threads"
+    progress.message(text + ")")
+    progress.count(f"{direction}_seconds", seconds)
+
+class S3MultipartWriter:
+    """
+    Write-only, non-seekable file object that uploads to S3 as multipart parts
+    
+    Data is collected into part_size buffers; every full buffer is handed to
+    a pool that uploads it while the caller keeps writing. Once
+    max_inflight_parts uploads are pending, write() blocks until one
+    finishes, so memory stays below (max_inflight_parts + 1) * part_size.
+    Uploaded bytes and upload time are reported to progress. Every part is
+    sent with its SHA-256 checksum, which S3 verifies on receipt; after
+    complete() the part list, with checksums, is in parts.
+    
+    With a state_path, the upload ID and the ETag of every uploaded part
+    are journaled there, and a failed upload is left open instead of
+    aborted. A later writer with the same state_path, key and part size
+    picks the upload up again: committed_bytes() tells how much of the
+    object is already in S3, and after resume(offset, committed) bytes
+    written from offset on are only uploaded where they are not.
+    state_info holds anything else that must match, e.g. the size of the
+    source file.
+    """
+    def __init__(self, s3_client, bucket_name, s3_key, part_size=64 * 1024 * 1024, max_inflight_parts=4,
+                 progress=None, state_path=None, state_info=None):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.s3_key = s3_key
+        self.part_size = part_size
+        self.progress = progress or Progress()
+        self.upload_id = None
+        self._uploaded = {}
+        self._journal = None
+        if state_path is not None:
+            self._journal = Journal(state_path, dict(state_info or {}, bucket=bucket_name, key=s3_key,
+                                                     part_size=part_size))
+            self._load_state()
+        if self.upload_id is None:
+            self.upload_id = s3_client.create_multipart_upload(
+                Bucket=bucket_name, Key=s3_key, ChecksumAlgorithm='SHA256')['UploadId']
+            if self._journal is not None:
+                self._journal.append({'upload_id': self.upload_id}, sync=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight_parts)
+        self._slots = threading.BoundedSemaphore(max_inflight_parts)
+        self._futures = []
+        self._kept_parts = []
+        self._buffer = bytearray()
+        self._position = 0
+        self._skip = 0
+        self._part_number = 0
+        self.parts = None
+    
+    def _load_state(self):
+        """Find the upload of an interrupted attempt and the parts S3 confirms it has"""
+        entries = self._journal.entries
+        if not entries or 'upload_id' not in entries[0]:
+            self._journal.truncate(0)
+            return
+        upload_id = entries[0]['upload_id']
+        try:
+            listed = {}
+            paginator = self.s3_client.get_paginator('list_parts')
+            for page in paginator.paginate(Bucket=self.bucket_name, Key=self.s3_key, UploadId=upload_id):
+                for part in page.get('Parts', []):
+                    listed[part['PartNumber']] = part['ETag']
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchUpload':
+                raise
+            # The upload was completed, aborted or cleaned up meanwhile
+            self._journal.truncate(0)
+            return
+        self.upload_id = upload_id
+        for entry in entries[1:]:
+            if listed.get(entry['part']) == entry['etag']:
+                self._uploaded[entry['part']] = (entry['etag'], entry['size'], entry['checksum'])
+        self.progress.message(f"Resuming upload of s3://{self.bucket_name}/{self.s3_key}: "
+                              f"{len(self._uploaded)} parts already uploaded")
+    
+    def committed_bytes(self):
+        """Return how many leading bytes of the object are uploaded as whole parts"""
+        count = 0
+        while self._uploaded.get(count + 1, (None, 0, None))[1] == self.part_size:
+            count += 1
+        return count * self.part_size
+    
+    def resume(self, offset, committed):
+        """
+        Continue an interrupted upload
+        
+        Args:
+            offset (int): Object offset of the next byte written
+            committed (int): Leading bytes whose uploaded parts are kept, at
+                most committed_bytes(); the rest is uploaded again
+        """
+        kept = min(committed, self.committed_bytes()) // self.part_size
+        if offset > kept * self.part_size:
+            raise ValueError("Cannot resume after the uploaded parts")
+        self._kept_parts = [{'PartNumber': number, 'ETag': self._uploaded[number][0],
+                             'ChecksumSHA256': self._uploaded[number][2]}
+                            for number in range(1, kept + 1)]
+        self._part_number = kept
+        self._position = offset
+        self._skip = kept * self.part_size - offset
+        if kept:
+            self.progress.count('resumed_bytes', kept * self.part_size)
+    
+    def write(self, data):
+        size = len(data)
+        self._position += size
+        if self._skip:
+            # Already in S3 from an earlier attempt
+            skipped = min(self._skip, len(data))
+            self._skip -= skipped
+            data = memoryview(data)[skipped:]
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            self._submit(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return size
+    
+    def tell(self):
+        return self._position
+    
+    def seek(self, offset, whence=0):
+        raise io.UnsupportedOperation("S3MultipartWriter is not seekable")
+    
+    def seekable(self):
+        return False
+    
+    def flush(self):
+        pass
+    
+    def _upload_part(self, part_number, body):
+        limiter.throttle('upload', len(body))
+        checksum = part_checksum(body)
+        start = time.perf_counter()
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket_name, Key=self.s3_key, UploadId=self.upload_id,
+            PartNumber=part_number, Body=body, ChecksumSHA256=checksum)
+        self.progress.add_phase_time('upload', time.perf_counter() - start)
+        self.progress.transfer('upload', len(body))
+        if self._journal is not None:
+            self._journal.append({'part': part_number, 'etag': response['ETag'], 'size': len(body),
+                                  'checksum': checksum})
+        return {'PartNumber': part_number, 'ETag': response['ETag'], 'ChecksumSHA256': checksum}
+    
+    def _submit(self, body):
+        # Surface failed part uploads as soon as possible
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        if self._part_number >= MAX_PARTS:
+            raise ValueError(f"Archive needs more than {MAX_PARTS} parts, increase part_size")
+        self._slots.acquire()
+        self._part_number += 1
+        try:
+            future = self._executor.submit(self._upload_part, self._part_number, body)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+    
+    def complete(self):
+        """Upload the remaining data and complete the multipart upload"""
+        if self._buffer or not (self._futures or self._kept_parts):
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        parts = self._kept_parts + [future.result() for future in self._futures]
+        self._executor.shutdown()
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=self.s3_key, UploadId=self.upload_id,
+            MultipartUpload={'Parts': parts})
+        self.parts = parts
+        if self._journal is not None:
+            self._journal.remove()
+    
+    def abort(self):
+        """
+        Stop pending part uploads and abort the multipart upload
+        
+        With a state_path the upload stays open so a later attempt can
+        resume it; cleanup_multipart_uploads removes it if none does.
+        """
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        if self._journal is not None:
+            self._journal.close()
+            return
+        self.s3_client.abort_multipart_upload(
+            Bucket=self.bucket_name, Key=self.s3_key, UploadId=self.upload_id)
+
+class S3RangeReader:
+    """
+    Read-only, seekable file object over an S3 object using ranged GETs
+    
+    Each read that misses the current buffer fetches at least block_size
+    bytes, so the many small reads zipfile does while parsing the central
+    directory cost only a couple of requests.
+    """
+    def __init__(self, s3_client, bucket_name, s3_key, block_size=1024 * 1024):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.s3_key = s3_key
+        self.block_size = block_size
+        self.size = s3_client.head_object(Bucket=bucket_name, Key=s3_key)['ContentLength']
+        self._position = 0
+        self._buffer_start = 0
+        self._buffer = b''
+    
+    def get_range(self, start, end):
+        """Return a streaming body for bytes [start, end) of the object"""
+        limiter.throttle('download', end - start)
+        response = self.s3_client.get_object(
+            Bucket=self.bucket_name, Key=self.s3_key, Range=f"bytes={start}-{end - 1}")
+        return response['Body']
+    
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.size - self._position
+        n = min(n, self.size - self._position)
+        if n <= 0:
+            return b''
+        offset = self._position - self._buffer_start
+        if offset < 0 or offset + n > len(self._buffer):
+            end = min(self.size, self._position + max(n, self.block_size))
+            self._buffer = self.get_range(self._position, end).read()
+            self._buffer_start = self._position
+            offset = 0
+        self._position += n
+        return self._buffer[offset:offset + n]
+    
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+    
+    def tell(self):
+        return self._position
+    
+    def seekable(self):
+        return True
+    
+    def close(self):
+        self._buffer = b''
+
+class _RangeStream:
+    """
+    Readable stream over a whole S3 object, fetched as parallel ranged GETs
+    
+    Up to concurrency ranges of range_size bytes are fetched ahead of the
+    reader and read() hands them on in order. The transfer stays parallel
+    while the bytes can still be hashed and parsed front to back, with at
+    most concurrency ranges held in memory.
+    """
+    def __init__(self, s3_client, bucket_name, s3_key, size, range_size, concurrency):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.s3_key = s3_key
+        self.size = size
+        self.range_size = max(1, range_size)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        self._pending = deque()
+        self._next = 0
+        self._buffer = memoryview(b'')
+        for _ in range(max(1, concurrency)):
+            self._fetch_next()
+    
+    def _fetch_next(self):
+        if self._next < self.size:
+            end = min(self._next + self.range_size, self.size)
+            self._pending.append(self._executor.submit(self._get_range, self._next, end))
+            self._next = end
+    
+    def _get_range(self, start, end):
+        body = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.s3_key,
+                                         Range=f"bytes={start}-{end - 1}")['Body']
+        try:
+            return body.read()
+        finally:
+            body.close()
+    
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.size
+        chunks = []
+        while n > 0:
+            if not self._buffer:
+                if not self._pending:
+                    break
+                self._buffer = memoryview(self._pending.popleft().result())
+                self._fetch_next()
+            chunk = self._buffer[:n]
+            self._buffer = self._buffer[len(chunk):]
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b''.join(chunks)
+    
+    def readable(self):
+        return True
+    
+    def close(self):
+        for future in self._pending:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        self._pending.clear()
+        self._buffer = memoryview(b'')
+
+class _DownloadReader:
+    """
+    Pass reads of a streaming body through, held to the download limit and reported
+    
+    With a verifier (integrity.ArchiveVerifier) every byte read is also fed
+    to it, so an archive read to its end is checked without a second pass.
+    """
+    def __init__(self, body, progress, verifier=None):
+        self.body = body
+        self.progress = progress
+        self.verifier = verifier
+        self.nbytes = 0
+    
+    def read(self, n=-1):
+        data = self.body.read(n if n is not None and n >= 0 else None)
+        _transfer(self.progress, 'download', len(data))
+        self.nbytes += len(data)
+        if self.verifier is not None:
+            self.verifier.update(data)
+        return data
+    
+    def tell(self):
+        return self.nbytes
+    
+    def readable(self):
+        return True
+
+def _drain(stream, size=None):
+    """Read and drop size bytes of a stream, or everything left with size None"""
+    while size is None or size > 0:
+        chunk = stream.read(1024 * 1024 if size is None else min(size, 1024 * 1024))
+        if not chunk:
+            break
+        if size is not None:
+            size -= len(chunk)
+
+def _read_exact(stream, size):
+    """Read exactly size bytes from a stream"""
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise EOFError("Unexpected end of archive data")
+        data += chunk
+    return data
+
+def _member_spans(zipf):
+    """
+    Map each member of an open ZipFile to the byte range it occupies
+    
+    A member runs from its local header to the next local header (or the
+    central directory), which covers header, data and data descriptor.
+    
+    Returns:
+        dict: Member name -> (start, end)
+    """
+    offsets = sorted({info.header_offset for info in zipf.infolist()} | {zipf.start_dir})
+    next_offset = dict(zip(offsets, offsets[1:]))
+    return {info.filename: (info.header_offset, next_offset[info.header_offset])
+            for info in zipf.infolist()}
+
+def _extract_member_from_range(reader, zinfo, span, restore_dir, checksums, progress):
+    """
+    Stream one member's byte range from S3 and write it out as it arrives
+    
+    Args:
+        reader (S3RangeReader): Reader for the archive object
+        zinfo (zipfile.ZipInfo): Member to extract
+        span (tuple): (start, end) byte range of the member
+        restore_dir (str): Directory to extract into
+        checksums (dict): Checksums document to verify the member against
+        progress (Progress): Receives the downloaded byte count
+    
+    Returns:
+        str: Path of the extracted file
+    """
+    body = reader.get_range(*span)
+    progress.transfer('download', span[1] - span[0])
+    try:
+        return extract_member_stream(body, zinfo, restore_dir, checksums)
+    finally:
+        body.close()
+
+def extract_member_stream(body, zinfo, restore_dir, checksums=None):
+    """
+    Extract one member from a stream that starts at its local header
+    
+    Args:
+        body (file): Readable stream over the member's byte range
+        zinfo (zipfile.ZipInfo): Member to extract, from the central directory
+        restore_dir (str): Directory to extract into
+        checksums (dict): Checksums document of the archive; the member's
+            content is verified against it while it is written
+    
+    Returns:
+        str: Path of the extracted file
+    
+    Raises:
+        integrity.ChecksumError: If the content does not match its checksum
+    """
+    target = member_target(restore_dir, zinfo.filename)
+    header = struct.unpack(zipfile.structFileHeader, _read_exact(body, zipfile.sizeFileHeader))
+    if header[0] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local header for {zinfo.filename}")
+    # Skip the file name and extra field that follow the fixed header
+    _read_exact(body, header[-2] + header[-1])
+    # ZipExtFile decompresses and checks the CRC while reading
+    with zipfile.ZipExtFile(body, 'r', zinfo) as member, open(target, 'wb') as out:
+        out = member_writer(out, checksums, zinfo.filename)
+        copy_member_data(member, out, zinfo)
+        out.check()
+    return target
+
+def extract_in_order(stream, members, spans, restore_dir, checksums=None, progress=None):
+    """
+    Extract members from a stream over a whole archive, read once from start to end
+    
+    The bytes of members that are not selected and the central directory
+    are read and dropped, so a verifying stream sees the entire archive.
+    A failing member does not stop the others, like extract_parallel.
+    
+    Args:
+        stream (file): Readable stream with tell(), at the start of the archive
+        members (list): ZipInfo objects to extract
+        spans (dict): Byte range of every member, from _member_spans
+        restore_dir (str): Directory to extract into
+        checksums (dict): Checksums document to verify the members against
+        progress (Progress): Receives the extract phase and per-member progress
+    
+    Returns:
+        list: (ZipInfo, exception) pairs for members that failed
+    """
+    for zinfo in members:
+        target = member_target(restore_dir, zinfo.filename)
+        os.makedirs(target if zinfo.is_dir() else os.path.dirname(target), exist_ok=True)
+    
+    selected = {zinfo.filename: zinfo for zinfo in members if not zinfo.is_dir()}
+    progress = progress or Progress()
+    errors = []
+    with progress.phase('extract'):
+        for name, (start, end) in sorted(spans.items(), key=lambda item: item[1]):
+            zinfo = selected.get(name)
+            if zinfo is not None:
+                _drain(stream, start - stream.tell())
+                try:
+                    extract_member_stream(stream, zinfo, restore_dir, checksums)
+                    error = None
+                except Exception as e:
+                    errors.append((zinfo, e))
+                    error = e
+                progress.file_done(zinfo.filename, zinfo.compress_size, zinfo.file_size, error)
+            _drain(stream, end - stream.tell())
+        # The central directory
+        _drain(stream)
+    return errors
+
+def put_checksums(s3_client, bucket_name, s3_key, document):
+    """Store the checksums document of an archive next to it in S3"""
+    s3_client.put_object(Bucket=bucket_name, Key=checksums_path(s3_key),
+                         Body=json.dumps(document).encode(), ContentType='application/json')
+
+def get_checksums(s3_client, bucket_name, s3_key):
+    """
+    Fetch the checksums document stored next to an archive in S3
+    
+    Returns:
+        dict: Checksums document, or None for archives without one
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=checksums_path(s3_key))
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    return json.loads(response['Body'].read())
+
+def get_shard_index(s3_client, bucket_name, s3_key):
+    """Fetch the index of a sharded backup stored in S3"""
+    response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
+    return check_shard_index(json.loads(response['Body'].read()), f"s3://{bucket_name}/{s3_key}")
+
+def _shard_key(index_key, shard):
+    """Return the S3 key of a shard, stored next to its index"""
+    return os.path.join(os.path.dirname(index_key), shard['name'])
+
+def _shard_transfers(shards, transfer_config, limit=None):
+    """
+    Decide how many shards to transfer at once and the settings of each transfer
+    
+    The transfer concurrency is shared by the shards moving at the same
+    time, so sharding adds no connections, it only keeps them all busy.
+    
+    Returns:
+        tuple: (shards at once, transfer_config dict for each of them)
+    """
+    transfer_config = dict(transfer_config or {})
+    concurrency = transfer_config.get('max_concurrency') or aws_config.concurrency()
+    if concurrency == 'auto':
+        concurrency = auto_concurrency()
+    parallel = max(1, min(len(shards), limit or concurrency))
+    transfer_config['max_concurrency'] = max(1, concurrency // parallel)
+    return parallel, transfer_config
+
+def _resumable_upload(s3_client, local_file, bucket_name, s3_key, config, progress):
+    """
+    Upload a file as a journaled multipart upload, see upload_to_s3
+    
+    The journal lives next to the file. Parts an interrupted attempt
+    uploaded are kept as long as the file's size and mtime are unchanged.
+    """
+    st = os.stat(local_file)
+    part_size = max(config.multipart_chunksize, MIN_PART_SIZE, -(-st.st_size // MAX_PARTS))
+    writer = S3MultipartWriter(s3_client, bucket_name, s3_key, part_size, config.max_concurrency, progress,
+                               state_path=journal_path(local_file + '.upload'),
+                               state_info={'size': st.st_size, 'mtime_ns': st.st_mtime_ns})
+    try:
+        committed = writer.committed_bytes()
+        writer.resume(committed, committed)
+        with open_throttled(local_file) as f:
+            f.seek(committed)
+            while True:
+                chunk = f.read(part_size)
+                if not chunk:
+                    break
+                writer.write(chunk)
+        writer.complete()
+    except BaseException:
+        writer.abort()
+        raise
+    return part_size
+
+@tracked('upload_to_s3')
+def upload_to_s3(local_file, bucket_name, s3_key=None, transfer_config=None, resume=False, progress=None):
     """
     Upload a file to AWS S3
     
@@ -31,6 +812,11 @@ def upload_to_s3(local_file, bucket_name, s3_key=None):
         local_file (str): Path to local file
         bucket_name (str): S3 bucket name
         s3_key (str): S3 object key (path in bucket). If None, uses filename
+        transfer_config (dict): Transfer settings overriding aws_config's, e.g.
+            {'multipart_chunksize': 128 * 1024 * 1024, 'max_concurrency': 32}
+        resume (bool): Journal multipart uploads next to local_file and keep
+            them open on failure, so calling again only uploads missing parts
+        progress (Progress): Receives progress events and the run report
     
     Returns:
         str: Success message or error message
@@ -48,10 +834,23 @@ def upload_to_s3(local_file, bucket_name, s3_key=None):
             s3_key = os.path.basename(local_file)
         
         # Upload file
-        print(f"Uploading {local_file} to s3://{bucket_name}/{s3_key}")
-        s3_client.upload_file(local_file, bucket_name, s3_key)
+        file_size = os.path.getsize(local_file)
+        config = aws_config.get_transfer_config(file_size, **(transfer_config or {}))
+        progress.message(f"Uploading {local_file} to s3://{bucket_name}/{s3_key}")
+        start = time.perf_counter()
+        part_size = config.multipart_chunksize
+        with progress.phase('upload'):
+            if resume and file_size >= config.multipart_threshold:
+                part_size = _resumable_upload(s3_client, local_file, bucket_name, s3_key, config, progress)
+            else:
+                s3_client.upload_file(local_file, bucket_name, s3_key, Config=config,
+                                      ExtraArgs={'ChecksumAlgorithm': 'SHA256'},
+                                      Callback=lambda nbytes: _transfer(progress, 'upload', nbytes))
+        _log_throughput(progress, 'upload', file_size, time.perf_counter() - start,
+                        part_size if file_size >= config.multipart_threshold else None,
+                        config.max_concurrency)
         
-        print("\nUpload completed successfully!")
+        progress.message("Upload completed successfully!")
         return f"File uploaded to s3://{bucket_name}/{s3_key}"
         
     except ClientError as e:
@@ -59,7 +858,8 @@ def upload_to_s3(local_file, bucket_name, s3_key=None):
     except Exception as e:
         return f"Error uploading to S3: {str(e)}"
 
-def download_from_s3(bucket_name, s3_key, local_file):
+@tracked('download_from_s3')
+def download_from_s3(bucket_name, s3_key, local_file, transfer_config=None, checksums=None, progress=None):
     """
     Download a file from AWS S3
     
@@ -67,6 +867,13 @@ def download_from_s3(bucket_name, s3_key, local_file):
         bucket_name (str): S3 bucket name
         s3_key (str): S3 object key (path in bucket)
         local_file (str): Path where to save the file locally
+        transfer_config (dict): Transfer settings overriding aws_config's,
+            see upload_to_s3
+        checksums (dict): Checksums document of the archive, see
+            get_checksums. Its ranges are then fetched in parallel but written
+            in order, and the archive digest and part checksums are checked
+            on the way; a mismatch fails the download
+        progress (Progress): Receives progress events and the run report
     
     Returns:
         str: Success message or error message
@@ -78,11 +885,36 @@ def download_from_s3(bucket_name, s3_key, local_file):
         # Create local directory if it doesn't exist
         os.makedirs(os.path.dirname(local_file), exist_ok=True)
         
-        # Download file
-        print(f"Downloading s3://{bucket_name}/{s3_key} to {local_file}")
-        s3_client.download_file(bucket_name, s3_key, local_file)
+        # Download file, sizing parts from the object size
+        file_size = s3_client.head_object(Bucket=bucket_name, Key=s3_key)['ContentLength']
+        config = aws_config.get_transfer_config(file_size, **(transfer_config or {}))
+        progress.message(f"Downloading s3://{bucket_name}/{s3_key} to {local_file}")
+        start = time.perf_counter()
+        verifier = archive_verifier(checksums, s3_key)
+        with progress.phase('download'):
+            if verifier is None:
+                s3_client.download_file(bucket_name, s3_key, local_file, Config=config,
+                                        Callback=lambda nbytes: _transfer(progress, 'download', nbytes))
+            else:
+                stream = _RangeStream(s3_client, bucket_name, s3_key, file_size, config.multipart_chunksize,
+                                      config.max_concurrency)
+                try:
+                    with open(local_file, 'wb') as f:
+                        shutil.copyfileobj(_DownloadReader(stream, progress, verifier), f,
+                                           config.multipart_chunksize)
+                    verifier.check()
+                except BaseException:
+                    # Leave no partial or corrupted archive behind
+                    if os.path.exists(local_file):
+                        os.remove(local_file)
+                    raise
+                finally:
+                    stream.close()
+        _log_throughput(progress, 'download', file_size, time.perf_counter() - start,
+                        config.multipart_chunksize if file_size >= config.multipart_threshold else None,
+                        config.max_concurrency)
         
-        print("\nDownload completed successfully!")
+        progress.message("Download completed successfully!")
         return f"File downloaded to {local_file}"
         
     except ClientError as e:
@@ -90,7 +922,169 @@ def download_from_s3(bucket_name, s3_key, local_file):
     except Exception as e:
         return f"Error downloading from S3: {str(e)}"
 
-def backup_to_s3(source_dir, bucket_name, s3_prefix=''):
+@tracked('stream_backup_to_s3')
+def stream_backup_to_s3(source_dir, bucket_name, s3_key, workers=1,
+                        part_size=64 * 1024 * 1024, max_inflight_parts=4, codec=None,
+                        adaptive=False, dedup=False, catalog=None, resume_dir=None,
+                        format='zip', progress=None):
+    """
+    Compress a directory straight into an S3 multipart upload
+    
+    No local archive is written: compressed data goes into a bounded buffer
+    and is uploaded part by part while compression continues. Checksums of
+    the archive, its files and its parts are computed on the way and stored
+    next to the archive as s3_key + '.checksums.json'.
+    
+    Args:
+        source_dir (str): Directory to backup
+        bucket_name (str): S3 bucket name
+        s3_key (str): S3 object key of the backup file
+        workers (int): Number of compression threads
+        part_size (int): Multipart part size in bytes (at least 5 MB)
+        max_inflight_parts (int): Parts buffered or uploading at the same time
+        codec (str): Compression codec, see backup.create_backup
+        adaptive (bool): Store already-compressed files without compressing them
+        dedup (bool): Store identical files and hard links once
+        catalog (str or BackupCatalog): Catalog to record the backup in, e.g.
+            catalog.DEFAULT_CATALOG; see catalog.BackupCatalog. None, the
+            default, records nothing
+        resume_dir (str): Directory for journals of the written members and
+            uploaded parts. If the same backup to the same key was
+            interrupted before, members already uploaded are not compressed
+            or uploaded again. None keeps no journals
+        format (str): 'zip', 'tar.zst[:level]' or 'tar.gz[:level]', see
+            backup.create_backup. Tar archives are never resumed
+        progress (Progress): Receives progress events and the run report
+    
+    Returns:
+        str: Success message or error message
+    """
+    try:
+        # Validate source directory
+        if not os.path.exists(source_dir):
+            return f"Error: Source directory '{source_dir}' does not exist"
+        
+        tar_format = get_tar_format(format)
+        if tar_format and (resume_dir is not None or dedup or adaptive or codec is not None):
+            return (f"Error: {tar_format.name} archives cannot be resumed or deduplicated and "
+                    f"take no codec or adaptive mode; set the level in format, e.g. '{tar_format.name}:19'")
+        
+        # Create S3 client with configured credentials
+        s3_client = aws_config.get_client()
+        
+        state_path = None
+        if resume_dir is not None:
+            os.makedirs(resume_dir, exist_ok=True)
+            state_path = os.path.join(resume_dir, os.path.basename(s3_key))
+        
+        progress.message(f"Streaming backup of {source_dir} to s3://{bucket_name}/{s3_key}")
+        start = time.perf_counter()
+        writer = S3MultipartWriter(s3_client, bucket_name, s3_key, part_size, max_inflight_parts, progress,
+                                   state_path=journal_path(state_path + '.upload') if state_path else None)
+        try:
+            if tar_format:
+                stats = write_tar_archive(source_dir, writer, tar_format, workers=workers, progress=progress)
+            else:
+                stats = write_backup_archive(source_dir, writer, workers=workers, codec=codec,
+                                             adaptive=adaptive, dedup=dedup,
+                                             checkpoint=journal_path(state_path) if state_path else None,
+                                             progress=progress)
+            writer.complete()
+            # Members stay journaled until the last part is in, it can still fail
+            if state_path and os.path.exists(journal_path(state_path)):
+                os.remove(journal_path(state_path))
+        except BaseException:
+            writer.abort()
+            raise
+        _log_throughput(progress, 'upload', writer.tell(), time.perf_counter() - start,
+                        part_size, max_inflight_parts)
+        put_checksums(s3_client, bucket_name, s3_key,
+                      checksums_document(stats, writer.tell(), writer.parts, part_size))
+        update_catalog(catalog, lambda c: c.record(
+            s3_key, os.path.abspath(source_dir), size=writer.tell(),
+            codec=tar_format.spec if tar_format else get_codec(codec).spec,
+            checksum=format_checksum(stats['algorithm'], stats['checksum']), members=stats['paths'],
+            bucket=bucket_name), progress)
+        
+        progress.message("Upload completed successfully!")
+        return f"File uploaded to s3://{bucket_name}/{s3_key}"
+        
+    except ClientError as e:
+        return f"AWS Error: {str(e)}"
+    except Exception as e:
+        return f"Error streaming backup to S3: {str(e)}"
+
+def _upload_shards(index_path, bucket_name, s3_key, transfer_config, progress):
+    """
+    Upload the shards of a sharded backup concurrently, then its index to s3_key
+    
+    The index goes last, so an index in S3 always has all of its shards.
+    
+    Returns:
+        str: Success message or the first error
+    """
+    s3_client = aws_config.get_client()
+    index = load_shard_index(index_path)
+    parallel, shard_config = _shard_transfers(index['shards'], transfer_config)
+    
+    def upload_shard(shard):
+        local_file = os.path.join(os.path.dirname(index_path), shard['name'])
+        key = _shard_key(s3_key, shard)
+        result = upload_to_s3(local_file, bucket_name, key, shard_config,
+                              progress=progress.part(shard['name']))
+        if result.startswith('File uploaded'):
+            put_checksums(s3_client, bucket_name, key, load_checksums(local_file))
+        return result
+    
+    progress.message(f"Uploading {len(index['shards'])} shards, {parallel} at a time")
+    with progress.phase('upload'), ThreadPoolExecutor(max_workers=parallel) as executor:
+        results = list(executor.map(upload_shard, index['shards']))
+    failed = [result for result in results if not result.startswith('File uploaded')]
+    if failed:
+        return failed[0]
+    s3_client.put_object(Bucket=bucket_name, Key=s3_key, Body=json.dumps(index).encode(),
+                         ContentType='application/json')
+    return f"File uploaded to s3://{bucket_name}/{s3_key}"
+
+# Records the finished archive backup_to_s3 is uploading, so a resumed run uploads it
+PENDING_UPLOAD = 'pending_upload.json'
+
+def _unfinished_upload(temp_backup_dir, source_dir, bucket_name, s3_prefix, stream):
+    """
+    Find the archive an interrupted backup_to_s3 of the same source and target left
+    
+    Returns:
+        str: Archive file name, or None
+    """
+    if stream:
+        pattern = os.path.join(glob.escape(temp_backup_dir),
+                               f"backup_{glob.escape(os.path.basename(source_dir))}_*.zip.upload.journal")
+        for path in sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True):
+            name = os.path.basename(path)[:-len('.upload.journal')]
+            with open(path) as f:
+                try:
+                    header = json.loads(f.readline())
+                except ValueError:
+                    continue
+            if header.get('bucket') == bucket_name and header.get('key') == os.path.join(s3_prefix, name):
+                return name
+        return None
+    try:
+        with open(os.path.join(temp_backup_dir, PENDING_UPLOAD)) as f:
+            pending = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (pending.get('source') == os.path.abspath(source_dir) and pending.get('bucket') == bucket_name
+            and pending.get('prefix') == s3_prefix
+            and os.path.exists(os.path.join(temp_backup_dir, pending['archive']))):
+        return pending['archive']
+    return None
+
+@tracked('backup_to_s3')
+def backup_to_s3(source_dir, bucket_name, s3_prefix='', stream=False, workers=1,
+                 part_size=64 * 1024 * 1024, max_inflight_parts=4, codec=None, adaptive=False,
+                 dedup=False, transfer_config=None, catalog=None, resume=False, shard_size=None,
+                 shard_files=None, format='zip', progress=None):
     """
     Create a backup and upload it to S3
     
@@ -98,23 +1092,92 @@ def backup_to_s3(source_dir, bucket_name, s3_prefix=''):
         source_dir (str): Directory to backup
         bucket_name (str): S3 bucket name
         s3_prefix (str): Prefix for S3 key (like a folder path)
+        stream (bool): Upload while compressing instead of going through a
+            temporary archive in ./temp_backup
+        workers (int): Number of compression threads
+        part_size (int): Multipart part size in bytes when streaming
+        max_inflight_parts (int): Parts buffered or uploading at once when streaming
+        codec (str): Compression codec, see backup.create_backup
+        adaptive (bool): Store already-compressed files without compressing them
+        dedup (bool): Store identical files and hard links once
+        transfer_config (dict): Transfer settings for the upload of the
+            temporary archive, see upload_to_s3
+        catalog (str or BackupCatalog): Catalog to record the backup in, e.g.
+            catalog.DEFAULT_CATALOG; see catalog.BackupCatalog. None, the
+            default, records nothing
+        resume (bool): Checkpoint the archive and the upload in ./temp_backup.
+            Calling again after a failure or crash completes the interrupted
+            backup, under the same key, instead of starting over
+        shard_size (int): Write the backup as ZIP shards of about this many
+            bytes of files each, see backup.write_sharded_backup. The shards
+            are uploaded concurrently, sharing the transfer concurrency, and
+            their index last; restore_from_s3 takes the index's key
+        shard_files (int): Write the backup as ZIP shards of at most this
+            many files each. Sharded backups are neither streamed nor resumed
+        format (str): 'zip', 'tar.zst[:level]' or 'tar.gz[:level]', see
+            backup.create_backup. Tar archives need no seekable output,
+            so with stream they go straight into the upload as well
+        progress (Progress): Receives progress events and the run report
     
     Returns:
         str: Success message or error message
     """
     try:
-        # First create local backup
+        if stream and (shard_size or shard_files):
+            return "Error: Sharded backups cannot be streamed"
+        tar_format = get_tar_format(format)
         temp_backup_dir = './temp_backup'
-        backup_file = create_backup(source_dir, temp_backup_dir)
+        unfinished = _unfinished_upload(temp_backup_dir, source_dir, bucket_name, s3_prefix,
+                                        stream) if resume else None
+        
+        if stream:
+            extension = tar_format.extension if tar_format else '.zip'
+            s3_key = os.path.join(s3_prefix, unfinished or backup_file_name(source_dir, extension))
+            return stream_backup_to_s3(source_dir, bucket_name, s3_key, workers,
+                                       part_size, max_inflight_parts, codec, adaptive, dedup,
+                                       catalog, temp_backup_dir if resume else None, format,
+                                       progress=progress)
         
-        if isinstance(backup_file, str) and backup_file.startswith('Error'):
-            return backup_file
+        if unfinished:
+            # The archive is complete, only its upload was interrupted
+            backup_file = os.path.join(temp_backup_dir, unfinished)
+            progress.message(f"Resuming upload of {backup_file}")
+        else:
+            # First create local backup
+            backup_file = create_backup(source_dir, temp_backup_dir, workers=workers, codec=codec,
+                                        adaptive=adaptive, dedup=dedup, catalog=catalog, resume=resume,
+                                        shard_size=shard_size, shard_files=shard_files, format=format,
+                                        progress=progress)
+            
+            if isinstance(backup_file, str) and backup_file.startswith('Error'):
+                return backup_file
+            
+            if resume:
+                with open(os.path.join(temp_backup_dir, PENDING_UPLOAD), 'w') as f:
+                    json.dump({'archive': os.path.basename(backup_file), 'source': os.path.abspath(source_dir),
+                               'bucket': bucket_name, 'prefix': s3_prefix}, f)
         
         # Generate S3 key
         s3_key = os.path.join(s3_prefix, os.path.basename(backup_file))
         
         # Upload to S3
-        result = upload_to_s3(backup_file, bucket_name, s3_key)
+        if is_shard_index(backup_file):
+            result = _upload_shards(backup_file, bucket_name, s3_key, transfer_config, progress)
+        else:
+            result = upload_to_s3(backup_file, bucket_name, s3_key, transfer_config, resume,
+                                  progress=progress)
+        
+        # The catalog entry follows the archive from the temporary file to S3
+        if result.startswith('File uploaded'):
+            checksums = load_checksums(backup_file)
+            if checksums is not None:
+                put_checksums(aws_config.get_client(), bucket_name, s3_key, checksums)
+            update_catalog(catalog, lambda c: c.relocate(backup_file, s3_key, bucket_name), progress)
+        elif resume:
+            # Keep the archive and its journals for the next attempt
+            return result
+        else:
+            update_catalog(catalog, lambda c: c.remove(backup_file), progress)
         
         # Cleanup temporary files
         shutil.rmtree(temp_backup_dir, ignore_errors=True)
@@ -124,32 +1187,267 @@ def backup_to_s3(source_dir, bucket_name, s3_prefix=''):
     except Exception as e:
         return f"Error in backup to S3: {str(e)}"
 
-def restore_from_s3(bucket_name, s3_key, restore_dir):
+def _stream_extract(s3_client, bucket_name, s3_key, restore_dir, workers, paths, progress):
+    """
+    Extract the members of an archive in S3 that paths select, from ranged GETs
+    
+    Paths the archive stored as references are left to restore_links.
+    A full restore reads every byte anyway, so when the archive has a
+    recorded digest it is fetched front to back in parallel ranges instead
+    of member by member, and checked against the digest and part checksums
+    on the way through extract_in_order.
+    
+    Returns:
+        tuple: (number of members and links selected, links, extra), like
+            backup.extract_archive
+    
+    Raises:
+        RuntimeError: If members failed to extract
+        integrity.ChecksumError: If the archive does not match its checksums
+    """
+    # Read the central directory only
+    reader = S3RangeReader(s3_client, bucket_name, s3_key)
+    with zipfile.ZipFile(reader) as zipf:
+        members, links, extra = select_restore_set(zipf, paths)
+        spans = _member_spans(zipf)
+    if paths is not None and not members and not links:
+        return 0, links, extra
+    checksums = get_checksums(s3_client, bucket_name, s3_key)
+    verifier = archive_verifier(checksums, s3_key) if paths is None else None
+    
+    # Create restore directory if it doesn't exist
+    os.makedirs(restore_dir, exist_ok=True)
+    
+    progress.message(f"Streaming s3://{bucket_name}/{s3_key} to: {restore_dir}")
+    progress.set_total(len(members), sum(info.compress_size for info in members))
+    start = time.perf_counter()
+    if verifier is None:
+        errors = extract_parallel(
+            members,
+            lambda info: _extract_member_from_range(reader, info, spans[info.filename], restore_dir,
+                                                    checksums, progress),
+            restore_dir, workers, progress)
+        downloaded = sum(end - begin for begin, end in (spans[info.filename] for info in members))
+    else:
+        stream = _RangeStream(s3_client, bucket_name, s3_key, reader.size,
+                              aws_config.get_transfer_config(reader.size).multipart_chunksize, workers)
+        try:
+            errors = extract_in_order(_DownloadReader(stream, progress, verifier), members, spans,
+                                      restore_dir, checksums, progress)
+        finally:
+            stream.close()
+        verifier.check()
+        downloaded = reader.size
+    if errors:
+        names = ', '.join(info.filename for info, _ in errors[:5])
+        raise RuntimeError(f"{len(errors)} members failed ({names})")
+    progress.count('verified_files', count_verified(checksums, members))
+    _log_throughput(progress, 'download', downloaded, time.perf_counter() - start,
+                    concurrency=workers)
+    return len(members) + len(links), links, extra
+
+@tracked('stream_restore_from_s3')
+def stream_restore_from_s3(bucket_name, s3_key, restore_dir, workers=8, paths=None,
+                           link_duplicates=False, progress=None):
+    """
+    Restore a backup straight from S3 without downloading the archive first
+    
+    The central directory is read with ranged GETs, then the members' byte
+    ranges are fetched in parallel through extract_parallel and each file is
+    written as its bytes arrive. Files are verified against the checksums
+    stored next to the archive while they are written, so a corrupted
+    member fails without a second pass over the data. Full restores also
+    check the archive digest and part checksums, see _stream_extract;
+    selective restores read too little of the archive for that. Tar
+    backups are read from the body of a single GET instead, and checked
+    whole, see _stream_tar_extract.
+    
+    Args:
+        bucket_name (str): S3 bucket name
+        s3_key (str): S3 object key of the backup file
+        restore_dir (str): Directory where to restore the backup
+        workers (int): Number of members fetched at the same time
+        paths (list): Only restore these paths, directories or glob patterns.
+            None restores everything
+        link_duplicates (bool): Hard link files a deduplicated backup stored once
+        progress (Progress): Receives progress events and the run report
+    
+    Returns:
+        str: Success message or error message
+    """
+    try:
+        # Create S3 client with configured credentials
+        s3_client = aws_config.get_client()
+        
+        if is_tar_archive(s3_key):
+            count, links, extra = _stream_tar_extract(s3_client, bucket_name, s3_key, restore_dir, paths,
+                                                      progress)
+        else:
+            count, links, extra = _stream_extract(s3_client, bucket_name, s3_key, restore_dir, workers,
+                                                  paths, progress)
+        if paths is not None and not count:
+            return f"Error: No files in s3://{bucket_name}/{s3_key} match {paths}"
+        restore_links(links, restore_dir, extra, link_duplicates)
+        progress.count('linked_files', len(links))
+        
+        progress.message("Restore completed successfully!")
+        return f"Backup restored to: {restore_dir}"
+        
+    except ClientError as e:
+        return f"AWS Error: {str(e)}"
+    except Exception as e:
+        return f"Error in streaming restore from S3: {str(e)}"
+
+def _restore_shards_from_s3(bucket_name, s3_key, restore_dir, stream, workers, paths, link_duplicates,
+                            transfer_config, progress):
+    """
+    Restore a sharded backup from S3, fetching and extracting several shards at a time
+    
+    Only the shards whose path range paths can select are read. Each shard
+    is streamed like stream_restore_from_s3, or downloaded to a private
+    temporary directory, extracted and deleted again, so at most one
+    downloaded shard per worker is on disk at any time. The directory is
+    removed whether or not every shard succeeds.
+    
+    Returns:
+        str: Success message or error message
+    """
+    s3_client = aws_config.get_client()
+    index = get_shard_index(s3_client, bucket_name, s3_key)
+    selected = select_shards(index, paths)
+    parallel, shard_config = _shard_transfers(selected, transfer_config, workers)
+    shard_workers = max(1, workers // parallel)
+    os.makedirs(restore_dir, exist_ok=True)
+    
+    def restore_shard(shard):
+        key = _shard_key(s3_key, shard)
+        part = progress.part(shard['name'])
+        if stream or paths is not None:
+            return _stream_extract(s3_client, bucket_name, key, restore_dir, shard_workers, paths, part)
+        local_file = os.path.join(temp_download_dir, shard['name'])
+        checksums = get_checksums(s3_client, bucket_name, key)
+        result = download_from_s3(bucket_name, key, local_file, shard_config, checksums, progress=part)
+        if not result.startswith('File downloaded'):
+            raise RuntimeError(result)
+        try:
+            if checksums is not None:
+                save_checksums(local_file, checksums)
+            return extract_archive(local_file, restore_dir, shard_workers, progress=part)
+        finally:
+            for path in (local_file, checksums_path(local_file)):
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    progress.message(f"Restoring {len(selected)} of {len(index['shards'])} shards to: {restore_dir}, "
+                     f"{parallel} at a time")
+    temp_download_dir = tempfile.mkdtemp(prefix='restore_')
+    try:
+        with progress.phase('restore'), ThreadPoolExecutor(max_workers=parallel) as executor:
+            restored = list(executor.map(restore_shard, selected))
+    finally:
+        # Cleanup temporary files
+        shutil.rmtree(temp_download_dir, ignore_errors=True)
+    # Extra targets are removed only once every shard is extracted
+    matched = 0
+    for count, links, extra in restored:
+        matched += count
+        restore_links(links, restore_dir, extra, link_duplicates)
+        progress.count('linked_files', len(links))
+    if paths is not None and not matched:
+        return f"Error: No files in s3://{bucket_name}/{s3_key} match {paths}"
+    
+    progress.message("Restore completed successfully!")
+    return f"Backup restored to: {restore_dir}"
+
+def _stream_tar_extract(s3_client, bucket_name, s3_key, restore_dir, paths, progress):
+    """
+    Extract a tar backup in S3 from one GET, as its body arrives
+    
+    The archive is read once from start to end, nothing is written but the
+    restored files. Selecting paths saves disk writes, not downloads. The
+    bytes are checked against the archive digest and part checksums as
+    they arrive, including the index trailer tarfile stops short of.
+    
+    Returns:
+        tuple: (number of files extracted, {}, set()), like _stream_extract
+    
+    Raises:
+        integrity.ChecksumError: If the archive does not match its checksums
+    """
+    os.makedirs(restore_dir, exist_ok=True)
+    verifier = archive_verifier(get_checksums(s3_client, bucket_name, s3_key), s3_key)
+    progress.message(f"Streaming s3://{bucket_name}/{s3_key} to: {restore_dir}")
+    start = time.perf_counter()
+    body = s3_client.get_object(Bucket=bucket_name, Key=s3_key)['Body']
+    reader = _DownloadReader(body, progress, verifier)
+    try:
+        restored = extract_tar_stream(reader, restore_dir, paths, progress=progress)
+        if verifier is not None:
+            _drain(reader)
+            verifier.check()
+    finally:
+        body.close()
+    _log_throughput(progress, 'download', reader.nbytes, time.perf_counter() - start)
+    return restored
+
+@tracked('restore_from_s3')
+def restore_from_s3(bucket_name, s3_key, restore_dir, stream=False, workers=8, paths=None,
+                    link_duplicates=False, transfer_config=None, progress=None):
     """
     Download backup from S3 and restore it
     
+    Tar backups (s3_key ending in .tar.zst or .tar.gz) are always streamed,
+    from the body of a single GET, with no temporary file.
+    
     Args:
         bucket_name (str): S3 bucket name
         s3_key (str): S3 object key of the backup file
         restore_dir (str): Directory where to restore the backup
+        stream (bool): Extract members straight from ranged GETs instead of
+            downloading the archive to ./temp_download first
+        workers (int): Number of members fetched in parallel when streaming.
+            For a sharded backup (s3_key names its index) also the number of
+            shards fetched and extracted at the same time
+        paths (list): Only restore these paths, directories or glob patterns.
+            Selective restores always use ranged GETs, so only the central
+            directory and the matching members are downloaded
+        link_duplicates (bool): Hard link files a deduplicated backup stored once
+        transfer_config (dict): Transfer settings for downloading the archive,
+            see upload_to_s3
+        progress (Progress): Receives progress events and the run report
     
     Returns:
         str: Success message or error message
     """
     try:
+        if is_shard_index(s3_key):
+            return _restore_shards_from_s3(bucket_name, s3_key, restore_dir, stream, workers, paths,
+                                           link_duplicates, transfer_config, progress)
+        
+        if stream or paths is not None or is_tar_archive(s3_key):
+            return stream_restore_from_s3(bucket_name, s3_key, restore_dir, workers, paths,
+                                          link_duplicates, progress=progress)
+        
         # Create temporary directory for download
         temp_download_dir = './temp_download'
         os.makedirs(temp_download_dir, exist_ok=True)
         
-        # Download file
+        # Download file, checking the archive against its checksums on the way
+        checksums = get_checksums(aws_config.get_client(), bucket_name, s3_key)
         local_file = os.path.join(temp_download_dir, os.path.basename(s3_key))
-        download_result = download_from_s3(bucket_name, s3_key, local_file)
+        download_result = download_from_s3(bucket_name, s3_key, local_file, transfer_config, checksums,
+                                           progress=progress)
         
-        if download_result.startswith('Error'):
+        if 'Error' in download_result.split(':', 1)[0]:
             return download_result
         
+        # restore_backup verifies the files against checksums found next to the archive
+        if checksums is not None:
+            save_checksums(local_file, checksums)
+        
         # Restore from downloaded file
-        result = restore_backup(local_file, restore_dir)
+        result = restore_backup(local_file, restore_dir, link_duplicates=link_duplicates,
+                                progress=progress)
         
         # Cleanup temporary files
         shutil.rmtree(temp_download_dir, ignore_errors=True)
@@ -159,6 +1457,493 @@ def restore_from_s3(bucket_name, s3_key, restore_dir):
     except Exception as e:
         return f"Error in restore from S3: {str(e)}"
 
+def _catalog_entry(s3_client, bucket_name, s3_key):
+    """
+    Read source, codec and member list of an archive in S3 from its central directory
+    
+    The entry of a sharded backup is put together from its index and the
+    central directories of its shards, that of a tar backup from the index
+    at its end.
+    
+    Returns:
+        tuple: (source, codec, members, size), size None for a single archive
+    """
+    if is_shard_index(s3_key):
+        index = get_shard_index(s3_client, bucket_name, s3_key)
+        members = []
+        for shard in index['shards']:
+            members += _catalog_entry(s3_client, bucket_name, _shard_key(s3_key, shard))[2]
+        return index['source'], index['codec'], members, index['size']
+    if is_tar_archive(s3_key):
+        index = read_tar_index(S3RangeReader(s3_client, bucket_name, s3_key))
+        return index['source'], index['format'], [(name, size) for name, size, _, _ in index['members']], None
+    with zipfile.ZipFile(S3RangeReader(s3_client, bucket_name, s3_key)) as zipf:
+        metadata = archive_metadata(zipf)
+        sizes = {info.filename: info.file_size for info in zipf.infolist()
+                 if not info.is_dir() and info.filename != metadata.get('links')}
+        links = read_links(zipf)
+    members = list(sizes.items())
+    members += [(name, sizes.get(link['target'])) for name, link in links.items()]
+    return metadata.get('source'), metadata.get('codec'), members, None
+
+@tracked('resync_catalog')
+def resync_catalog(bucket_name, s3_prefix='', catalog=DEFAULT_CATALOG, max_age=None, workers=8,
+                   progress=None):
+    """
+    Bring the backup catalog in line with the archives in S3
+    
+    One listing of the prefix finds archives the catalog does not know,
+    e.g. ones written from another machine, and entries whose archive is
+    gone. New archives are catalogued from their central directory, read
+    with ranged GETs; their checksum stays unknown.
+    
+    Args:
+        bucket_name (str): S3 bucket name
+        s3_prefix (str): Only resync archives below this prefix
+        catalog (str or BackupCatalog): Catalog to update, by default the
+            per-user catalog.DEFAULT_CATALOG
+        max_age (float): Skip the resync if the prefix was resynced less than
+            this many seconds ago. None always resyncs
+        workers (int): Number of archives read at the same time
+        progress (Progress): Receives progress events and the run report
+    
+    Returns:
+        str: Success message or error message
+    """
+    try:
+        if catalog is None:
+            return "Error: No catalog to resync"
+        opened = open_catalog(catalog)
+        try:
+            last = opened.last_resync(bucket_name, s3_prefix)
+            if max_age is not None and last is not None and time.time() - last < max_age:
+                return f"Catalog of s3://{bucket_name}/{s3_prefix} is up to date"
+            
+            # Create S3 client with configured credentials
+            s3_client = aws_config.get_client()
+            
+            started = time.time()
+            with progress.phase('list'):
+                # Shards are catalogued through their index
+                remote = {key: info for key, info in _list_prefix(s3_client, bucket_name, s3_prefix).items()
+                          if (key.endswith('.zip') and not is_shard(key)) or is_shard_index(key)
+                          or is_tar_archive(key)}
+            known = opened.keys(bucket_name, s3_prefix)
+            missing = sorted(set(remote) - known)
+            gone = known - set(remote)
+            
+            def read_entry(key):
+                try:
+                    return key, _catalog_entry(s3_client, bucket_name, key)
+                except (zipfile.BadZipFile, EOFError, ValueError) as e:
+                    progress.message(f"Skipping s3://{bucket_name}/{key}: {str(e)}")
+                    return key, None
+            
+            added = 0
+            with progress.phase('read'), ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                for key, entry in executor.map(read_entry, missing):
+                    if entry is not None:
+                        source, codec, members, size = entry
+                        listed_size, modified = remote[key]
+                        opened.record(key, source, modified, size if size is not None else listed_size, codec,
+                                      members=members, bucket=bucket_name)
+                        added += 1
+            for key in gone:
+                opened.remove(key, bucket_name)
+            opened.mark_resynced(bucket_name, s3_prefix, started)
+        finally:
+            if opened is not catalog:
+                opened.close()
+        
+        progress.count('catalog_added', added)
+        progress.count('catalog_removed', len(gone))
+        return f"Catalog of s3://{bucket_name}/{s3_prefix} resynced: {added} added, {len(gone)} removed"
+        
+    except ClientError as e:
+        return f"AWS Error: {str(e)}"
+    except Exception as e:
+        return f"Error resyncing catalog: {str(e)}"
+
+def _journaled_uploads(state_dirs):
+    """Return the upload ids recorded in the upload journals found in state_dirs"""
+    upload_ids = set()
+    for state_dir in state_dirs:
+        for path in glob.glob(os.path.join(glob.escape(state_dir), '*.upload' + journal_path(''))):
+            try:
+                with open(path) as f:
+                    f.readline()
+                    upload_ids.add(json.loads(f.readline())['upload_id'])
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+    return upload_ids
+
+@tracked('cleanup_multipart_uploads')
+def cleanup_multipart_uploads(bucket_name, s3_prefix='', older_than=24 * 60 * 60,
+                              state_dirs=('./temp_backup',), dry_run=False, progress=None):
+    """
+    Abort multipart uploads left open by interrupted backups
+    
+    Resumable uploads keep their multipart upload open when they fail, and a
+    crashed process leaves its upload open too. S3 bills the parts until the
+    upload is completed or aborted. Uploads whose journal is still in one of
+    state_dirs are kept, since a resumed run will complete them.
+    
+    Args:
+        bucket_name (str): S3 bucket name
+        s3_prefix (str): Only consider uploads below this prefix
+        older_than (float): Only abort uploads started at least this many
+            seconds ago, so running uploads are left alone
+        state_dirs (tuple): Directories holding upload journals
+        dry_run (bool): Only report what would be aborted
+        progress (Progress): Receives progress events and the run report
+    
+    Returns:
+        str: Success message or error message
+    """
+    try:
+        # Create S3 client with configured credentials
+        s3_client = aws_config.get_client()
+        
+        keep = _journaled_uploads(state_dirs)
+        cutoff = time.time() - older_than
+        aborted = kept = 0
+        paginator = s3_client.get_paginator('list_multipart_uploads')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=s3_prefix):
+            for upload in page.get('Uploads', []):
+                if upload['UploadId'] in keep or upload['Initiated'].timestamp() > cutoff:
+                    kept += 1
+                    continue
+                progress.message(f"{'Would abort' if dry_run else 'Aborting'} upload of "
+                                 f"s3://{bucket_name}/{upload['Key']} started {upload['Initiated']}")
+                if not dry_run:
+                    s3_client.abort_multipart_upload(Bucket=bucket_name, Key=upload['Key'],
+                                                     UploadId=upload['UploadId'])
+                aborted += 1
+        
+        progress.count('uploads_aborted', 0 if dry_run else aborted)
+        verb = 'would be aborted' if dry_run else 'aborted'
+        return f"Multipart uploads in s3://{bucket_name}/{s3_prefix}: {aborted} {verb}, {kept} kept"
+        
+    except ClientError as e:
+        return f"AWS Error: {str(e)}"
+    except Exception as e:
+        return f"Error cleaning up multipart uploads: {str(e)}"
+
+def _repo_key(s3_prefix, *parts):
+    """Build the S3 key of a repository file below s3_prefix"""
+    prefix = s3_prefix.strip('/')
+    return '/'.join(([prefix] if prefix else []) + list(parts))
+
+def _sync_repo_metadata(s3_client, bucket_name, s3_prefix, cache_dir, folders):
+    """
+    Download repository metadata files missing from the local cache
+    
+    Args:
+        s3_client: boto3 S3 client
+        bucket_name (str): S3 bucket name
+        s3_prefix (str): Prefix the repository lives under
+        cache_dir (str): Local repository cache
+        folders (list): Repository folders to sync, e.g. ['index']
+    
+    Returns:
+        dict: Folder -> list of file names present in S3
+    """
+    remote = {}
+    try:
+        s3_client.download_file(bucket_name, _repo_key(s3_prefix, 'config.json'),
+                                os.path.join(cache_dir, 'config.json'))
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+            raise
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for folder in folders:
+        os.makedirs(os.path.join(cache_dir, folder), exist_ok=True)
+        remote[folder] = []
+        folder_prefix = _repo_key(s3_prefix, folder) + '/'
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=folder_prefix):
+            for obj in page.get('Contents', []):
+                name = obj['Key'][len(folder_prefix):]
+                remote[folder].append(name)
+                local_file = os.path.join(cache_dir, folder, name)
+                if not os.path.exists(local_file):
+                    s3_client.download_file(bucket_name, obj['Key'], local_file)
+    return remote
+
+@tracked('backup_repo_to_s3')
+def backup_repo_to_s3(source_dir, bucket_name, s3_prefix='', cache_dir='./repo_cache', progress=None):
+    """
+    Back up a directory into a deduplicating chunk repository stored in S3
+    
+    Only the repository index is kept in cache_dir. New packs are uploaded
+    and then removed locally, so each run uploads just the chunks S3 does
+    not have yet, plus a small snapshot file.
+    
+    Args:
+        source_dir (str): Directory to backup
+        bucket_name (str): S3 bucket name
+        s3_prefix (str): Prefix the repository lives under
+        cache_dir (str): Local directory holding the repository index
+        progress (Progress): Receives progress events and the run report
+    
+    Returns:
+        str: Success message or error message
+    """
+    try:
+        s3_client = aws_config.get_client()
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        # Fetch the chunk index so known chunks are not stored again
+        _sync_repo_metadata(s3_client, bucket_name, s3_prefix, cache_dir, ['index'])
+        
+        snapshot_id = create_repo_backup(source_dir, cache_dir, progress=progress)
+        if snapshot_id.startswith('Error'):
+            return snapshot_id
+        
+        # Upload packs before their index and the snapshot, so S3 never
+        # references data it does not have
+        pack_dir = os.path.join(cache_dir, 'packs')
+        packs = [name for name in os.listdir(pack_dir) if name.endswith('.pack')]
+        with progress.phase('upload'):
+            for name in packs:
+                progress.message(f"Uploading pack {name}")
+                s3_client.upload_file(os.path.join(pack_dir, name), bucket_name,
+                                      _repo_key(s3_prefix, 'packs', name),
+                                      Callback=lambda nbytes: _transfer(progress, 'upload', nbytes))
+        for name in packs:
+            index_name = name[:-len('.pack')] + '.json'
+            s3_client.upload_file(os.path.join(cache_dir, 'index', index_name), bucket_name,
+                                  _repo_key(s3_prefix, 'index', index_name))
+        s3_client.upload_file(os.path.join(cache_dir, 'config.json'), bucket_name,
+                              _repo_key(s3_prefix, 'config.json'))
+        snapshot_name = f"{snapshot_id}.json"
+        s3_client.upload_file(os.path.join(cache_dir, 'snapshots', snapshot_name), bucket_name,
+                              _repo_key(s3_prefix, 'snapshots', snapshot_name))
+        
+        # Packs are now in S3; keep only the index locally
+        for name in packs:
+            os.remove(os.path.join(pack_dir, name))
+        
+        progress.message("Upload completed successfully!")
+        return f"Snapshot {snapshot_id} uploaded to s3://{bucket_name}/{_repo_key(s3_prefix)} ({len(packs)} new packs)"
+        
+    except ClientError as e:
+        return f"AWS Error: {str(e)}"
+    except Exception as e:
+        return f"Error in repository backup to S3: {str(e)}"
+
+@tracked('restore_repo_from_s3')
+def restore_repo_from_s3(bucket_name, restore_dir, s3_prefix='', snapshot_id=None, cache_dir='./repo_cache',
+                         progress=None):
+    """
+    Restore a snapshot from a deduplicating chunk repository stored in S3
+    
+    Only the packs referenced by the snapshot are downloaded.
+    
+    Args:
+        bucket_name (str): S3 bucket name
+        restore_dir (str): Directory where to restore the snapshot
+        s3_prefix (str): Prefix the repository lives under
+        snapshot_id (str): Snapshot to restore. None restores the latest one
+        cache_dir (str): Local directory holding the repository index
+        progress (Progress): Receives progress events and the run report
+    
+    Returns:
+        str: Success message or error message
+    """
+    try:
+        s3_client = aws_config.get_client()
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        remote = _sync_repo_metadata(s3_client, bucket_name, s3_prefix, cache_dir, ['index', 'snapshots'])
+        if not remote['snapshots']:
+            return f"Error: No snapshots found in s3://{bucket_name}/{_repo_key(s3_prefix)}"
+        
+        # Download just the packs this snapshot needs
+        with ChunkRepository(cache_dir) as repo:
+            snapshot_id, snapshot = repo.load_snapshot(snapshot_id)
+            needed = repo.packs_for(snapshot)
+        pack_dir = os.path.join(cache_dir, 'packs')
+        downloaded = []
+        with progress.phase('download'):
+            for pack_id in sorted(needed):
+                local_file = os.path.join(pack_dir, f"{pack_id}.pack")
+                if not os.path.exists(local_file):
+                    progress.message(f"Downloading pack {pack_id}.pack")
+                    s3_client.download_file(bucket_name, _repo_key(s3_prefix, 'packs', f"{pack_id}.pack"), local_file,
+                                            Callback=lambda nbytes: _transfer(progress, 'download', nbytes))
+                    downloaded.append(local_file)
+        
+        result = restore_repo_backup(cache_dir, restore_dir, snapshot_id, progress=progress)
+        
+        # Cleanup downloaded packs
+        for local_file in downloaded:
+            os.remove(local_file)
+        
+        return result
+        
+    except ClientError as e:
+        return f"AWS Error: {str(e)}"
+    except Exception as e:
+        return f"Error in repository restore from S3: {str(e)}"
+
+# Objects sync_to_s3 deletes per delete_objects request (the S3 maximum)
+DELETE_BATCH_SIZE = 1000
+
+def _list_prefix(s3_client, bucket_name, prefix):
+    """Return key -> (size, last modified) for every object below prefix"""
+    objects = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            objects[obj['Key']] = (obj['Size'], obj['LastModified'].timestamp())
+    return objects
+
+def _sync_needs_upload(s3_client, bucket_name, key, entry, remote, use_checksum):
+    """
+    Decide whether a local file differs from its object
+    
+    Missing objects and size changes always upload. Otherwise the file is
+    up to date only if its mtime equals the one recorded in the object's
+    metadata, or with use_checksum, only if its SHA-256 equals the recorded
+    one. The object's LastModified is not used: a file restored or copied
+    with its original mtime can be older than its object and still differ.
+    """
+    if remote is None or remote[0] != entry.stat.st_size:
+        return True
+    metadata = s3_client.head_object(Bucket=bucket_name, Key=key).get('Metadata', {})
+    if use_checksum:
+        return metadata.get('sha256') != hash_file(entry.path)
+    return metadata.get('mtime') != str(entry.stat.st_mtime_ns)
+
+def _sync_upload(s3_client, bucket_name, key, entry, use_checksum, transfer_config):
+    """Upload one file, recording its mtime and SHA-256 as object metadata"""
+    metadata = {'mtime': str(entry.stat.st_mtime_ns)}
+    if entry.stat.st_size < transfer_config.multipart_threshold:
+        # One PUT per small file; the transfer manager would cost more than the upload
+        with open_throttled(entry.path) as f:
+            data = f.read()
+        metadata['sha256'] = hashlib.sha256(data).hexdigest()
+        limiter.throttle('upload', len(data))
+        s3_client.put_object(Bucket=bucket_name, Key=key, Body=data, Metadata=metadata)
+    else:
+        if use_checksum:
+            metadata['sha256'] = hash_file(entry.path)
+        s3_client.upload_file(entry.path, bucket_name, key, Config=transfer_config,
+                              ExtraArgs={'Metadata': metadata},
+                              Callback=lambda nbytes: limiter.throttle('upload', nbytes))
+
+@tracked('sync_to_s3')
+def sync_to_s3(source_dir, bucket_name, s3_prefix='', workers=None, delete=False, use_checksum=False,
+               dry_run=False, transfer_config=None, progress=None):
+    """
+    Mirror a directory to S3 as one object per file
+    
+    The tree is compared with a single listing of the prefix: new files
+    and files whose size changed are uploaded. Files of the same size are
+    uploaded if their mtime differs from the one recorded on their object
+    (one HEAD each); everything else is skipped. Uploads run on a
+    bounded pool sharing one client, small files as a single PUT each,
+    so many small files are limited by bandwidth rather than round trips.
+    
+    Args:
+        source_dir (str): Directory to mirror
+        bucket_name (str): S3 bucket name
+        s3_prefix (str): Prefix the tree is mirrored under
+        workers (int): Concurrent uploads. None uses the client's
+            connection pool size (see AWSConfig)
+        delete (bool): Delete objects below s3_prefix whose file no longer
+            exists, in batches of DELETE_BATCH_SIZE
+        use_checksum (bool): For files that kept their size, compare SHA-256
+            with the object's metadata instead of the mtime
+        dry_run (bool): Only report what would be uploaded and deleted
+        transfer_config (dict): Settings for files above the multipart
+            threshold, see upload_to_s3
+        progress (Progress): Receives progress events and the run report
+    
+    Returns:
+        str: Summary message or error message
+    """
+    try:
+        # Validate source directory
+        if not os.path.isdir(source_dir):
+            return f"Error: Source directory '{source_dir}' does not exist"
+        
+        s3_client = aws_config.get_client()
+        workers = workers or aws_config.pool_size()
+        config = aws_config.get_transfer_config(**(transfer_config or {}))
+        prefix = _repo_key(s3_prefix) + '/' if s3_prefix.strip('/') else ''
+        
+        with progress.phase('scan'):
+            local = {prefix + entry.relpath.replace(os.sep, '/'): entry
+                     for entry in iter_files(source_dir, workers)}
+        with progress.phase('list'):
+            remote = _list_prefix(s3_client, bucket_name, prefix)
+        progress.message(f"Syncing {source_dir} ({len(local)} files) to s3://{bucket_name}/{prefix} "
+                         f"({len(remote)} objects)")
+        
+        def sync_file(key, entry):
+            if not _sync_needs_upload(s3_client, bucket_name, key, entry, remote.get(key), use_checksum):
+                return False
+            if not dry_run:
+                _sync_upload(s3_client, bucket_name, key, entry, use_checksum, config)
+            return True
+        
+        # Bound the queued uploads so huge trees do not pile up futures
+        slots = threading.BoundedSemaphore(workers * 4)
+        lock = threading.Lock()
+        uploaded = 0
+        uploaded_bytes = 0
+        errors = []
+        start = time.perf_counter()
+        
+        def done(future, key, entry):
+            nonlocal uploaded, uploaded_bytes
+            slots.release()
+            error = future.exception()
+            with lock:
+                if error is not None:
+                    errors.append((key, error))
+                elif future.result():
+                    uploaded += 1
+                    uploaded_bytes += entry.stat.st_size
+            if error is None and not future.result():
+                progress.count('unchanged_files')
+            progress.file_done(key, entry.stat.st_size, entry.stat.st_size, error)
+        
+        progress.set_total(len(local), sum(entry.stat.st_size for entry in local.values()))
+        with progress.phase('upload'), ThreadPoolExecutor(max_workers=workers) as executor:
+            for key, entry in local.items():
+                slots.acquire()
+                future = executor.submit(sync_file, key, entry)
+                future.add_done_callback(lambda f, key=key, entry=entry: done(f, key, entry))
+        if uploaded_bytes and not dry_run:
+            _log_throughput(progress, 'upload', uploaded_bytes, time.perf_counter() - start,
+                            concurrency=workers)
+        
+        deleted = [key for key in remote if key not in local] if delete else []
+        if deleted and not dry_run:
+            with progress.phase('delete'):
+                for i in range(0, len(deleted), DELETE_BATCH_SIZE):
+                    batch = deleted[i:i + DELETE_BATCH_SIZE]
+                    response = s3_client.delete_objects(
+                        Bucket=bucket_name,
+                        Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+                    errors.extend((error['Key'], error['Message']) for error in response.get('Errors', []))
+        progress.count('deleted_objects', len(deleted))
+        
+        if errors:
+            names = ', '.join(key for key, _ in errors[:5])
+            return f"Error in sync to S3: {len(errors)} files failed ({names})"
+        
+        action = "Would sync" if dry_run else "Synced"
+        return (f"{action} {source_dir} to s3://{bucket_name}/{prefix}: {uploaded} uploaded, "
+                f"{len(local) - uploaded} unchanged, {len(deleted)} deleted")
+        
+    except ClientError as e:
+        return f"AWS Error: {str(e)}"
+    except Exception as e:
+        return f"Error in sync to S3: {str(e)}"
+
 # Example usage
 if __name__ == "__main__":
     # Configure AWS credentials
@@ -183,7 +1968,8 @@ if __name__ == "__main__":
             f.write("Test file 1")
     
     # Backup to S3
-    s3_backup_result = backup_to_s3(source_directory, BUCKET_NAME, S3_PREFIX)
+    progress = Progress(ConsoleRenderer())
+    s3_backup_result = backup_to_s3(source_directory, BUCKET_NAME, S3_PREFIX, progress=progress)
     print(f"\nS3 Backup result: {s3_backup_result}")
     
     # Restore from S3 (uncomment and modify s3_key as needed)
@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import time
+
+SHARD_INDEX_SUFFIX = '.shards.json'
+SHARD_INDEX_VERSION = 1
+# Shard volumes are named after their index: backup_x_<timestamp>.shard001.zip
+_SHARD_NAME = re.compile(r'\.shard\d+\.zip$')
+
+def shard_index_path(backup_file):
+    """Return the path of the shard index used instead of a single backup_x_<timestamp>.zip"""
+    base = backup_file[:-len('.zip')] if backup_file.endswith('.zip') else backup_file
+    return base + SHARD_INDEX_SUFFIX
+
+def shard_path(index_path, number):
+    """Return the path (or S3 key) of the shard numbered number, starting at 1, of an index"""
+    return f"{index_path[:-len(SHARD_INDEX_SUFFIX)]}.shard{number:03d}.zip"
+
+def is_shard_index(path):
+    """Check whether a path or S3 key names a shard index rather than a ZIP archive"""
+    return path.endswith(SHARD_INDEX_SUFFIX)
+
+def is_shard(path):
+    """Check whether a path or S3 key names one shard of a sharded backup"""
+    return _SHARD_NAME.search(path) is not None
+
+def plan_shards(members, shard_size=None, shard_files=None):
+    """
+    Split archive members into shards
+
+    Members are taken in path order and a new shard is started whenever
+    the current one would grow past shard_size bytes or shard_files files,
+    so every shard holds a contiguous range of paths. A file larger than
+    shard_size gets a shard of its own.
+
+    Args:
+        members (list): (file_path, arcname, size, ...) tuples
+        shard_size (int): Target bytes of file content per shard
+        shard_files (int): Most files per shard
+
+    Returns:
+        list: One list of members per shard, never empty
+    """
+    shards = [[]]
+    size = 0
+    for member in sorted(members, key=lambda m: m[1].replace(os.sep, '/')):
+        current = shards[-1]
+        if current and ((shard_size and size + member[2] > shard_size)
+                        or (shard_files and len(current) >= shard_files)):
+            current = []
+            shards.append(current)
+            size = 0
+        current.append(member)
+        size += member[2]
+    return shards
+
+def shard_entry(shard_file, members, size, checksum=None):
+    """
+    Describe one written shard for the index
+
+    Args:
+        shard_file (str): Path of the shard
+        members (list): (file_path, arcname, size, ...) tuples it holds
+        size (int): Shard size in bytes
+        checksum (str): Digest of the shard as 'algorithm:hex'
+
+    Returns:
+        dict: name, first and last path, files, bytes, size and checksum
+    """
+    names = [member[1].replace(os.sep, '/') for member in members]
+    return {
+        'name': os.path.basename(shard_file),
+        'first': min(names) if names else None,
+        'last': max(names) if names else None,
+        'files': len(names),
+        'bytes': sum(member[2] for member in members),
+        'size': size,
+        'checksum': checksum,
+    }
+
+def shard_index(shards, source=None, codec=None):
+    """
+    Build the index of a sharded backup
+
+    Args:
+        shards (list): shard_entry() of every shard, in order
+        source (str): Directory that was backed up
+        codec (str): Codec spec the shards were written with
+
+    Returns:
+        dict: Document for save_shard_index or upload
+    """
+    return {
+        'version': SHARD_INDEX_VERSION,
+        'source': source,
+        'codec': codec,
+        'created': time.time(),
+        'files': sum(shard['files'] for shard in shards),
+        'bytes': sum(shard['bytes'] for shard in shards),
+        'size': sum(shard['size'] for shard in shards),
+        'shards': shards,
+    }
+
+def save_shard_index(index_path, index):
+    """Write a shard index; done last, so an index always describes complete shards"""
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+    return index_path
+
+def load_shard_index(index_path):
+    """
+    Load a shard index
+
+    Raises:
+        ValueError: If the file is not a shard index this version can read
+    """
+    with open(index_path) as f:
+        index = json.load(f)
+    return check_shard_index(index, index_path)
+
+def check_shard_index(index, name):
+    """Return index if it is a shard index this version can read, else raise ValueError"""
+    if not isinstance(index, dict) or index.get('version') != SHARD_INDEX_VERSION or 'shards' not in index:
+        raise ValueError(f"'{name}' is not a supported shard index")
+    return index
+
+def select_shards(index, paths):
+    """
+    Return the shards of an index that may hold files selected by paths
+
+    Each shard holds a contiguous range of paths, so a path or directory
+    only selects the shards whose range overlaps it. Glob patterns can
+    match anywhere and select every shard.
+
+    Args:
+        index (dict): Shard index
+        paths (list): Paths, directories or globs as for backup.path_matches,
+            None for everything
+
+    Returns:
+        list: Index entries of the shards to read
+    """
+    if paths is None:
+        return list(index['shards'])
+    patterns = [path.replace(os.sep, '/').strip('/') for path in paths]
+    if any(any(char in pattern for char in '*?[') for pattern in patterns):
+        return [shard for shard in index['shards'] if shard['files']]
+    selected = []
+    for shard in index['shards']:
+        if not shard['files']:
+            continue
+        # Anything below a directory sorts between 'dir/' and 'dir/' + the highest character
+        if any(shard['first'] <= pattern + '/\U0010ffff' and shard['last'] >= pattern
+               for pattern in patterns):
+            selected.append(shard)
+    return selected
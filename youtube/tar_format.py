@@ -0,0 +1,345 @@
+import io
+import os
+import gzip
+import json
+import time
+import struct
+import tarfile
+
+# Optional codec, only available when its library is installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Tar format name -> default compression level
+TAR_FORMATS = {
+    'tar.zst': 3,
+    'tar.gz': 6,
+}
+# Last member of every archive, listing the files with their sizes and digests
+INDEX_MEMBER = '.backup_index.json'
+INDEX_VERSION = 1
+# Marks the index member, so a backed up file of the same name is never taken for it
+INDEX_COMMENT = 'backup index'
+
+# The trailer ending an archive points at the compressed frame holding the index member
+TRAILER_MAGIC = b'BKTARIDX'
+_TRAILER_PAYLOAD = struct.Struct('<8sQQ')
+# zstd tools skip skippable frames; 0x184D2A50 to 0x184D2A5F are reserved for them
+_ZSTD_SKIPPABLE_MAGIC = 0x184D2A5B
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+_GZIP_MAGIC = b'\x1f\x8b'
+# gzip member header with only the FEXTRA flag set, no mtime and an unknown OS
+_GZIP_EXTRA_HEADER = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff'
+# An empty deflate stream followed by its CRC-32 and size, both 0
+_GZIP_EMPTY_BODY = b'\x03\x00' + bytes(8)
+
+class TarFormat:
+    """
+    Compressed tar format for backups that must be written strictly in sequence
+
+    An archive is a plain tar stream, compressed in two frames (zstd
+    frames or gzip members): the first holds every file, the second only
+    the index member and the end of the tar. Standard tools read the
+    concatenated frames as one tar file. A small trailer follows that
+    zstd and gzip tools skip (a zstd skippable frame, an empty gzip member
+    carrying it in its extra field); it records where the index frame
+    starts, so a seekable reader can list an archive by decompressing the
+    index frame alone.
+    """
+    def __init__(self, name, level=None):
+        if name not in TAR_FORMATS:
+            known = ', '.join(['zip'] + list(TAR_FORMATS))
+            raise ValueError(f"Unknown archive format '{name}' (known formats: {known})")
+        if name == 'tar.zst' and zstandard is None:
+            raise ValueError("The tar.zst format requires the 'zstandard' package")
+        self.name = name
+        self.level = TAR_FORMATS[name] if level is None else level
+
+    @property
+    def spec(self):
+        """Format name with level, e.g. 'tar.zst:19'"""
+        return f"{self.name}:{self.level}"
+
+    @property
+    def extension(self):
+        return '.' + self.name
+
+    def __repr__(self):
+        return f"TarFormat({self.spec!r})"
+
+    def compressor(self, fileobj, workers=1):
+        """
+        Create a writable file compressing into fileobj as one frame
+
+        close() ends the frame and leaves fileobj open. zstd compresses
+        on workers threads; gzip always uses one.
+        """
+        if self.name == 'tar.zst':
+            compressor = zstandard.ZstdCompressor(level=self.level, threads=workers if workers > 1 else 0)
+            return compressor.stream_writer(fileobj, closefd=False)
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=self.level, mtime=0)
+
+    def decompress(self, data):
+        """Decompress one complete frame"""
+        if self.name == 'tar.zst':
+            return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        return gzip.decompress(data)
+
+    def reader(self, fileobj):
+        """Return a readable file decompressing every frame of fileobj in order"""
+        if self.name == 'tar.zst':
+            return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True, closefd=False)
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+
+    def trailer(self, offset, length):
+        """Build the trailer pointing at the index frame, length bytes at offset"""
+        payload = _TRAILER_PAYLOAD.pack(TRAILER_MAGIC, offset, length)
+        if self.name == 'tar.zst':
+            return struct.pack('<LL', _ZSTD_SKIPPABLE_MAGIC, len(payload)) + payload
+        extra = b'BK' + struct.pack('<H', len(payload)) + payload
+        return _GZIP_EXTRA_HEADER + struct.pack('<H', len(extra)) + extra + _GZIP_EMPTY_BODY
+
+def get_tar_format(archive_format=None):
+    """
+    Resolve an archive format spec
+
+    Args:
+        archive_format (str or TarFormat): 'zip', 'tar.zst', 'tar.zst:19',
+            'tar.gz', 'tar.gz:9', ... None means 'zip'
+
+    Returns:
+        TarFormat: Resolved format, or None for ZIP archives
+
+    Raises:
+        ValueError: If the format is unknown or its library is not installed
+    """
+    if isinstance(archive_format, TarFormat):
+        return archive_format
+    name, _, level = (archive_format or 'zip').partition(':')
+    if name == 'zip':
+        return None
+    return TarFormat(name, int(level) if level else None)
+
+def is_tar_archive(path):
+    """Check whether a path or S3 key names a tar backup rather than a ZIP archive"""
+    return any(path.endswith('.' + name) for name in TAR_FORMATS)
+
+def detect_tar_format(head):
+    """
+    Tell the format of an archive from its first bytes
+
+    Raises:
+        ValueError: If they start neither a zstd frame nor a gzip member
+    """
+    if head.startswith(_ZSTD_MAGIC):
+        return TarFormat('tar.zst')
+    if head.startswith(_GZIP_MAGIC):
+        return TarFormat('tar.gz')
+    raise ValueError("Not a tar.zst or tar.gz archive")
+
+class FrameWriter:
+    """
+    Writable, non-seekable file compressing what tarfile writes into fileobj
+
+    tell() counts uncompressed bytes, as tarfile expects, while offset is
+    the compressed size written so far, so end_frame() can tell where the
+    next frame starts. Nothing is ever sought, so fileobj can be a pipe.
+    """
+    def __init__(self, fileobj, tar_format, workers=1):
+        self.fileobj = fileobj
+        self.format = tar_format
+        self.workers = workers
+        self.offset = 0
+        self._position = 0
+        self._frame = None
+
+    def write(self, data):
+        if self._frame is None:
+            self._frame = self.format.compressor(_Sink(self), self.workers)
+        self._frame.write(data)
+        self._position += len(data)
+        return len(data)
+
+    def write_raw(self, data):
+        """Write data that is not compressed, e.g. the trailer"""
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def tell(self):
+        return self._position
+
+    def end_frame(self):
+        """Finish the current frame; returns the offset the next one starts at"""
+        if self._frame is not None:
+            self._frame.close()
+            self._frame = None
+        return self.offset
+
+class _Sink:
+    """Pass a compressor's output on to a FrameWriter's file, counting it"""
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, data):
+        self.writer.write_raw(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+def archive_header(tar_format, source=None, algorithm=None):
+    """
+    Build the PAX global header opening an archive
+
+    The metadata goes in the standard 'comment' keyword, which tar tools
+    ignore, so restores know the checksum algorithm before the first file.
+    """
+    comment = json.dumps({'format': tar_format.spec, 'source': source, 'algorithm': algorithm,
+                          'index': INDEX_MEMBER})
+    return {'comment': comment}
+
+def header_metadata(pax_headers):
+    """
+    Read the metadata archive_header recorded
+
+    Returns:
+        dict: Metadata, empty for tar files written by other tools
+    """
+    try:
+        metadata = json.loads(pax_headers.get('comment', ''))
+    except ValueError:
+        return {}
+    return metadata if isinstance(metadata, dict) else {}
+
+def build_index(tar_format, members, source=None, algorithm=None):
+    """
+    Build the index member's document
+
+    Args:
+        tar_format (TarFormat): Format of the archive
+        members (list): [name, size, mtime, digest] of every file, in archive order
+        source (str): Directory that was backed up
+        algorithm (str): Algorithm of the digests
+
+    Returns:
+        dict: Index document
+    """
+    return {
+        'version': INDEX_VERSION,
+        'format': tar_format.spec,
+        'source': source,
+        'algorithm': algorithm,
+        'members': members,
+    }
+
+def index_member(index):
+    """Return the TarInfo and content of the member holding an index document"""
+    data = json.dumps(index).encode()
+    tarinfo = tarfile.TarInfo(INDEX_MEMBER)
+    tarinfo.size = len(data)
+    tarinfo.mtime = int(time.time())
+    tarinfo.mode = 0o644
+    tarinfo.pax_headers = {'comment': INDEX_COMMENT}
+    return tarinfo, data
+
+def is_index_member(tarinfo):
+    """Check whether a tar member is the index written by index_member"""
+    return tarinfo.name == INDEX_MEMBER and tarinfo.pax_headers.get('comment') == INDEX_COMMENT
+
+def _parse_trailer(tail):
+    """Return (TarFormat, index offset, index length) from the last bytes of an archive"""
+    # The payload ends the zstd trailer, and comes before the empty deflate body in the gzip one
+    for name, end in (('tar.zst', len(tail)), ('tar.gz', len(tail) - len(_GZIP_EMPTY_BODY))):
+        start = end - _TRAILER_PAYLOAD.size
+        if start < 0:
+            continue
+        magic, offset, length = _TRAILER_PAYLOAD.unpack_from(tail, start)
+        if magic == TRAILER_MAGIC:
+            return get_tar_format(name), offset, length
+    raise ValueError("Archive has no index trailer")
+
+def read_tar_index(fileobj):
+    """
+    Read the index of a tar backup without decompressing its files
+
+    Only the trailer and the index frame are read, so listing even a huge
+    archive, or one in S3 through a ranged reader, costs two small reads.
+
+    Args:
+        fileobj (file): Seekable binary file positioned anywhere
+
+    Returns:
+        dict: Index document, see build_index
+
+    Raises:
+        ValueError: If the file is not a tar backup with an index
+    """
+    size = fileobj.seek(0, os.SEEK_END)
+    tail_size = min(size, 64)
+    fileobj.seek(size - tail_size)
+    tar_format, offset, length = _parse_trailer(fileobj.read(tail_size))
+    # The index frame ends where the trailer starts
+    if offset + length != size - len(tar_format.trailer(0, 0)):
+        raise ValueError("Archive index trailer does not match the archive, it is truncated or corrupt")
+    fileobj.seek(offset)
+    try:
+        data = tar_format.decompress(fileobj.read(length))
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:') as tar:
+            member = tar.next()
+            if member is None or not is_index_member(member):
+                raise ValueError("Archive index frame does not hold the index")
+            index = json.load(tar.extractfile(member))
+    except ValueError:
+        raise
+    except Exception as e:
+        # zlib, zstd and tarfile each have their own errors for a damaged frame
+        raise ValueError(f"Archive index frame is corrupt: {e}") from e
+    if index.get('version') != INDEX_VERSION:
+        raise ValueError(f"Unsupported archive index version {index.get('version')}")
+    return index
+
+class _Prefixed:
+    """Readable stream giving back bytes already read from fileobj before the rest of it"""
+    def __init__(self, head, fileobj):
+        self._head = head
+        self.fileobj = fileobj
+
+    def read(self, n=-1):
+        if not self._head:
+            return self.fileobj.read(n)
+        if n is None or n < 0:
+            data, self._head = self._head + self.fileobj.read(), b''
+            return data
+        data, self._head = self._head[:n], self._head[n:]
+        return data
+
+    def readable(self):
+        return True
+
+def open_tar_stream(fileobj, tar_format=None):
+    """
+    Return a readable stream of the uncompressed tar inside an archive stream
+
+    Args:
+        fileobj (file): Any readable binary stream, e.g. stdin or an S3
+            StreamingBody; it is only ever read forwards
+        tar_format (str or TarFormat): Format of the archive. None detects
+            it from the first bytes
+
+    Returns:
+        file: Readable stream for tarfile.open(mode='r|')
+    """
+    if tar_format is None:
+        head = b''
+        while len(head) < len(_ZSTD_MAGIC):
+            chunk = fileobj.read(len(_ZSTD_MAGIC) - len(head))
+            if not chunk:
+                break
+            head += chunk
+        tar_format = detect_tar_format(head)
+        fileobj = _Prefixed(head, fileobj)
+    else:
+        tar_format = get_tar_format(tar_format)
+    return tar_format.reader(fileobj)
@@ -0,0 +1,46 @@
+import os
+import sys
+import filecmp
+
+import pytest
+
+# The modules live next to each other and import each other as siblings
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BUCKET = 'test-bucket'
+
+@pytest.fixture
+def source_tree(tmp_path):
+    """A small directory tree with text files, a nested directory and an incompressible file"""
+    source = tmp_path / 'src'
+    (source / 'docs' / 'nested').mkdir(parents=True)
+    for i in range(12):
+        (source / 'docs' / f'file{i}.txt').write_text(f'line {i}\n' * (200 * i + 1))
+    (source / 'docs' / 'nested' / 'deep.txt').write_text('deep\n' * 1000)
+    (source / 'random.bin').write_bytes(os.urandom(256 * 1024))
+    (source / 'empty').write_bytes(b'')
+    return str(source)
+
+@pytest.fixture
+def s3(monkeypatch):
+    """Mocked S3 with one bucket; s3_backup talks to it through its module-wide AWSConfig"""
+    moto = pytest.importorskip('moto')
+    import boto3
+    import s3_backup
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+        monkeypatch.setenv(name, 'testing')
+    with moto.mock_aws():
+        monkeypatch.setattr(s3_backup, 'aws_config', s3_backup.AWSConfig('testing', 'testing', 'us-east-1'))
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+def assert_same_tree(expected, actual):
+    """Fail unless two directory trees hold the same files with the same content"""
+    def compare(diff):
+        assert not diff.left_only and not diff.right_only, (diff.left, diff.left_only, diff.right_only)
+        _, mismatch, errors = filecmp.cmpfiles(diff.left, diff.right, diff.common_files, shallow=False)
+        assert not mismatch and not errors, (diff.left, mismatch, errors)
+        for sub in diff.subdirs.values():
+            compare(sub)
+    compare(filecmp.dircmp(expected, actual))
@@ -0,0 +1,68 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from conftest import assert_same_tree
+
+import backup
+import backup_codecs
+from backup_codecs import is_incompressible, member_codec, SAMPLE_SIZE
+
+@pytest.fixture
+def tree(tmp_path):
+    source = tmp_path / 'src'
+    source.mkdir()
+    # Compressible content, but the extension says it is already compressed
+    (source / 'photo.JPG').write_text('not really a photo\n' * 10000)
+    (source / 'noise.dat').write_bytes(os.urandom(4 * SAMPLE_SIZE))
+    (source / 'small_noise.dat').write_bytes(os.urandom(SAMPLE_SIZE // 2))
+    (source / 'text.txt').write_text('compressible text\n' * 20000)
+    return str(source)
+
+STORED = {'photo.JPG', 'noise.dat'}
+
+def test_is_incompressible(tree):
+    def check(name):
+        path = os.path.join(tree, name)
+        return is_incompressible(path, os.path.getsize(path))
+    assert {name for name in os.listdir(tree) if check(name)} == STORED
+
+def test_random_file_with_compressible_middle_is_compressed(tmp_path):
+    path = tmp_path / 'header.bin'
+    # The sample is taken from the middle, past a random header
+    path.write_bytes(os.urandom(SAMPLE_SIZE) + bytes(4 * SAMPLE_SIZE))
+    assert not is_incompressible(str(path), os.path.getsize(path))
+
+@pytest.mark.parametrize('codec', ['deflate', pytest.param('zstd', marks=pytest.mark.skipif(
+    backup_codecs.zstandard is None, reason="needs zstandard"))])
+def test_adaptive_backup_stores_incompressible_files(tree, codec):
+    output = io.BytesIO()
+    stats = backup.write_backup_archive(tree, output, codec=codec, adaptive=True)
+
+    sizes = {name: os.path.getsize(os.path.join(tree, name)) for name in STORED}
+    assert stats['stored_files'] == len(STORED) and stats['stored_bytes'] == sum(sizes.values())
+    with zipfile.ZipFile(output) as zipf:
+        for zinfo in zipf.infolist():
+            stored = zinfo.filename in STORED
+            assert (zinfo.compress_type == zipfile.ZIP_STORED and member_codec(zinfo) is None) == stored, \
+                zinfo.filename
+            if stored:
+                assert zinfo.compress_size == zinfo.file_size
+
+def test_adaptive_round_trip(tree, tmp_path):
+    path = backup.create_backup(tree, str(tmp_path / 'backups'), adaptive=True, workers=2, catalog=None)
+    assert not path.startswith('Error'), path
+
+    result = backup.restore_backup(path, str(tmp_path / 'out'))
+
+    assert result.startswith('Backup restored'), result
+    assert_same_tree(tree, str(tmp_path / 'out'))
+
+def test_without_adaptive_everything_is_compressed(tree):
+    output = io.BytesIO()
+    stats = backup.write_backup_archive(tree, output, codec='deflate')
+    assert stats['stored_files'] == 0
+    with zipfile.ZipFile(output) as zipf:
+        assert {zinfo.compress_type for zinfo in zipf.infolist()} == {zipfile.ZIP_DEFLATED}
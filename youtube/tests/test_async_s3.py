@@ -0,0 +1,123 @@
+import os
+import asyncio
+import logging
+
+import pytest
+
+from conftest import BUCKET, assert_same_tree
+
+pytest.importorskip('aiobotocore')
+moto_server = pytest.importorskip('moto.server')
+
+import s3_backup
+import async_s3
+
+@pytest.fixture(scope='module')
+def server():
+    """moto's S3 served over HTTP, which aiobotocore needs, for the whole module"""
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = moto_server.ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+@pytest.fixture
+def s3_server(server, monkeypatch, tmp_path):
+    """Empty bucket on the moto server; s3_backup.aws_config points at it"""
+    config = s3_backup.AWSConfig('testing', 'testing', 'us-east-1', endpoint_url=server,
+                                 multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024)
+    monkeypatch.setattr(s3_backup, 'aws_config', config)
+    client = config.get_client()
+    client.create_bucket(Bucket=BUCKET)
+    # Some functions default to a catalog in the current directory
+    monkeypatch.chdir(tmp_path)
+    yield client
+    for page in client.get_paginator('list_objects_v2').paginate(Bucket=BUCKET):
+        for obj in page.get('Contents', []):
+            client.delete_object(Bucket=BUCKET, Key=obj['Key'])
+    client.delete_bucket(Bucket=BUCKET)
+
+def _keys(client, prefix):
+    response = client.list_objects_v2(Bucket=BUCKET, Prefix=prefix)
+    return sorted(obj['Key'] for obj in response.get('Contents', []))
+
+def test_upload_download_round_trip(s3_server, tmp_path):
+    # Large enough for a multipart upload and several ranged downloads
+    data = os.urandom(11 * 1024 * 1024 + 7)
+    local = tmp_path / 'big.bin'
+    local.write_bytes(data)
+    target = tmp_path / 'download' / 'big.bin'
+
+    async def run():
+        uploaded = await async_s3.upload_to_s3(str(local), BUCKET, 'big.bin')
+        downloaded = await async_s3.download_from_s3(BUCKET, 'big.bin', str(target))
+        return uploaded, downloaded
+
+    uploaded, downloaded = asyncio.run(run())
+
+    assert uploaded.startswith('File uploaded'), uploaded
+    assert 'Error' not in downloaded, downloaded
+    assert target.read_bytes() == data
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_backup_restore_round_trip(s3_server, source_tree, tmp_path, stream):
+    async def run():
+        async with async_s3.open_client() as client:
+            backed_up = await async_s3.backup_to_s3(source_tree, BUCKET, 'backups', stream=stream,
+                                                    part_size=5 * 1024 * 1024, catalog=None, client=client)
+            key = [key for key in _keys(s3_server, 'backups/') if key.endswith('.zip')][0]
+            full = await async_s3.restore_from_s3(BUCKET, key, str(tmp_path / 'full'), client=client)
+            streamed = await async_s3.restore_from_s3(BUCKET, key, str(tmp_path / 'streamed'), stream=True,
+                                                      client=client)
+            return backed_up, full, streamed
+
+    backed_up, full, streamed = asyncio.run(run())
+
+    assert backed_up.startswith('File uploaded'), backed_up
+    assert full.startswith('Backup restored'), full
+    assert streamed.startswith('Backup restored'), streamed
+    assert_same_tree(source_tree, str(tmp_path / 'full'))
+    assert_same_tree(source_tree, str(tmp_path / 'streamed'))
+
+def test_selective_restore(s3_server, source_tree, tmp_path):
+    async def run():
+        await async_s3.backup_to_s3(source_tree, BUCKET, 'backups', catalog=None)
+        key = [key for key in _keys(s3_server, 'backups/') if key.endswith('.zip')][0]
+        selected = await async_s3.restore_from_s3(BUCKET, key, str(tmp_path / 'out'), paths=['docs/nested'])
+        unmatched = await async_s3.restore_from_s3(BUCKET, key, str(tmp_path / 'none'), paths=['missing'])
+        return selected, unmatched
+
+    selected, unmatched = asyncio.run(run())
+
+    assert selected.startswith('Backup restored'), selected
+    assert os.listdir(tmp_path / 'out') == ['docs']
+    assert os.listdir(tmp_path / 'out' / 'docs') == ['nested']
+    assert unmatched.startswith('Error: No files')
+
+def test_errors_are_returned(s3_server, tmp_path):
+    async def run():
+        return (await async_s3.download_from_s3(BUCKET, 'missing.zip', str(tmp_path / 'x')),
+                await async_s3.upload_to_s3(str(tmp_path / 'missing'), BUCKET),
+                await async_s3.backup_to_s3(str(tmp_path / 'missing'), BUCKET, stream=True, catalog=None))
+
+    for result in asyncio.run(run()):
+        assert 'Error' in result.split(':', 1)[0], result
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_restore_fails_on_corrupt_archive(s3_server, source_tree, tmp_path, stream):
+    async def run():
+        async with async_s3.open_client() as client:
+            await async_s3.backup_to_s3(source_tree, BUCKET, 'backups', stream=True,
+                                        part_size=5 * 1024 * 1024, catalog=None, client=client)
+            key = [key for key in _keys(s3_server, 'backups/') if key.endswith('.zip')][0]
+            # Only the archive digest covers the name in a local header
+            data = s3_server.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+            s3_server.put_object(Bucket=BUCKET, Key=key,
+                                 Body=data.replace(b'docs/file3.txt', b'docs/fileX.txt', 1))
+            return await async_s3.restore_from_s3(BUCKET, key, str(tmp_path / 'out'), stream=stream,
+                                                  client=client)
+
+    result = asyncio.run(run())
+
+    assert result.startswith('Error') and 'Checksum mismatch' in result, result
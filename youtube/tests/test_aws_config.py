@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+s3_backup = pytest.importorskip('s3_backup')
+
+@pytest.fixture
+def config():
+    return s3_backup.AWSConfig('key', 'secret', 'us-east-1', max_pool_connections=32)
+
+def test_client_is_created_once(config):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: config.get_client(), range(32)))
+    assert all(client is clients[0] for client in clients)
+    assert clients[0].meta.config.max_pool_connections == 32
+    # Each region and endpoint gets its own cached client
+    other = config.get_client('eu-west-1')
+    assert other is not clients[0] and other.meta.region_name == 'eu-west-1'
+    assert config.get_client('eu-west-1') is other
+    assert config.get_client(endpoint_url='http://localhost:9000') is not clients[0]
+
+def test_transfer_settings_keep_cached_client(config):
+    client = config.get_client()
+
+    config.configure(max_concurrency=8, multipart_chunksize=16 * 1024 * 1024, multipart_threshold=1)
+
+    assert config.get_client() is client
+    assert config.get_transfer_config(1024).max_request_concurrency == 8
+    # Setting the same values again changes nothing either
+    config.configure(aws_access_key_id='key', region_name='us-east-1')
+    assert config.get_client() is client
+
+@pytest.mark.parametrize('setting, value', [
+    ('aws_access_key_id', 'other-key'), ('aws_secret_access_key', 'other-secret'),
+    ('region_name', 'eu-west-1'), ('endpoint_url', 'http://localhost:9000'), ('max_pool_connections', 64)])
+def test_client_settings_replace_cached_client(config, setting, value):
+    client = config.get_client()
+
+    config.configure(**{setting: value})
+    new_client = config.get_client()
+
+    assert new_client is not client
+    assert config.get_client() is new_client
+    credentials = config.get_session().get_credentials()
+    assert (credentials.access_key, credentials.secret_key) == (
+        config.aws_access_key_id, config.aws_secret_access_key)
+    assert new_client.meta.region_name == config.region_name
+    assert new_client.meta.config.max_pool_connections == config.pool_size()
+
+def test_concurrency_resizing_pool_replaces_client():
+    config = s3_backup.AWSConfig('key', 'secret', 'us-east-1', max_concurrency=4)
+    client = config.get_client()
+    assert client.meta.config.max_pool_connections == 10
+
+    config.configure(max_concurrency=40)
+
+    assert config.get_client().meta.config.max_pool_connections == 40
+
+def test_unknown_setting_is_rejected(config):
+    with pytest.raises(TypeError):
+        config.configure(region='eu-west-1')
+    with pytest.raises(TypeError):
+        config.configure(_clients={})
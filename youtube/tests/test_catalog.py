@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+from conftest import BUCKET
+
+import backup
+from catalog import BackupCatalog
+
+s3_backup = pytest.importorskip('s3_backup')
+
+@pytest.fixture
+def catalog(tmp_path):
+    with BackupCatalog(str(tmp_path / 'catalog.db')) as opened:
+        yield opened
+
+def test_record_and_queries(catalog, tmp_path):
+    old = catalog.record(str(tmp_path / 'a1.zip'), '/data/photos', created=100, size=10,
+                         members=[('x.jpg', 4), ('y.jpg', 6)])
+    catalog.record('backups/a2.zip', '/data/photos', created=200, size=20, codec='zstd:3',
+                   checksum='sha256:ff', members=[('y.jpg', 6)], bucket=BUCKET)
+    catalog.record(str(tmp_path / 'b.zip'), '/data/mail', created=300, members=[('inbox', 1)])
+
+    assert [row['created'] for row in catalog.find()] == [300, 200, 100]
+    assert [row['key'] for row in catalog.find('photos')] == ['backups/a2.zip', str(tmp_path / 'a1.zip')]
+    assert catalog.latest('/data/photos')['key'] == 'backups/a2.zip'
+    assert catalog.latest('photos', bucket='')['id'] == old
+    assert [row['created'] for row in catalog.find(since=150, until=300)] == [200]
+    assert catalog.find(limit=1)[0]['name'] == 'mail'
+    assert [row['created'] for row in catalog.containing('y.jpg')] == [200, 100]
+    assert catalog.containing('x.jpg', bucket=BUCKET) == []
+    assert catalog.members(str(tmp_path / 'a1.zip')) == [('x.jpg', 4), ('y.jpg', 6)]
+    assert catalog.keys(BUCKET, 'backups/') == {'backups/a2.zip'}
+    entry = catalog.get('backups/a2.zip', BUCKET)
+    assert (entry['size'], entry['codec'], entry['checksum'], entry['files']) == (20, 'zstd:3', 'sha256:ff', 1)
+
+def test_record_replaces_entry(catalog, tmp_path):
+    path = str(tmp_path / 'a.zip')
+    catalog.record(path, '/data/a', created=1, members=[('old', 1)])
+    catalog.record(path, '/data/a', created=2, members=[('new', 1)])
+    assert len(catalog.find()) == 1
+    assert catalog.members(path) == [('new', 1)]
+    assert catalog.containing('old') == []
+
+def test_relocate_and_remove(catalog, tmp_path):
+    path = str(tmp_path / 'a.zip')
+    catalog.record(path, '/data/a', members=[('f', 1)])
+
+    assert catalog.relocate(path, 'backups/a.zip', BUCKET)
+    assert catalog.get(path) is None
+    assert catalog.members('backups/a.zip', BUCKET) == [('f', 1)]
+    assert not catalog.relocate(path, 'backups/other.zip', BUCKET)
+
+    assert catalog.remove('backups/a.zip', BUCKET)
+    assert not catalog.remove('backups/a.zip', BUCKET)
+    # Members go with their backup
+    assert catalog.find() == [] and catalog.containing('f') == []
+
+def test_backups_are_only_catalogued_on_request(source_tree, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = backup.create_backup(source_tree, str(tmp_path / 'backups'))
+    assert not path.startswith('Error'), path
+    assert sorted(os.listdir(tmp_path)) == ['backups', 'src']
+
+    db_path = str(tmp_path / 'catalog.db')
+    path = backup.create_backup(source_tree, str(tmp_path / 'backups'), catalog=db_path)
+    with BackupCatalog(db_path) as catalog:
+        entry = catalog.latest(source_tree)
+        assert entry['key'] == path and entry['files'] == 15
+        assert entry['checksum'].startswith(('sha256:', 'blake3:'))
+        assert ('docs/nested/deep.txt', 5000) in catalog.members(path)
+
+def test_backup_to_s3_moves_entry_to_bucket(s3, source_tree, tmp_path, monkeypatch, catalog):
+    monkeypatch.chdir(tmp_path)
+    result = s3_backup.backup_to_s3(source_tree, BUCKET, 'backups', catalog=catalog)
+    assert result.startswith('File uploaded'), result
+    key = result.split(f's3://{BUCKET}/', 1)[1]
+
+    assert [(row['bucket'], row['key']) for row in catalog.find()] == [(BUCKET, key)]
+
+def test_resync_catalog(s3, source_tree, tmp_path, monkeypatch, catalog):
+    monkeypatch.chdir(tmp_path)
+    keys = []
+    for format in ('zip', 'tar.gz'):
+        result = s3_backup.backup_to_s3(source_tree, BUCKET, 'backups', format=format, catalog=None)
+        assert result.startswith('File uploaded'), result
+        keys.append(result.split(f's3://{BUCKET}/', 1)[1])
+    catalog.record('backups/deleted.zip', '/data/a', bucket=BUCKET)
+    catalog.record('other/kept.zip', '/data/a', bucket=BUCKET)
+
+    result = s3_backup.resync_catalog(BUCKET, 'backups/', catalog=catalog)
+
+    assert result.endswith('2 added, 1 removed'), result
+    assert catalog.keys(BUCKET) == set(keys) | {'other/kept.zip'}
+    for key in keys:
+        entry = catalog.get(key, BUCKET)
+        assert entry['source'] == os.path.abspath(source_tree) and entry['files'] == 15
+        assert len(catalog.members(key, BUCKET)) == 15
+    assert [row['key'] for row in catalog.containing('random.bin')] != []
+
+    # A recent resync is not repeated
+    s3.delete_object(Bucket=BUCKET, Key=keys[0])
+    result = s3_backup.resync_catalog(BUCKET, 'backups/', catalog=catalog, max_age=3600)
+    assert result.endswith('is up to date'), result
+    result = s3_backup.resync_catalog(BUCKET, 'backups/', catalog=catalog)
+    assert result.endswith('0 added, 1 removed'), result
+    assert catalog.keys(BUCKET, 'backups/') == {keys[1]}
+
+def test_resync_without_catalog():
+    assert s3_backup.resync_catalog(BUCKET, catalog=None).startswith('Error')
@@ -0,0 +1,203 @@
+import io
+import os
+import sys
+import time
+import random
+import signal
+import subprocess
+
+import pytest
+
+from conftest import BUCKET
+
+import backup
+from checkpoint import Journal, journal_path
+from progress import Progress
+
+# Cut points are random but reproducible
+SEED = 20
+KILL_POINTS = 8
+
+class _Killed(Exception):
+    """Stands in for the process dying in the middle of a write"""
+
+class _DyingFile(io.FileIO):
+    """Local file that accepts limit more bytes, writes part of the next write and then dies"""
+    def __init__(self, path, limit, mode='w+b'):
+        super().__init__(path, mode)
+        self.limit = limit
+        self.written = 0
+
+    def write(self, data):
+        room = self.limit - self.written
+        if len(data) > room:
+            super().write(bytes(data[:room]))
+            self.written = self.limit
+            raise _Killed()
+        self.written += len(data)
+        return super().write(data)
+
+@pytest.fixture
+def tree(tmp_path):
+    """Source tree with many members, so cut points fall inside and between them"""
+    source = tmp_path / 'src'
+    rng = random.Random(SEED)
+    for i in range(40):
+        path = source / f'dir{i % 4}' / f'file{i:02d}.dat'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Half compressible text, half random bytes
+        if i % 2:
+            path.write_bytes(rng.randbytes(rng.randrange(1, 64 * 1024)))
+        else:
+            path.write_text(f'record {i}\n' * rng.randrange(1, 4000))
+    return str(source)
+
+def _reference(source, path, **kwargs):
+    with open(path, 'w+b') as f:
+        stats = backup.write_backup_archive(source, f, **kwargs)
+    with open(path, 'rb') as f:
+        return f.read(), stats
+
+@pytest.mark.parametrize('codec', ['deflate', 'store'])
+def test_resume_after_kill_is_byte_identical(tree, tmp_path, codec):
+    expected, expected_stats = _reference(tree, str(tmp_path / 'reference.zip'), codec=codec)
+    rng = random.Random(SEED)
+    for limit in sorted(rng.randrange(1, len(expected)) for _ in range(KILL_POINTS)):
+        archive = str(tmp_path / f'cut{limit}.zip')
+        checkpoint = journal_path(archive)
+        with pytest.raises(_Killed), _DyingFile(archive, limit) as f:
+            backup.write_backup_archive(tree, f, codec=codec, checkpoint=checkpoint)
+        assert os.path.exists(checkpoint)
+
+        with open(archive, 'r+b') as f:
+            stats = backup.write_backup_archive(tree, f, codec=codec, checkpoint=checkpoint)
+
+        with open(archive, 'rb') as f:
+            assert f.read() == expected, f"archive resumed after {limit} bytes differs"
+        assert stats['checksum'] == expected_stats['checksum']
+        assert stats['digests'] == expected_stats['digests']
+        assert not os.path.exists(checkpoint)
+
+def test_resume_after_repeated_kills(tree, tmp_path):
+    expected, _ = _reference(tree, str(tmp_path / 'reference.zip'))
+    archive = str(tmp_path / 'backup.zip')
+    checkpoint = journal_path(archive)
+    # Each attempt writes a quarter of the archive before it dies, the last one completes
+    for attempt in range(3):
+        mode = 'r+b' if attempt else 'w+b'
+        with pytest.raises(_Killed), _DyingFile(archive, len(expected) // 4, mode) as f:
+            backup.write_backup_archive(tree, f, checkpoint=checkpoint)
+    with open(archive, 'r+b') as f:
+        backup.write_backup_archive(tree, f, checkpoint=checkpoint)
+    with open(archive, 'rb') as f:
+        assert f.read() == expected
+
+def test_changed_source_starts_over(tree, tmp_path):
+    archive = str(tmp_path / 'backup.zip')
+    checkpoint = journal_path(archive)
+    with pytest.raises(_Killed), _DyingFile(archive, 50 * 1024) as f:
+        backup.write_backup_archive(tree, f, checkpoint=checkpoint)
+    with open(os.path.join(tree, 'dir0', 'file00.dat'), 'a') as f:
+        f.write('changed')
+
+    with open(archive, 'r+b') as f:
+        backup.write_backup_archive(tree, f, checkpoint=checkpoint)
+
+    expected, _ = _reference(tree, str(tmp_path / 'reference.zip'))
+    with open(archive, 'rb') as f:
+        assert f.read() == expected
+
+_CHILD = """
+import sys
+sys.path.insert(0, {modules!r})
+import backup
+from throttle import limiter
+limiter.set_limit('read', {rate})
+print(backup.create_backup({source!r}, {target!r}, resume=True, catalog=None))
+"""
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason="needs SIGKILL")
+def test_create_backup_resumes_after_sigkill(tree, tmp_path):
+    reference = backup.create_backup(tree, str(tmp_path / 'reference'), catalog=None)
+    with open(reference, 'rb') as f:
+        expected = f.read()
+    target = str(tmp_path / 'target')
+    modules = os.path.dirname(os.path.abspath(backup.__file__))
+    # Reads are throttled so the backup takes about three seconds; it is killed at a random point
+    rate = sum(os.path.getsize(os.path.join(d, name)) for d, _, names in os.walk(tree) for name in names) // 3
+    child = subprocess.Popen([sys.executable, '-c', _CHILD.format(modules=modules, rate=rate, source=tree,
+                                                                  target=target)],
+                             stdout=subprocess.DEVNULL)
+    time.sleep(random.Random(SEED).uniform(1.0, 2.0))
+    child.send_signal(signal.SIGKILL)
+    child.wait()
+    unfinished = [name for name in os.listdir(target) if name.endswith('.zip')]
+    assert unfinished and any(name.endswith('.journal') for name in os.listdir(target))
+
+    result = backup.create_backup(tree, target, resume=True, catalog=None)
+
+    assert os.path.basename(result) == unfinished[0]
+    with open(result, 'rb') as f:
+        assert f.read() == expected
+    assert not os.path.exists(journal_path(result))
+
+def test_stream_upload_resumes_after_failure(s3, tmp_path, monkeypatch):
+    s3_backup = pytest.importorskip('s3_backup')
+    source = tmp_path / 'big'
+    source.mkdir()
+    rng = random.Random(SEED)
+    for i in range(4):
+        (source / f'part{i}.bin').write_bytes(rng.randbytes(4 * 1024 * 1024 + i))
+    expected, _ = _reference(str(source), str(tmp_path / 'reference.zip'), codec='store')
+    monkeypatch.chdir(tmp_path)
+
+    upload_part = s3_backup.S3MultipartWriter._upload_part
+    calls = []
+
+    def failing_upload_part(self, part_number, body):
+        calls.append(part_number)
+        if len(calls) > 2:
+            raise ConnectionError("connection reset")
+        return upload_part(self, part_number, body)
+
+    monkeypatch.setattr(s3_backup.S3MultipartWriter, '_upload_part', failing_upload_part)
+    result = s3_backup.backup_to_s3(str(source), BUCKET, 'backups', stream=True, resume=True, codec='store',
+                                    part_size=5 * 1024 * 1024, max_inflight_parts=1, catalog=None)
+    assert result.startswith('Error'), result
+    monkeypatch.setattr(s3_backup.S3MultipartWriter, '_upload_part', upload_part)
+
+    progress = Progress()
+    result = s3_backup.backup_to_s3(str(source), BUCKET, 'backups', stream=True, resume=True, codec='store',
+                                    part_size=5 * 1024 * 1024, max_inflight_parts=1, catalog=None,
+                                    progress=progress)
+
+    assert result.startswith('File uploaded'), result
+    assert progress.counters.get('resumed_files')
+    key = result.split(f's3://{BUCKET}/', 1)[1]
+    assert s3.get_object(Bucket=BUCKET, Key=key)['Body'].read() == expected
+
+def test_journal_drops_torn_line(tmp_path):
+    path = str(tmp_path / 'op.journal')
+    journal = Journal(path, {'op': 'test'})
+    journal.append({'n': 1})
+    journal.append({'n': 2})
+    journal.close()
+    with open(path, 'ab') as f:
+        f.write(b'{"n": 3')
+
+    resumed = Journal(path, {'op': 'test'})
+    assert resumed.resumed
+    assert resumed.entries == [{'n': 1}, {'n': 2}]
+    resumed.append({'n': 3})
+    resumed.close()
+    assert Journal(path, {'op': 'test'}).entries == [{'n': 1}, {'n': 2}, {'n': 3}]
+
+def test_journal_with_other_header_starts_over(tmp_path):
+    path = str(tmp_path / 'op.journal')
+    journal = Journal(path, {'op': 'first'})
+    journal.append({'n': 1})
+    journal.close()
+
+    other = Journal(path, {'op': 'second'})
+    assert not other.resumed
+    assert other.entries == []
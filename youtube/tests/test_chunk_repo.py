@@ -0,0 +1,89 @@
+import os
+import random
+
+import pytest
+
+from conftest import assert_same_tree
+
+import backup
+import chunk_repo
+from chunk_repo import ChunkRepository
+
+def test_writers_sharing_a_repository_use_separate_pack_files(tmp_path):
+    repo_dir = str(tmp_path / 'repo')
+    first, second = ChunkRepository(repo_dir).open(), ChunkRepository(repo_dir).open()
+    first_id, _ = first.add_chunk(b'first' * 1000)
+    second_id, _ = second.add_chunk(b'second' * 1000)
+    incoming = os.listdir(os.path.join(repo_dir, 'packs'))
+    assert len(incoming) == 2 and not any(name.endswith('.pack') for name in incoming)
+
+    first.close()
+    second.close()
+
+    packs = sorted(os.listdir(os.path.join(repo_dir, 'packs')))
+    assert packs == sorted(f"{pack_id}.pack" for pack_id in first.new_packs + second.new_packs)
+    with ChunkRepository(repo_dir) as repo:
+        assert repo.read_chunk(first_id) == b'first' * 1000
+        assert repo.read_chunk(second_id) == b'second' * 1000
+
+@pytest.mark.skipif(chunk_repo.numpy is None, reason="needs numpy")
+def test_numpy_boundaries_match_the_python_loop(monkeypatch):
+    # Small blocks, so hash windows reaching back into the previous block are exercised
+    monkeypatch.setattr(chunk_repo, '_SCAN_BLOCK', 1000)
+    data = random.Random(0).randbytes(200000)
+    for sizes in ((0, 256, 4096), (100, 1024, 8192), (5000, 4096, 20000)):
+        for start in range(0, len(data) - sizes[2], 7919):
+            window = data[start:start + sizes[2]]
+            assert (chunk_repo._find_boundary_numpy(window, *sizes)
+                    == chunk_repo._find_boundary_python(window, *sizes)), (sizes, start)
+    # Data without any boundary is cut at max_size
+    assert chunk_repo._find_boundary_numpy(bytes(10000), 100, 256, 5000) == 5000
+
+def _snapshot(source_dir, repo_dir):
+    snapshot_id = backup.create_repo_backup(source_dir, repo_dir)
+    assert not snapshot_id.startswith('Error'), snapshot_id
+    with ChunkRepository(repo_dir) as repo:
+        return snapshot_id, repo.load_snapshot(snapshot_id)[1], set(repo.chunks)
+
+def test_repo_round_trip(source_tree, tmp_path):
+    repo_dir = str(tmp_path / 'repo')
+    snapshot_id = backup.create_repo_backup(source_tree, repo_dir)
+
+    result = backup.restore_repo_backup(repo_dir, str(tmp_path / 'out'), snapshot_id)
+
+    assert result.startswith(f'Snapshot {snapshot_id} restored'), result
+    assert_same_tree(source_tree, str(tmp_path / 'out'))
+
+def test_unchanged_tree_adds_no_chunks(source_tree, tmp_path):
+    repo_dir = str(tmp_path / 'repo')
+    _, first, chunks = _snapshot(source_tree, repo_dir)
+    packs = os.listdir(os.path.join(repo_dir, 'packs'))
+
+    _, second, chunks_after = _snapshot(source_tree, repo_dir)
+
+    assert chunks_after == chunks
+    assert os.listdir(os.path.join(repo_dir, 'packs')) == packs
+    assert {name: entry['chunks'] for name, entry in second['files'].items()} == {
+        name: entry['chunks'] for name, entry in first['files'].items()}
+
+def test_one_byte_edit_only_changes_nearby_chunks(tmp_path):
+    source = tmp_path / 'src'
+    source.mkdir()
+    data = bytearray(random.Random(1).randbytes(12 * 1024 * 1024))
+    (source / 'large.bin').write_bytes(data)
+    repo_dir = str(tmp_path / 'repo')
+    _, before, chunks = _snapshot(str(source), repo_dir)
+
+    data[len(data) // 2] ^= 0xFF
+    (source / 'large.bin').write_bytes(data)
+    snapshot_id, after, chunks_after = _snapshot(str(source), repo_dir)
+
+    old, new = before['files']['large.bin']['chunks'], after['files']['large.bin']['chunks']
+    assert len(old) > 4
+    changed = [i for i, (old_id, new_id) in enumerate(zip(old, new)) if old_id != new_id]
+    # The chunk holding the edit changes; at most the boundary after it moves too
+    assert len(new) == len(old) and 1 <= len(changed) <= 2
+    assert len(chunks_after - chunks) == len(changed)
+    # Both snapshots may share a timestamp, so name the one to restore
+    assert backup.restore_repo_backup(repo_dir, str(tmp_path / 'out'), snapshot_id).startswith('Snapshot')
+    assert (tmp_path / 'out' / 'large.bin').read_bytes() == data
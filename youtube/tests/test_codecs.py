@@ -0,0 +1,54 @@
+import zipfile
+
+import pytest
+
+from conftest import assert_same_tree
+
+import backup
+import backup_codecs
+from backup_codecs import get_codec, available_codecs, archive_codec, member_codec
+
+needs_zstd = pytest.mark.skipif(backup_codecs.zstandard is None, reason="needs zstandard")
+needs_lz4 = pytest.mark.skipif(backup_codecs.lz4_frame is None, reason="needs lz4")
+
+SPECS = ['store', 'deflate', 'deflate:1', 'deflate:9', 'bzip2', 'bzip2:1', 'lzma',
+         pytest.param('zstd', marks=needs_zstd), pytest.param('zstd:19', marks=needs_zstd),
+         pytest.param('lz4', marks=needs_lz4), pytest.param('lz4:9', marks=needs_lz4)]
+
+@pytest.mark.parametrize('spec', SPECS)
+@pytest.mark.parametrize('workers', [1, 2])
+def test_codec_round_trip(source_tree, tmp_path, spec, workers):
+    codec = get_codec(spec)
+    path = backup.create_backup(source_tree, str(tmp_path / 'backups'), workers=workers, codec=spec,
+                                catalog=None)
+    assert not path.startswith('Error'), path
+
+    with zipfile.ZipFile(path) as zipf:
+        assert archive_codec(zipf) == codec.spec
+        for zinfo in zipf.infolist():
+            assert zinfo.compress_type == codec.compress_type, zinfo.filename
+            assert (member_codec(zinfo) is not None) == codec.wrapped, zinfo.filename
+    result = backup.restore_backup(path, str(tmp_path / 'out'))
+
+    assert result.startswith('Backup restored'), result
+    assert_same_tree(source_tree, str(tmp_path / 'out'))
+
+def test_spec_parsing():
+    assert get_codec(None).spec == 'deflate'
+    assert get_codec('deflate:9').level == 9
+    assert get_codec('bzip2').spec == 'bzip2:9'
+    codec = get_codec('store')
+    assert get_codec(codec) is codec and codec.compressor() is None
+
+def test_unknown_codec_is_rejected(source_tree, tmp_path):
+    with pytest.raises(ValueError, match='Unknown codec'):
+        get_codec('snappy')
+    result = backup.create_backup(source_tree, str(tmp_path / 'backups'), codec='snappy', catalog=None)
+    assert result.startswith('Error') and 'snappy' in result
+
+@pytest.mark.parametrize('name, library', [('zstd', 'zstandard'), ('lz4', 'lz4_frame')])
+def test_missing_library_is_reported(monkeypatch, name, library):
+    monkeypatch.setattr(backup_codecs, library, None)
+    assert name not in available_codecs()
+    with pytest.raises(ValueError, match='requires'):
+        get_codec(name)
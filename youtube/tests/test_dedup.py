@@ -0,0 +1,56 @@
+import os
+import zipfile
+
+import pytest
+
+from conftest import assert_same_tree
+
+import backup
+from dedup import LINKS_MEMBER, find_duplicates, read_links
+
+@pytest.fixture
+def tree(tmp_path):
+    """original.bin, a hard link to it, a byte-identical copy and a file of the same size"""
+    source = tmp_path / 'src'
+    (source / 'sub').mkdir(parents=True)
+    data = os.urandom(64 * 1024)
+    (source / 'original.bin').write_bytes(data)
+    os.link(source / 'original.bin', source / 'sub' / 'hardlink.bin')
+    (source / 'sub' / 'copy.bin').write_bytes(data)
+    (source / 'other.bin').write_bytes(os.urandom(64 * 1024))
+    return str(source)
+
+def _members(source):
+    return [(os.path.join(source, *name.split('/')), name, os.path.getsize(os.path.join(source, name)), None)
+            for name in ('original.bin', 'sub/hardlink.bin', 'sub/copy.bin', 'other.bin')]
+
+def test_find_duplicates(tree):
+    unique, links = find_duplicates(_members(tree))
+
+    assert sorted(member[1] for member in unique) == ['original.bin', 'other.bin']
+    assert links == {'sub/hardlink.bin': {'target': 'original.bin', 'type': 'hardlink'},
+                     'sub/copy.bin': {'target': 'original.bin', 'type': 'copy'}}
+
+def test_small_copies_are_stored_but_hard_links_are_not(tree):
+    unique, links = find_duplicates(_members(tree), min_size=128 * 1024)
+    assert sorted(member[1] for member in unique) == ['original.bin', 'other.bin', 'sub/copy.bin']
+    assert links == {'sub/hardlink.bin': {'target': 'original.bin', 'type': 'hardlink'}}
+
+@pytest.mark.parametrize('link_duplicates', [False, True])
+def test_dedup_backup_round_trip(tree, tmp_path, link_duplicates):
+    path = backup.create_backup(tree, str(tmp_path / 'backups'), dedup=True, catalog=None)
+    assert not path.startswith('Error'), path
+    with zipfile.ZipFile(path) as zipf:
+        assert sorted(zipf.namelist()) == [LINKS_MEMBER, 'original.bin', 'other.bin']
+        assert set(read_links(zipf)) == {'sub/hardlink.bin', 'sub/copy.bin'}
+
+    out = tmp_path / 'out'
+    result = backup.restore_backup(path, str(out), link_duplicates=link_duplicates)
+
+    assert result.startswith('Backup restored'), result
+    assert_same_tree(tree, str(out))
+    original = os.stat(out / 'original.bin')
+    # Hard links always come back as hard links, identical files only with link_duplicates
+    assert os.path.samestat(original, os.stat(out / 'sub' / 'hardlink.bin'))
+    assert os.path.samestat(original, os.stat(out / 'sub' / 'copy.bin')) == link_duplicates
+    assert original.st_nlink == (3 if link_duplicates else 2)
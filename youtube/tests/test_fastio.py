@@ -0,0 +1,116 @@
+import io
+import os
+import errno
+import zipfile
+
+import pytest
+
+import backup
+import fastio
+from fastio import local_file, copy_file_data
+from integrity import HashingWriter
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'pread'), reason="needs pread")
+
+BUFFER_SIZE = 256 * 1024
+# Kernel copy calls skipped to force each path; pread is the fallback of both
+METHODS = {
+    'copy_file_range': set(),
+    'sendfile': {'copy_file_range'},
+    'pread': {'copy_file_range', 'sendfile'},
+}
+
+@pytest.fixture
+def data():
+    return os.urandom(3 * BUFFER_SIZE + 12345)
+
+def _copy(tmp_path, data, offset=100):
+    """Copy data into a file behind offset bytes of prefix; returns (pieces, file content)"""
+    src = tmp_path / 'src.bin'
+    src.write_bytes(data)
+    with open(src, 'rb') as s, open(tmp_path / 'dst.bin', 'w+b') as d:
+        d.write(b'p' * offset)
+        d.flush()
+        pieces = [bytes(piece) for piece in copy_file_data(s.fileno(), d.fileno(), offset,
+                                                           [bytearray(BUFFER_SIZE), bytearray(BUFFER_SIZE)])]
+    return pieces, (tmp_path / 'dst.bin').read_bytes()
+
+@pytest.mark.parametrize('method', list(METHODS))
+def test_copy_paths_match_pread_fallback(tmp_path, monkeypatch, data, method):
+    if method != 'pread' and not hasattr(os, method):
+        pytest.skip(f"needs os.{method}")
+    monkeypatch.setattr(fastio, '_broken', set(METHODS['pread']))
+    expected_pieces, expected = _copy(tmp_path, data)
+    monkeypatch.setattr(fastio, '_broken', set(METHODS[method]))
+
+    pieces, content = _copy(tmp_path, data)
+
+    assert content == expected == b'p' * 100 + data
+    # The pieces read back are what was copied, each within one buffer
+    assert b''.join(pieces) == b''.join(expected_pieces) == data
+    assert all(0 < len(piece) <= BUFFER_SIZE for piece in pieces)
+
+def test_empty_file_copies_nothing(tmp_path):
+    assert _copy(tmp_path, b'') == ([], b'p' * 100)
+
+@pytest.mark.skipif(not hasattr(os, 'copy_file_range'), reason="needs os.copy_file_range")
+def test_unsupported_kernel_copy_falls_back(tmp_path, monkeypatch, data):
+    monkeypatch.setattr(fastio, '_broken', set())
+
+    def unsupported(*args):
+        raise OSError(errno.EXDEV, "cross-device")
+    monkeypatch.setattr(os, 'copy_file_range', unsupported)
+
+    pieces, content = _copy(tmp_path, data)
+
+    assert content[100:] == data and b''.join(pieces) == data
+    # Not tried again in this process
+    assert 'copy_file_range' in fastio._broken
+
+@pytest.mark.skipif(not hasattr(os, 'copy_file_range'), reason="needs os.copy_file_range")
+def test_real_copy_errors_are_raised(tmp_path, monkeypatch, data):
+    monkeypatch.setattr(fastio, '_broken', set())
+
+    def failing(*args):
+        raise OSError(errno.EIO, "I/O error")
+    monkeypatch.setattr(os, 'copy_file_range', failing)
+
+    with pytest.raises(OSError, match='I/O error'):
+        _copy(tmp_path, data)
+
+def test_pread_without_preadv(tmp_path, monkeypatch, data):
+    monkeypatch.setattr(fastio, '_broken', set(METHODS['pread']))
+    if hasattr(os, 'preadv'):
+        monkeypatch.delattr(os, 'preadv')
+    pieces, content = _copy(tmp_path, data)
+    assert content[100:] == data and b''.join(pieces) == data
+
+def test_local_file(tmp_path):
+    with open(tmp_path / 'archive.zip', 'w+b') as f:
+        assert local_file(f) is f
+        assert local_file(HashingWriter(f)) is f
+    with open(tmp_path / 'archive.zip', 'wb') as f:
+        assert local_file(f) is None
+    assert local_file(io.BytesIO()) is None
+
+def _archive(tmp_path, source, name, zero_copy):
+    path = tmp_path / name
+    with open(path, 'w+b') as f:
+        backup.write_backup_archive(str(source), f, codec='store', zero_copy=zero_copy)
+    return path.read_bytes()
+
+@pytest.mark.parametrize('method', list(METHODS))
+def test_archives_match_without_zero_copy(tmp_path, monkeypatch, method):
+    source = tmp_path / 'src'
+    source.mkdir()
+    (source / 'large.bin').write_bytes(os.urandom(backup.DIRECT_COPY_MIN_SIZE + 54321))
+    (source / 'small.txt').write_text('small\n' * 100)
+    expected = _archive(tmp_path, source, 'plain.zip', zero_copy=False)
+    monkeypatch.setattr(fastio, '_broken', set(METHODS[method]))
+
+    archive = _archive(tmp_path, source, 'direct.zip', zero_copy=True)
+
+    assert archive == expected
+    with zipfile.ZipFile(io.BytesIO(archive)) as zipf:
+        assert zipf.testzip() is None
+        assert zipf.read('large.bin') == (source / 'large.bin').read_bytes()
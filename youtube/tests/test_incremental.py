@@ -0,0 +1,62 @@
+import os
+import zipfile
+
+from conftest import assert_same_tree
+
+import backup
+from manifest import load_manifest, backup_chain
+
+def _backup(source_tree, target_dir, **kwargs):
+    path = backup.create_backup(source_tree, target_dir, incremental=True, catalog=None, **kwargs)
+    assert not path.startswith('Error'), path
+    return path
+
+def _members(path):
+    with zipfile.ZipFile(path) as zipf:
+        return sorted(name for name in zipf.namelist() if not name.startswith('.'))
+
+def test_incremental_chain_round_trip(source_tree, tmp_path):
+    target = str(tmp_path / 'backups')
+    full = _backup(source_tree, target)
+    os.remove(os.path.join(source_tree, 'docs', 'file0.txt'))
+    with open(os.path.join(source_tree, 'docs', 'added.txt'), 'w') as f:
+        f.write('added\n')
+
+    incremental = _backup(source_tree, target)
+
+    manifest = load_manifest(incremental)
+    assert manifest['type'] == 'incremental' and manifest['parent'] == os.path.basename(full)
+    assert manifest['deleted'] == ['docs/file0.txt']
+    assert _members(incremental) == ['docs/added.txt']
+    assert [path for path, _ in backup_chain(incremental)] == [full, incremental]
+
+    result = backup.restore_backup(incremental, str(tmp_path / 'out'))
+
+    assert result.startswith('Backup restored'), result
+    assert_same_tree(source_tree, str(tmp_path / 'out'))
+
+def test_unchanged_files_are_not_archived_again(source_tree, tmp_path):
+    target = str(tmp_path / 'backups')
+    _backup(source_tree, target)
+    incremental = _backup(source_tree, target)
+    assert _members(incremental) == []
+    assert load_manifest(incremental)['deleted'] == []
+
+def test_hash_catches_edit_that_keeps_size_and_mtime(source_tree, tmp_path):
+    target = str(tmp_path / 'backups')
+    path = os.path.join(source_tree, 'docs', 'file3.txt')
+    touched = os.path.join(source_tree, 'docs', 'file4.txt')
+    _backup(source_tree, target, use_hash=True)
+    st = os.stat(path)
+    with open(path, 'r+b') as f:
+        f.write(b'LINE')
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    # Newer mtime, same content
+    os.utime(touched, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+    incremental = _backup(source_tree, target, use_hash=True)
+
+    assert _members(incremental) == ['docs/file3.txt']
+    result = backup.restore_backup(incremental, str(tmp_path / 'out'))
+    assert result.startswith('Backup restored'), result
+    assert_same_tree(source_tree, str(tmp_path / 'out'))
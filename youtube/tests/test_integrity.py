@@ -0,0 +1,92 @@
+import os
+import hashlib
+
+import pytest
+
+from conftest import BUCKET, assert_same_tree
+
+from integrity import ChecksumError, ArchiveVerifier, part_checksum
+
+s3_backup = pytest.importorskip('s3_backup')
+
+PART_SIZE = 5 * 1024 * 1024
+
+def _document(data, part_size):
+    parts = [part_checksum(data[i:i + part_size]) for i in range(0, len(data), part_size)]
+    return {'algorithm': 'sha256', 'members': {},
+            'archive': {'size': len(data), 'digest': hashlib.sha256(data).hexdigest()},
+            'parts': {'size': part_size, 'sha256': parts}}
+
+def _feed(verifier, data, chunk=1000):
+    for i in range(0, len(data), chunk):
+        verifier.update(data[i:i + chunk])
+    verifier.check()
+
+def test_verifier_accepts_archive_in_any_chunking():
+    data = os.urandom(10 * 1024 + 17)
+    for chunk in (1, 999, 4096, len(data)):
+        _feed(ArchiveVerifier(_document(data, 4096), 'a.zip'), data, chunk)
+
+def test_verifier_locates_corrupt_part():
+    data = bytearray(os.urandom(10 * 1024))
+    document = _document(bytes(data), 4096)
+    data[5000] ^= 0xFF
+    with pytest.raises(ChecksumError, match='part 2'):
+        _feed(ArchiveVerifier(document, 'a.zip'), bytes(data))
+
+def test_verifier_rejects_truncated_archive():
+    data = os.urandom(10 * 1024)
+    with pytest.raises(ChecksumError, match='Size mismatch'):
+        _feed(ArchiveVerifier(_document(data, 4096), 'a.zip'), data[:-1])
+
+def _backup(source_tree, **kwargs):
+    result = s3_backup.backup_to_s3(source_tree, BUCKET, 'backups', catalog=None, **kwargs)
+    assert result.startswith('File uploaded'), result
+    return result.split(f's3://{BUCKET}/', 1)[1]
+
+def _corrupt(client, key, old, new):
+    """Replace the object with a copy in which the first occurrence of old is new"""
+    data = client.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+    assert old in data
+    client.put_object(Bucket=BUCKET, Key=key, Body=data.replace(old, new, 1))
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_restore_checks_archive_digest(s3, source_tree, tmp_path, monkeypatch, stream):
+    monkeypatch.chdir(tmp_path)
+    key = _backup(source_tree, stream=stream, part_size=PART_SIZE)
+    result = s3_backup.restore_from_s3(BUCKET, key, str(tmp_path / 'good'), stream=stream)
+    assert result.startswith('Backup restored'), result
+    assert_same_tree(source_tree, str(tmp_path / 'good'))
+
+    # The name in a local header is not read back by any member check, only the archive digest sees it
+    _corrupt(s3, key, b'docs/file3.txt', b'docs/fileX.txt')
+
+    result = s3_backup.restore_from_s3(BUCKET, key, str(tmp_path / 'bad'), stream=stream)
+    assert result.startswith('Error') and 'Checksum mismatch' in result, result
+
+def test_streamed_restore_checks_part_checksums(s3, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    source = tmp_path / 'big'
+    source.mkdir()
+    (source / 'random.bin').write_bytes(os.urandom(2 * PART_SIZE + 1024))
+    key = _backup(str(source), stream=True, codec='store', part_size=PART_SIZE)
+    data = bytearray(s3.get_object(Bucket=BUCKET, Key=key)['Body'].read())
+    data[PART_SIZE + 100] ^= 0xFF
+    s3.put_object(Bucket=BUCKET, Key=key, Body=bytes(data))
+
+    for stream in (False, True):
+        result = s3_backup.restore_from_s3(BUCKET, key, str(tmp_path / f'out{stream}'), stream=stream)
+        assert result.startswith('Error') and 'part 2' in result, result
+    # The corrupted download is not left behind
+    assert not os.path.exists(os.path.join('temp_download', os.path.basename(key)))
+
+def test_tar_restore_checks_archive_digest(s3, source_tree, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    key = _backup(source_tree, stream=True, format='tar.gz', part_size=PART_SIZE)
+    data = s3.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+    # A byte of the index trailer, which tarfile never reads
+    s3.put_object(Bucket=BUCKET, Key=key, Body=data[:-1] + bytes([data[-1] ^ 0xFF]))
+
+    result = s3_backup.restore_from_s3(BUCKET, key, str(tmp_path / 'out'))
+
+    assert result.startswith('Error') and 'Checksum mismatch' in result, result
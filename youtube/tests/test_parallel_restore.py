@@ -0,0 +1,67 @@
+import os
+import hashlib
+
+import pytest
+
+from conftest import assert_same_tree
+
+import backup
+
+@pytest.fixture
+def tree(tmp_path):
+    """Many small files, a few large ones, empty files and nested directories"""
+    source = tmp_path / 'src'
+    for i in range(60):
+        directory = source / f'dir{i % 7}' / f'sub{i % 3}'
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f'file{i}.txt').write_text(f'{i}\n' * (i * 50))
+    (source / 'large.bin').write_bytes(os.urandom(3 * 1024 * 1024))
+    (source / 'large.txt').write_text('large\n' * 500000)
+    (source / 'dir0' / 'empty').write_bytes(b'')
+    return str(source)
+
+def _tree_state(root):
+    """Relative path -> (size, SHA-256) of every file below root"""
+    state = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            state[os.path.relpath(path, root)] = (len(data), hashlib.sha256(data).hexdigest())
+    return state
+
+@pytest.mark.parametrize('codec', ['deflate', 'store'])
+def test_parallel_extraction_matches_serial(tree, tmp_path, codec):
+    path = backup.create_backup(tree, str(tmp_path / 'backups'), workers=2, codec=codec, catalog=None)
+    assert not path.startswith('Error'), path
+
+    results = {}
+    for workers in (1, 4, None):
+        out = tmp_path / f'out{workers}'
+        result = backup.restore_backup(path, str(out), workers=workers)
+        assert result.startswith('Backup restored'), result
+        assert_same_tree(tree, str(out))
+        results[workers] = _tree_state(out)
+
+    assert results[4] == results[1] and results[None] == results[1]
+
+def test_parallel_selective_restore(tree, tmp_path):
+    path = backup.create_backup(tree, str(tmp_path / 'backups'), catalog=None)
+
+    result = backup.restore_backup(path, str(tmp_path / 'out'), workers=4, paths=['dir3', '*.bin'])
+
+    assert result.startswith('Backup restored'), result
+    assert sorted(os.listdir(tmp_path / 'out')) == ['dir3', 'large.bin']
+    assert_same_tree(os.path.join(tree, 'dir3'), str(tmp_path / 'out' / 'dir3'))
+
+def test_parallel_extraction_reports_corrupt_member(tree, tmp_path):
+    path = backup.create_backup(tree, str(tmp_path / 'backups'), codec='store', catalog=None)
+    with open(path, 'r+b') as f:
+        data = f.read()
+        f.seek(data.index(b'large\nlarge\n') + 1000)
+        f.write(b'X')
+
+    result = backup.restore_backup(path, str(tmp_path / 'out'), workers=4)
+
+    assert result.startswith('Error'), result
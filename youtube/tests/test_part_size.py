@@ -0,0 +1,41 @@
+import pytest
+
+s3_backup = pytest.importorskip('s3_backup')
+from s3_backup import auto_part_size, MIN_PART_SIZE, MAX_PART_SIZE, MAX_PARTS, AUTO_MIN_PART_SIZE
+
+MB = 1024 * 1024
+GB = 1024 * MB
+# Up to the 5 TiB S3 object limit
+SIZES = [0, 1, MB, 5 * MB + 1, 100 * MB, GB, 10 * GB + 7, 100 * GB, 1024 * GB, 5 * 1024 * GB]
+
+@pytest.mark.parametrize('file_size', SIZES)
+@pytest.mark.parametrize('concurrency', [1, 4, 10, 64])
+@pytest.mark.parametrize('memory', [64 * MB, GB, 16 * GB])
+def test_part_size_within_s3_limits(file_size, concurrency, memory):
+    part_size = auto_part_size(file_size, concurrency, memory)
+
+    assert MIN_PART_SIZE <= AUTO_MIN_PART_SIZE <= part_size <= MAX_PART_SIZE
+    assert part_size % MB == 0
+    assert -(-file_size // part_size) <= MAX_PARTS
+
+@pytest.mark.parametrize('file_size', SIZES)
+def test_part_buffers_fit_in_memory_unless_parts_would_run_out(file_size):
+    concurrency, memory = 16, GB
+    part_size = auto_part_size(file_size, concurrency, memory)
+    if part_size * concurrency > memory:
+        # Only the part count limit may push parts past the memory budget
+        assert part_size - MB < -(-file_size // MAX_PARTS)
+
+def test_every_thread_gets_several_parts():
+    part_size = auto_part_size(10 * GB, 8)
+    assert -(-10 * GB // part_size) >= 8 * s3_backup.AUTO_PARTS_PER_THREAD
+
+def test_transfer_config_uses_auto_part_size():
+    config = s3_backup.AWSConfig('key', 'secret', 'us-east-1', max_concurrency=8)
+    assert config.get_transfer_config(1024 * GB).multipart_chunksize == auto_part_size(1024 * GB, 8)
+    assert config.get_transfer_config().multipart_chunksize == AUTO_MIN_PART_SIZE
+    assert config.get_transfer_config(GB, multipart_chunksize=32 * MB).multipart_chunksize == 32 * MB
+
+def test_multipart_writer_rejects_parts_below_s3_minimum():
+    with pytest.raises(ValueError):
+        s3_backup.S3MultipartWriter(None, 'bucket', 'key', part_size=MIN_PART_SIZE - 1)
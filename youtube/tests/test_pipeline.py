@@ -0,0 +1,188 @@
+import io
+import time
+import queue
+import threading
+
+import pytest
+
+import backup
+from pipeline import Pipeline, PipelineAborted, BufferPool
+from progress import Progress
+
+# Long enough for any blocked stage to notice an abort several times over
+TIMEOUT = 10
+STAGES = ('scan-', 'read-', 'compress-', 'produce-', 'consume-')
+
+def _pipeline_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith(STAGES)]
+
+def _run(pipeline):
+    """Join the pipeline on a helper thread, so a hang fails the test instead of blocking it"""
+    outcome = {}
+
+    def join():
+        try:
+            pipeline.join()
+        except BaseException as e:
+            outcome['error'] = e
+    thread = threading.Thread(target=join, daemon=True)
+    thread.start()
+    thread.join(TIMEOUT)
+    assert not thread.is_alive(), "pipeline did not stop"
+    return outcome.get('error')
+
+def test_failing_stage_aborts_blocked_stages():
+    pipeline = Pipeline()
+    produce = pipeline.stage('produce', 2)
+    consume = pipeline.stage('consume')
+    items = queue.Queue(2)
+    stopped = []
+
+    def producer():
+        try:
+            while True:
+                pipeline.put(items, 'item')
+        except PipelineAborted:
+            stopped.append(threading.current_thread().name)
+            raise
+
+    def consumer():
+        for _ in range(3):
+            pipeline.get(items)
+        raise ValueError("consumer failed")
+
+    pipeline.spawn(produce, producer)
+    pipeline.spawn(consume, consumer)
+    error = _run(pipeline)
+
+    assert isinstance(error, ValueError) and str(error) == "consumer failed"
+    # Both producers were blocked on the full queue and were woken by the abort
+    assert sorted(stopped) == ['produce-0', 'produce-1']
+    assert not _pipeline_threads()
+
+def test_first_error_wins():
+    pipeline = Pipeline()
+    consume = pipeline.stage('consume', 3)
+    started = threading.Barrier(3)
+    first = threading.Lock()
+
+    def consumer():
+        started.wait()
+        if first.acquire(blocking=False):
+            raise KeyError("first")
+        time.sleep(0.2)
+        raise ValueError("too late")
+
+    pipeline.spawn(consume, consumer)
+    error = _run(pipeline)
+
+    assert isinstance(error, KeyError)
+
+def test_blocked_get_raises_after_abort():
+    pipeline = Pipeline()
+    pipeline.abort(RuntimeError("stop"))
+    with pytest.raises(PipelineAborted):
+        pipeline.get(queue.Queue())
+    with pytest.raises(PipelineAborted):
+        pipeline.acquire(threading.Semaphore(0))
+
+def test_bounded_queue_applies_backpressure():
+    depth = 3
+    pipeline = Pipeline()
+    produce = pipeline.stage('produce')
+    consume = pipeline.stage('consume')
+    items = queue.Queue(depth)
+    produced = []
+    ahead = []
+
+    def producer():
+        for number in range(40):
+            pipeline.put(items, number)
+            produced.append(number)
+        pipeline.put(items, None)
+
+    def consumer():
+        consumed = 0
+        while True:
+            consume.sample(items.qsize())
+            item = pipeline.get(items)
+            if item is None:
+                return
+            consumed += 1
+            ahead.append(len(produced) - consumed)
+            # A slow consumer, so the producer keeps running into the bound
+            with consume.busy():
+                time.sleep(0.005)
+            consume.done()
+
+    pipeline.spawn(produce, producer)
+    pipeline.spawn(consume, consumer)
+    assert _run(pipeline) is None
+
+    stages, bottleneck = pipeline.report()
+    assert stages['consume']['items'] == 40
+    assert stages['consume']['queue_max'] <= depth
+    # The producer never got further ahead than the queue holds, plus the item it was putting
+    assert max(ahead) <= depth + 1
+    assert max(ahead) >= depth - 1
+    assert bottleneck == 'consume'
+
+def test_buffer_pool_waits_for_release():
+    pipeline = Pipeline()
+    pool = BufferPool(pipeline, 2, 16)
+    buffers = [pool.get(), pool.get()]
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.get()), daemon=True)
+    waiter.start()
+    time.sleep(0.3)
+    assert not got and pool.allocated == 2
+
+    pool.release(buffers[0])
+    waiter.join(TIMEOUT)
+
+    assert got == [buffers[0]] and pool.allocated == 2
+    pipeline.abort(RuntimeError("stop"))
+    with pytest.raises(PipelineAborted):
+        pool.get()
+
+class _SlowFile(io.BytesIO):
+    """Archive output slower than reading and compressing, so the stages queue up in front of it"""
+    def write(self, data):
+        time.sleep(0.001)
+        return super().write(data)
+
+@pytest.fixture
+def tree(tmp_path):
+    source = tmp_path / 'src'
+    source.mkdir()
+    for i in range(12):
+        (source / f'file{i:02d}.txt').write_text(f'line {i}\n' * 20000)
+    return str(source)
+
+def test_backup_read_error_aborts_pipeline(tree, monkeypatch):
+    open_throttled = backup.open_throttled
+
+    def failing_open(path, *args, **kwargs):
+        if path.endswith('file05.txt'):
+            raise PermissionError(f"cannot read {path}")
+        return open_throttled(path, *args, **kwargs)
+
+    monkeypatch.setattr(backup, 'open_throttled', failing_open)
+
+    with pytest.raises(PermissionError, match='file05.txt'):
+        backup.write_backup_archive(tree, _SlowFile(), workers=2, read_workers=2)
+    assert not _pipeline_threads()
+
+def test_backup_buffers_stay_within_limits(tree):
+    progress = Progress()
+    workers, read_workers = 2, 2
+    memory_limit = 1
+
+    backup.write_backup_archive(tree, _SlowFile(), workers=workers, read_workers=read_workers,
+                                memory_limit=memory_limit, progress=progress)
+
+    window, _, depth, _ = backup._pipeline_limits(memory_limit, workers)
+    # The window of members in flight bounds the queues between the stages
+    for name in ('read', 'compress', 'write'):
+        assert progress.stages[name]['queue_max'] <= window, name
+    assert progress.counters['read_buffers'] <= window * depth + depth + read_workers + workers + 1
@@ -0,0 +1,84 @@
+import os
+import json
+
+import pytest
+
+from conftest import BUCKET, assert_same_tree
+
+s3_backup = pytest.importorskip('s3_backup')
+
+PART_SIZE = 5 * 1024 * 1024
+KEY = 'backups/tree.zip'
+
+@pytest.fixture
+def tree(tmp_path):
+    """Two directories and enough incompressible data for three parts"""
+    source = tmp_path / 'src'
+    (source / 'a' / 'sub').mkdir(parents=True)
+    (source / 'b').mkdir()
+    (source / 'a' / 'one.bin').write_bytes(os.urandom(6 * 1024 * 1024))
+    (source / 'a' / 'sub' / 'two.txt').write_text('two\n' * 5000)
+    (source / 'b' / 'three.bin').write_bytes(os.urandom(5 * 1024 * 1024))
+    (source / 'top.txt').write_text('top\n')
+    return str(source)
+
+def _stream_backup(tree, **kwargs):
+    result = s3_backup.stream_backup_to_s3(tree, BUCKET, KEY, part_size=PART_SIZE, max_inflight_parts=2,
+                                           catalog=None, **kwargs)
+    assert result == f'File uploaded to s3://{BUCKET}/{KEY}', result
+
+def test_streamed_multipart_upload(s3, tree, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _stream_backup(tree, workers=2, codec='store')
+
+    size = s3.head_object(Bucket=BUCKET, Key=KEY)['ContentLength']
+    assert s3.head_object(Bucket=BUCKET, Key=KEY, PartNumber=1)['PartsCount'] == 3
+    checksums = json.loads(s3.get_object(Bucket=BUCKET, Key=KEY + '.checksums.json')['Body'].read())
+    assert checksums['archive']['size'] == size
+    assert checksums['parts']['size'] == PART_SIZE and len(checksums['parts']['sha256']) == 3
+    # No multipart upload is left open
+    assert not s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads')
+
+    result = s3_backup.restore_from_s3(BUCKET, KEY, str(tmp_path / 'out'))
+
+    assert result.startswith('Backup restored'), result
+    assert_same_tree(tree, str(tmp_path / 'out'))
+
+def test_streamed_upload_of_missing_source(s3):
+    result = s3_backup.stream_backup_to_s3('/does/not/exist', BUCKET, KEY, catalog=None)
+    assert result.startswith('Error'), result
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_streamed_full_restore(s3, tree, tmp_path, monkeypatch, workers):
+    monkeypatch.chdir(tmp_path)
+    _stream_backup(tree)
+
+    result = s3_backup.stream_restore_from_s3(BUCKET, KEY, str(tmp_path / 'out'), workers=workers)
+
+    assert result.startswith('Backup restored'), result
+    assert_same_tree(tree, str(tmp_path / 'out'))
+    # Nothing was downloaded to disk on the way
+    assert not os.path.exists(tmp_path / 'temp_download')
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_selective_restore(s3, tree, tmp_path, monkeypatch, stream):
+    monkeypatch.chdir(tmp_path)
+    _stream_backup(tree)
+    out = tmp_path / 'out'
+
+    result = s3_backup.restore_from_s3(BUCKET, KEY, str(out), stream=stream, paths=['a/*'])
+
+    assert result.startswith('Backup restored'), result
+    restored = sorted(os.path.relpath(os.path.join(root, name), out).replace(os.sep, '/')
+                      for root, _, names in os.walk(out) for name in names)
+    assert restored == ['a/one.bin', 'a/sub/two.txt']
+    assert (out / 'a' / 'one.bin').read_bytes() == open(os.path.join(tree, 'a', 'one.bin'), 'rb').read()
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_selective_restore_without_match(s3, tree, tmp_path, monkeypatch, stream):
+    monkeypatch.chdir(tmp_path)
+    _stream_backup(tree)
+
+    result = s3_backup.restore_from_s3(BUCKET, KEY, str(tmp_path / 'out'), stream=stream, paths=['c/*'])
+
+    assert result == f"Error: No files in s3://{BUCKET}/{KEY} match ['c/*']"
@@ -0,0 +1,120 @@
+import os
+import tempfile
+
+import pytest
+
+from conftest import BUCKET, assert_same_tree
+
+import backup
+from shards import plan_shards, select_shards, load_shard_index, is_shard_index, is_shard, shard_path
+
+s3_backup = pytest.importorskip('s3_backup')
+
+# The source tree's 15 files make four shards
+SHARD_FILES = 4
+
+def _members(*sizes):
+    return [(f'/src/{name}', name, size) for name, size in sizes]
+
+def test_plan_keeps_paths_contiguous():
+    members = _members(('b/2', 10), ('a/1', 10), ('c/3', 10), ('a/0', 10), ('b/1', 10))
+    shards = plan_shards(members, shard_files=2)
+    assert [[member[1] for member in shard] for shard in shards] == [['a/0', 'a/1'], ['b/1', 'b/2'], ['c/3']]
+
+def test_plan_gives_large_file_its_own_shard():
+    shards = plan_shards(_members(('a', 10), ('b', 100), ('c', 10), ('d', 10)), shard_size=30)
+    assert [[member[1] for member in shard] for shard in shards] == [['a'], ['b'], ['c', 'd']]
+
+def _local_backup(source_tree, tmp_path):
+    index_path = backup.create_backup(source_tree, str(tmp_path / 'backups'), shard_files=SHARD_FILES,
+                                      catalog=None)
+    assert is_shard_index(index_path), index_path
+    return index_path
+
+def test_index_describes_shards(source_tree, tmp_path):
+    index_path = _local_backup(source_tree, tmp_path)
+    index = load_shard_index(index_path)
+
+    assert [shard['name'] for shard in index['shards']] == [
+        os.path.basename(shard_path(index_path, number)) for number in range(1, 5)]
+    assert index['files'] == 15 and [shard['files'] for shard in index['shards']] == [4, 4, 4, 3]
+    for shard in index['shards']:
+        path = os.path.join(os.path.dirname(index_path), shard['name'])
+        assert is_shard(path) and os.path.getsize(path) == shard['size']
+        assert shard['checksum'].startswith(('sha256:', 'blake3:'))
+    # Shards hold consecutive, non-overlapping path ranges
+    ranges = [(shard['first'], shard['last']) for shard in index['shards']]
+    assert all(first <= last for first, last in ranges)
+    assert all(previous[1] < following[0] for previous, following in zip(ranges, ranges[1:]))
+
+def test_select_shards_by_path_range(source_tree, tmp_path):
+    index = load_shard_index(_local_backup(source_tree, tmp_path))
+
+    nested = select_shards(index, ['docs/nested'])
+    assert len(nested) == 1 and nested[0]['first'] <= 'docs/nested/deep.txt' <= nested[0]['last']
+    assert select_shards(index, ['random.bin']) == [index['shards'][-1]]
+    # A path past every shard's range
+    assert select_shards(index, ['zzz']) == []
+    assert select_shards(index, ['*.txt']) == index['shards']
+    assert select_shards(index, None) == index['shards']
+
+def test_local_round_trip(source_tree, tmp_path):
+    index_path = _local_backup(source_tree, tmp_path)
+
+    result = backup.restore_backup(index_path, str(tmp_path / 'out'), workers=4)
+
+    assert result.startswith('Backup restored'), result
+    assert_same_tree(source_tree, str(tmp_path / 'out'))
+
+def test_local_selective_restore(source_tree, tmp_path):
+    index_path = _local_backup(source_tree, tmp_path)
+
+    result = backup.restore_backup(index_path, str(tmp_path / 'out'), paths=['docs/nested'])
+
+    assert result.startswith('Backup restored'), result
+    assert os.listdir(tmp_path / 'out') == ['docs']
+    assert os.listdir(tmp_path / 'out' / 'docs') == ['nested']
+
+def _s3_backup(source_tree):
+    result = s3_backup.backup_to_s3(source_tree, BUCKET, 'backups', shard_files=SHARD_FILES, catalog=None)
+    assert result.startswith('File uploaded'), result
+    key = result.split(f's3://{BUCKET}/', 1)[1]
+    assert is_shard_index(key), key
+    return key
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_s3_round_trip(s3, source_tree, tmp_path, monkeypatch, stream):
+    monkeypatch.chdir(tmp_path)
+    key = _s3_backup(source_tree)
+    shards = [obj['Key'] for obj in s3.list_objects_v2(Bucket=BUCKET, Prefix='backups/')['Contents']
+              if is_shard(obj['Key'])]
+    assert len(shards) == 4
+
+    result = s3_backup.restore_from_s3(BUCKET, key, str(tmp_path / 'out'), stream=stream, workers=4)
+
+    assert result.startswith('Backup restored'), result
+    assert_same_tree(source_tree, str(tmp_path / 'out'))
+
+def test_s3_selective_restore(s3, source_tree, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    key = _s3_backup(source_tree)
+
+    result = s3_backup.restore_from_s3(BUCKET, key, str(tmp_path / 'out'), paths=['random.bin'])
+
+    assert result.startswith('Backup restored'), result
+    assert os.listdir(tmp_path / 'out') == ['random.bin']
+
+def test_failed_shard_download_leaves_no_temporary_files(s3, source_tree, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    scratch = tmp_path / 'scratch'
+    scratch.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(scratch))
+    key = _s3_backup(source_tree)
+    index = s3_backup.get_shard_index(s3, BUCKET, key)
+    s3.delete_object(Bucket=BUCKET, Key=f"backups/{index['shards'][2]['name']}")
+
+    result = s3_backup.restore_from_s3(BUCKET, key, str(tmp_path / 'out'), workers=4)
+
+    assert result.startswith('Error'), result
+    assert os.listdir(scratch) == []
+    assert not os.path.exists(tmp_path / 'temp_download')
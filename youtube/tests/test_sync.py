@@ -0,0 +1,45 @@
+import os
+import time
+
+import pytest
+
+from conftest import BUCKET
+
+s3_backup = pytest.importorskip('s3_backup')
+
+def _object_body(client, key):
+    return client.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+
+def test_sync_uploads_then_skips_unchanged(s3, source_tree):
+    result = s3_backup.sync_to_s3(source_tree, BUCKET, 'mirror')
+    assert '15 uploaded' in result
+
+    result = s3_backup.sync_to_s3(source_tree, BUCKET, 'mirror')
+    assert '0 uploaded, 15 unchanged' in result
+
+@pytest.mark.parametrize('use_checksum', [False, True])
+def test_sync_uploads_same_size_file_with_older_mtime(s3, source_tree, use_checksum):
+    # A file restored or copied with its original mtime is older than its object
+    path = os.path.join(source_tree, 'docs', 'file1.txt')
+    s3_backup.sync_to_s3(source_tree, BUCKET, 'mirror', use_checksum=use_checksum)
+    with open(path, 'r+b') as f:
+        data = f.read()
+        f.seek(0)
+        f.write(data.upper())
+    old = time.time() - 7 * 24 * 3600
+    os.utime(path, (old, old))
+
+    result = s3_backup.sync_to_s3(source_tree, BUCKET, 'mirror', use_checksum=use_checksum)
+
+    assert '1 uploaded' in result
+    assert _object_body(s3, 'mirror/docs/file1.txt') == data.upper()
+
+def test_sync_with_checksum_skips_touched_file(s3, source_tree):
+    path = os.path.join(source_tree, 'docs', 'file2.txt')
+    s3_backup.sync_to_s3(source_tree, BUCKET, 'mirror', use_checksum=True)
+    later = time.time() + 60
+    os.utime(path, (later, later))
+
+    result = s3_backup.sync_to_s3(source_tree, BUCKET, 'mirror', use_checksum=True)
+
+    assert '0 uploaded' in result
@@ -0,0 +1,93 @@
+import io
+import struct
+
+import pytest
+
+from conftest import assert_same_tree
+
+import backup
+import tar_format
+from tar_format import get_tar_format, read_tar_index, detect_tar_format
+
+FORMATS = ['tar.gz', pytest.param('tar.zst', marks=pytest.mark.skipif(
+    tar_format.zstandard is None, reason="needs zstandard"))]
+# Size of the trailer ending each format, see TarFormat.trailer
+TRAILER_SIZE = {'tar.gz': 50, 'tar.zst': 32}
+
+def _archive(source_tree, name):
+    output = io.BytesIO()
+    backup.write_tar_archive(source_tree, output, get_tar_format(name))
+    return output.getvalue()
+
+def _payload_start(data, name):
+    """Offset of the (magic, offset, length) payload inside an archive's trailer"""
+    end = len(data) - (10 if name == 'tar.gz' else 0)
+    return end - struct.calcsize('<8sQQ')
+
+@pytest.mark.parametrize('name', FORMATS)
+def test_round_trip(source_tree, tmp_path, name):
+    data = _archive(source_tree, name)
+    assert len(tar_format.TarFormat(name).trailer(0, 0)) == TRAILER_SIZE[name]
+
+    index = read_tar_index(io.BytesIO(data))
+    restored = backup.extract_tar_stream(io.BytesIO(data), str(tmp_path / 'out'))
+
+    assert detect_tar_format(data).name == name
+    assert sorted(member[0] for member in index['members']) == sorted(
+        ['docs/file%d.txt' % i for i in range(12)] + ['docs/nested/deep.txt', 'random.bin', 'empty'])
+    assert restored[0] == 15
+    assert_same_tree(source_tree, str(tmp_path / 'out'))
+
+@pytest.mark.parametrize('name', FORMATS)
+@pytest.mark.parametrize('cut', [1, 8, 20])
+def test_truncated_trailer_is_rejected(source_tree, name, cut):
+    data = _archive(source_tree, name)
+    with pytest.raises(ValueError):
+        read_tar_index(io.BytesIO(data[:-cut]))
+
+@pytest.mark.parametrize('name', FORMATS)
+def test_corrupt_trailer_magic_is_rejected(source_tree, name):
+    data = bytearray(_archive(source_tree, name))
+    data[_payload_start(data, name)] ^= 0xFF
+    with pytest.raises(ValueError, match='no index trailer'):
+        read_tar_index(io.BytesIO(bytes(data)))
+
+@pytest.mark.parametrize('name', FORMATS)
+@pytest.mark.parametrize('field', ['offset', 'length'])
+def test_trailer_pointing_outside_archive_is_rejected(source_tree, name, field):
+    data = bytearray(_archive(source_tree, name))
+    start = _payload_start(data, name)
+    magic, offset, length = struct.unpack_from('<8sQQ', data, start)
+    if field == 'offset':
+        offset = len(data) + 100
+    else:
+        length = len(data)
+    struct.pack_into('<8sQQ', data, start, magic, offset, length)
+    with pytest.raises(ValueError):
+        read_tar_index(io.BytesIO(bytes(data)))
+
+@pytest.mark.parametrize('name', FORMATS)
+def test_corrupt_index_frame_is_rejected(source_tree, name):
+    data = bytearray(_archive(source_tree, name))
+    _, offset, length = struct.unpack_from('<8sQQ', data, _payload_start(data, name))
+    for i in range(offset + 12, offset + length - 12):
+        data[i] ^= 0x55
+    with pytest.raises(ValueError):
+        read_tar_index(io.BytesIO(bytes(data)))
+
+def test_not_a_tar_backup_is_rejected():
+    with pytest.raises(ValueError):
+        read_tar_index(io.BytesIO(b'PK\x03\x04' + bytes(100)))
+    with pytest.raises(ValueError):
+        detect_tar_format(b'PK\x03\x04')
+
+@pytest.mark.parametrize('name', FORMATS)
+def test_stream_ending_before_index_fails(source_tree, tmp_path, name):
+    data = _archive(source_tree, name)
+    _, offset, _ = struct.unpack_from('<8sQQ', data, _payload_start(data, name))
+    # The first frame ends cleanly where the index frame would start
+    with pytest.raises(EOFError, match='truncated'):
+        backup.extract_tar_stream(io.BytesIO(data[:offset]), str(tmp_path / 'out'))
+    # A cut inside the files' frame fails too, however the decompressor reports it
+    with pytest.raises(Exception):
+        backup.extract_tar_stream(io.BytesIO(data[:offset // 2]), str(tmp_path / 'half'))
@@ -0,0 +1,108 @@
+import io
+import time
+import asyncio
+
+import pytest
+
+import throttle
+from throttle import TokenBucket, RateLimiter, ThrottledFile
+
+class FakeClock:
+    """Stands in for the time module in throttle: sleeping only moves the clock"""
+    def __init__(self, now):
+        self.now = now
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def localtime(self, seconds=None):
+        return time.localtime(self.now if seconds is None else seconds)
+
+def _local(hour, minute=0):
+    """Unix time of a local time of day"""
+    return time.mktime((2026, 6, 15, hour, minute, 0, 0, 0, -1))
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock(_local(12))
+    monkeypatch.setattr(throttle, 'time', fake)
+    return fake
+
+def test_bucket_refills_at_rate(clock):
+    bucket = TokenBucket(burst=1000)
+    # Starts full, then the balance goes negative and the caller waits it off
+    assert bucket.reserve(1000, 100) == 0
+    assert bucket.reserve(50, 100) == pytest.approx(0.5)
+    clock.now += 1.5
+    assert bucket.reserve(100, 100) == 0
+    # Idle time only fills the bucket up to burst
+    clock.now += 60
+    assert bucket.reserve(1500, 100) == pytest.approx(5)
+
+def test_unlimited_rate_resets_bucket(clock):
+    bucket = TokenBucket()
+    assert bucket.reserve(500, 100) == pytest.approx(4)
+    assert bucket.reserve(10 ** 9, None) == 0
+    # Back under a limit, the bucket starts full again
+    assert bucket.reserve(100, 100) == 0
+
+def test_schedule_window_switches_limit(clock):
+    limiter = RateLimiter(upload=1000)
+    limiter.set_schedule('upload', [('08:00', '19:00', 100), ('22:00', '02:00', 10)])
+
+    assert limiter.limit('upload') == 100
+    assert limiter.limit('upload', _local(7, 59)) == 1000
+    assert limiter.limit('upload', _local(19)) == 1000
+    assert limiter.limit('upload', _local(23)) == 10
+    assert limiter.limit('upload', _local(1, 30)) == 10
+    assert limiter.limit('download') is None
+
+    # A transfer running into the evening gets the base limit from then on
+    assert limiter.reserve('upload', 200) == pytest.approx(1)
+    clock.now = _local(19, 30)
+    assert limiter.reserve('upload', 2000) == pytest.approx(1)
+
+    limiter.set_schedule('upload', None)
+    assert limiter.limit('upload') == 1000
+    with pytest.raises(ValueError):
+        limiter.set_schedule('sideways', [])
+
+def test_throttled_file_sleeps_off_reads(clock):
+    limiter = RateLimiter(read=1000)
+    with ThrottledFile(io.BytesIO(bytes(4000)), rate_limiter=limiter) as f:
+        while f.read(500):
+            pass
+        assert f.tell() == 4000
+
+    # The first second of data is in the full bucket, the rest is waited for
+    assert sum(clock.sleeps) == pytest.approx(3)
+    assert clock.now == pytest.approx(_local(12) + 3)
+
+def test_athrottle_waits_on_event_loop(clock):
+    limiter = RateLimiter(download=1000)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0.01)
+
+    async def transfer():
+        task = asyncio.create_task(ticker())
+        await limiter.athrottle('download', 1000)
+        started = asyncio.get_running_loop().time()
+        await limiter.athrottle('download', 100)
+        waited = asyncio.get_running_loop().time() - started
+        task.cancel()
+        return waited
+
+    waited = asyncio.run(transfer())
+
+    assert waited >= 0.09
+    # Other coroutines kept running and the thread never slept
+    assert len(ticks) >= 5 and clock.sleeps == []
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from walker import walk, iter_files
+
+needs_symlinks = pytest.mark.skipif(not hasattr(os, 'symlink') or os.name == 'nt',
+                                    reason="needs symlinks")
+
+def _expected(top):
+    """Relative paths of every file and directory below top, from os.walk"""
+    paths = set()
+    for root, dirs, files in os.walk(top):
+        for name in dirs + files:
+            paths.add(os.path.relpath(os.path.join(root, name), top))
+    return paths
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_walk_matches_os_walk(source_tree, workers):
+    entries = list(walk(source_tree, workers))
+
+    assert {entry.relpath for entry in entries} == _expected(source_tree)
+    assert len(entries) == len(_expected(source_tree))
+    for entry in entries:
+        assert entry.path == os.path.join(source_tree, entry.relpath)
+        assert entry.is_dir == os.path.isdir(entry.path)
+        assert entry.stat.st_size == os.stat(entry.path).st_size
+
+def test_walk_without_recursion_or_stat(source_tree):
+    entries = list(walk(source_tree, recursive=False, with_stat=False))
+    assert sorted(entry.relpath for entry in entries) == ['docs', 'empty', 'random.bin']
+    assert all(entry.stat is None for entry in entries)
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_iter_files_and_early_stop(source_tree, workers):
+    files = [entry.relpath for entry in iter_files(source_tree, workers)]
+    assert len(files) == 15
+    assert os.path.join('docs', 'nested', 'deep.txt') in files
+    # Stopping early shuts the listing threads down
+    for _ in walk(source_tree, workers):
+        break
+
+@needs_symlinks
+@pytest.mark.parametrize('workers', [1, 4])
+def test_symlinked_directories(tmp_path, workers):
+    top = tmp_path / 'top'
+    (top / 'real').mkdir(parents=True)
+    (top / 'real' / 'file').write_text('data')
+    os.symlink(top / 'real', top / 'link')
+    # A loop back to the top
+    os.symlink(top, top / 'real' / 'loop')
+
+    plain = {entry.relpath: entry for entry in walk(str(top), workers)}
+    followed = {entry.relpath for entry in walk(str(top), workers, follow_symlinks=True)}
+
+    # Symlinked directories are listed, but only entered when following them
+    assert set(plain) == {'real', os.path.join('real', 'file'), os.path.join('real', 'loop'), 'link'}
+    assert plain['link'].is_dir
+    # Every directory is entered once, however many links lead to it
+    assert len([path for path in followed if os.path.basename(path) == 'file']) == 1
+
+@needs_symlinks
+@pytest.mark.parametrize('workers', [1, 4])
+def test_errors_are_reported_and_skipped(tmp_path, workers):
+    top = tmp_path / 'top'
+    top.mkdir()
+    (top / 'file').write_text('data')
+    os.symlink(tmp_path / 'missing', top / 'dangling')
+    errors = []
+
+    entries = {entry.relpath for entry in walk(str(top), workers, onerror=errors.append)}
+
+    assert entries == {'file'}
+    assert len(errors) == 1 and isinstance(errors[0], FileNotFoundError)
+    # Without stat the dangling link is listed as a file
+    assert {entry.relpath for entry in walk(str(top), workers, with_stat=False)} == {'file', 'dangling'}
+
+def test_missing_top_is_reported(tmp_path):
+    errors = []
+    assert list(walk(str(tmp_path / 'missing'), onerror=errors.append)) == []
+    assert len(errors) == 1
@@ -0,0 +1,97 @@
+import io
+import os
+import sys
+import shutil
+import subprocess
+import zipfile
+
+import pytest
+
+from conftest import assert_same_tree
+
+import backup
+import backup_codecs
+
+# Codecs Info-ZIP unzip can test; it has no lzma here and zstd members are wrapped frames
+UNZIP_CODECS = {'store', 'deflate', 'bzip2'}
+CODECS = ['store', 'deflate', 'bzip2', 'lzma', pytest.param('zstd', marks=pytest.mark.skipif(
+    backup_codecs.zstandard is None, reason="needs zstandard"))]
+
+class _Stream:
+    """Write-only output that cannot seek, like an upload stream"""
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def tell(self):
+        return self.buffer.tell()
+
+    def seekable(self):
+        return False
+
+    def flush(self):
+        pass
+
+def test_python_version_is_supported():
+    low, high = backup.SUPPORTED_PYTHON
+    assert low <= sys.version_info[:2] <= high, (
+        "backup.py writes ZIP members through zipfile internals; check them on this Python "
+        "with this module, then extend backup.SUPPORTED_PYTHON")
+
+def test_zipfile_internals_are_present():
+    with zipfile.ZipFile(io.BytesIO(), 'w') as zipf:
+        for name in ('_writecheck', '_didModify', 'filelist', 'NameToInfo', 'start_dir', 'fp'):
+            assert hasattr(zipf, name), name
+    assert callable(zipfile.ZipInfo.FileHeader)
+
+def _write(source_tree, tmp_path, seekable, **kwargs):
+    if not seekable:
+        stream = _Stream()
+        backup.write_backup_archive(source_tree, stream, **kwargs)
+        return stream.buffer.getvalue()
+    with open(tmp_path / 'archive.zip', 'w+b') as f:
+        backup.write_backup_archive(source_tree, f, spool_dir=str(tmp_path), **kwargs)
+    return (tmp_path / 'archive.zip').read_bytes()
+
+def _validate(data, source_tree, tmp_path, codec='deflate'):
+    """Check an archive with zipfile.testzip, unzip -t where available, and a restore"""
+    with zipfile.ZipFile(io.BytesIO(data)) as zipf:
+        assert zipf.testzip() is None
+        for zinfo in zipf.infolist():
+            assert zinfo.flag_bits & backup.FLAG_DATA_DESCRIPTOR, zinfo.filename
+    path = tmp_path / 'check.zip'
+    path.write_bytes(data)
+    if shutil.which('unzip') and codec in UNZIP_CODECS:
+        subprocess.run(['unzip', '-tq', str(path)], check=True, stdout=subprocess.DEVNULL)
+    result = backup.restore_backup(str(path), str(tmp_path / 'out'))
+    assert result.startswith('Backup restored'), result
+    assert_same_tree(source_tree, str(tmp_path / 'out'))
+
+@pytest.mark.parametrize('codec', CODECS)
+@pytest.mark.parametrize('seekable', [True, False])
+@pytest.mark.parametrize('workers', [1, 4])
+def test_archives_pass_testzip(source_tree, tmp_path, codec, seekable, workers):
+    data = _write(source_tree, tmp_path, seekable, codec=codec, workers=workers)
+    _validate(data, source_tree, tmp_path, codec)
+
+def test_kernel_copied_members_pass_testzip(source_tree, tmp_path):
+    with open(os.path.join(source_tree, 'large.bin'), 'wb') as f:
+        f.write(os.urandom(backup.DIRECT_COPY_MIN_SIZE + 1))
+    data = _write(source_tree, tmp_path, True, codec='store')
+    _validate(data, source_tree, tmp_path, 'store')
+
+def test_deduplicated_archive_passes_testzip(source_tree, tmp_path):
+    shutil.copy(os.path.join(source_tree, 'random.bin'), os.path.join(source_tree, 'copy.bin'))
+    data = _write(source_tree, tmp_path, False, dedup=True)
+    _validate(data, source_tree, tmp_path)
+
+@pytest.mark.parametrize('seekable', [True, False])
+def test_zip64_members_pass_testzip(source_tree, tmp_path, monkeypatch, seekable):
+    # Every member and offset counts as past the ZIP64 limit
+    monkeypatch.setattr(zipfile, 'ZIP64_LIMIT', 1024)
+    data = _write(source_tree, tmp_path, seekable, codec='deflate', workers=2)
+    with zipfile.ZipFile(io.BytesIO(data)) as zipf:
+        assert zipf.getinfo('random.bin').extract_version >= zipfile.ZIP64_VERSION
+    _validate(data, source_tree, tmp_path)
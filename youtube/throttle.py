@@ -0,0 +1,156 @@
+import time
+import asyncio
+import threading
+
+# Directions a RateLimiter knows: bytes sent to S3, received from S3, read from local disks
+DIRECTIONS = ('upload', 'download', 'read')
+
+def _parse_time(value):
+    """Return minutes after midnight for 'HH:MM'"""
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+class TokenBucket:
+    """
+    Token bucket for one byte stream, shared by every thread and coroutine
+
+    reserve() takes the tokens right away, letting the balance go negative,
+    and tells the caller how long to wait before using them. Callers that
+    arrive while others are waiting queue up behind them, so the combined
+    rate of all of them stays at the limit. At most burst bytes accumulate
+    while the stream is idle.
+    """
+    def __init__(self, burst=None):
+        self.burst = burst
+        self._tokens = None
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, nbytes, rate):
+        """
+        Take nbytes tokens at the given rate
+
+        Args:
+            nbytes (int): Bytes about to be transferred
+            rate (float): Bytes per second, None for unlimited
+
+        Returns:
+            float: Seconds to wait before transferring them
+        """
+        with self._lock:
+            now = time.monotonic()
+            if rate is None:
+                self._tokens = None
+                return 0.0
+            capacity = self.burst if self.burst is not None else rate
+            if self._tokens is None:
+                # Start full after a period without limit
+                self._tokens = capacity
+            else:
+                self._tokens = min(capacity, self._tokens + (now - self._stamp) * rate)
+            self._stamp = now
+            self._tokens -= nbytes
+            return -self._tokens / rate if self._tokens < 0 else 0.0
+
+class RateLimiter:
+    """
+    Process-wide byte rate limits for uploads, downloads and local reads
+
+    Each direction has a base limit in bytes per second (None is unlimited)
+    and optionally a time-of-day schedule overriding it. Both can be
+    changed at any time, also while transfers are running; the new limit
+    applies from the next chunk on.
+
+    Schedules are lists of (start, end, rate) with 'HH:MM' local times, e.g.
+    [('08:00', '19:00', 50 * 1024 * 1024)] limits to 50 MB/s during the day
+    and falls back to the base limit at night. Windows may wrap midnight.
+    """
+    def __init__(self, upload=None, download=None, read=None, burst=None):
+        self.burst = burst
+        self._limits = {'upload': upload, 'download': download, 'read': read}
+        self._schedules = {direction: [] for direction in DIRECTIONS}
+        self._buckets = {direction: TokenBucket(burst) for direction in DIRECTIONS}
+
+    def set_limit(self, direction, rate):
+        """Set the base limit of a direction in bytes per second, None for unlimited"""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction '{direction}', expected one of {DIRECTIONS}")
+        self._limits[direction] = rate
+
+    def set_schedule(self, direction, schedule):
+        """Set the time-of-day schedule of a direction, see the class docstring; None clears it"""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction '{direction}', expected one of {DIRECTIONS}")
+        self._schedules[direction] = [(_parse_time(start), _parse_time(end), rate)
+                                      for start, end, rate in schedule or []]
+
+    def limit(self, direction, now=None):
+        """
+        Return the limit of a direction in effect at a time
+
+        Args:
+            direction (str): 'upload', 'download' or 'read'
+            now (float): Unix time. None uses the current time
+
+        Returns:
+            float: Bytes per second, None for unlimited
+        """
+        schedule = self._schedules[direction]
+        if schedule:
+            local = time.localtime(now)
+            minute = local.tm_hour * 60 + local.tm_min
+            for start, end, rate in schedule:
+                if start <= minute < end or (end <= start and (minute >= start or minute < end)):
+                    return rate
+        return self._limits[direction]
+
+    def reserve(self, direction, nbytes):
+        """Reserve nbytes in a direction; returns the seconds to wait before using them"""
+        if nbytes <= 0:
+            return 0.0
+        return self._buckets[direction].reserve(nbytes, self.limit(direction))
+
+    def throttle(self, direction, nbytes):
+        """Block the calling thread until nbytes may be transferred"""
+        delay = self.reserve(direction, nbytes)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def athrottle(self, direction, nbytes):
+        """Wait on the event loop until nbytes may be transferred"""
+        delay = self.reserve(direction, nbytes)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class ThrottledFile:
+    """Wrap a readable file so reads are held to a RateLimiter direction"""
+    def __init__(self, fileobj, direction='read', rate_limiter=None):
+        self._file = fileobj
+        self._direction = direction
+        self._limiter = rate_limiter or limiter
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._limiter.throttle(self._direction, len(data))
+        return data
+
+    def readinto(self, buffer):
+        n = self._file.readinto(buffer)
+        self._limiter.throttle(self._direction, n or 0)
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._file.close()
+
+def open_throttled(file_path, rate_limiter=None):
+    """Open a file for binary reading, held to the 'read' limit"""
+    return ThrottledFile(open(file_path, 'rb'), 'read', rate_limiter)
+
+# Limits shared by every backup, restore and transfer in the process
+limiter = RateLimiter()
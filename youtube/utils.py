@@ -1,7 +1,21 @@
 import os
+from walker import walk
 
-def list_files_in_directory(directory):
-    return os.listdir(directory)
+def list_files_in_directory(directory, recursive=False, workers=1):
+    """
+    List the entries of a directory
 
-print(list_files_in_directory('.'))
-print(os.system('systeminfo'))
\ No newline at end of file
+    Args:
+        directory (str): Directory to list
+        recursive (bool): Also list everything below subdirectories, as
+            paths relative to directory
+        workers (int): Number of threads listing subdirectories
+
+    Returns:
+        list: Entry names (or relative paths when recursive)
+    """
+    return [entry.relpath for entry in walk(directory, workers, recursive, with_stat=False)]
+
+if __name__ == '__main__':
+    print(list_files_in_directory('.'))
+    print(os.system('systeminfo'))
\ No newline at end of file
@@ -0,0 +1,122 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# One file or directory found by walk(). relpath is relative to the walked
+# directory, stat is the cached os.stat_result (None when not requested)
+WalkEntry = namedtuple('WalkEntry', ['path', 'relpath', 'is_dir', 'stat'])
+
+def _scan_dir(path, relpath, with_stat, onerror):
+    """
+    List one directory with os.scandir
+
+    Types come from the directory listing itself where the OS provides
+    them, and stat() results are cached on the DirEntry, so every entry
+    costs at most one stat call.
+
+    Returns:
+        tuple: (list of WalkEntry, list of (path, relpath, is_symlink) subdirectories)
+    """
+    entries = []
+    subdirs = []
+    prefix = relpath + os.sep if relpath else ''
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    # Follow symlinks, so sizes match os.path.getsize
+                    st = entry.stat() if with_stat else None
+                except OSError as e:
+                    if onerror is not None:
+                        onerror(e)
+                    continue
+                rel = prefix + entry.name
+                entries.append(WalkEntry(entry.path, rel, is_dir, st))
+                if is_dir:
+                    subdirs.append((entry.path, rel, entry.is_symlink()))
+    except OSError as e:
+        if onerror is not None:
+            onerror(e)
+    return entries, subdirs
+
+def walk(top, workers=1, recursive=True, follow_symlinks=False, with_stat=True, onerror=None):
+    """
+    Walk a directory tree and yield every file and directory in it
+
+    Unlike os.walk followed by os.stat, each entry is listed and stat'ed
+    once and the result travels with it. With several workers, directories
+    are listed on a thread pool as soon as they are discovered; os.scandir
+    and stat release the GIL, so slow filesystems such as NFS are queried
+    concurrently. Entries then come out in no particular order.
+
+    Args:
+        top (str): Directory to walk
+        workers (int): Number of threads listing directories
+        recursive (bool): Descend into subdirectories. False lists top only
+        follow_symlinks (bool): Descend into symlinked directories. Each
+            directory is visited once, so symlink loops are safe
+        with_stat (bool): Stat every entry. False skips the stat calls and
+            leaves WalkEntry.stat as None
+        onerror (callable): Called with the OSError of unreadable directories
+            and entries; they are skipped either way
+
+    Yields:
+        WalkEntry: One per file or directory below top
+    """
+    visited = set()
+
+    def descend(subdirs):
+        for path, rel, is_symlink in subdirs:
+            if is_symlink and not follow_symlinks:
+                continue
+            if follow_symlinks:
+                try:
+                    st = os.stat(path)
+                except OSError as e:
+                    if onerror is not None:
+                        onerror(e)
+                    continue
+                if (st.st_dev, st.st_ino) in visited:
+                    continue
+                visited.add((st.st_dev, st.st_ino))
+            yield path, rel
+
+    if follow_symlinks:
+        st = os.stat(top)
+        visited.add((st.st_dev, st.st_ino))
+
+    if workers <= 1:
+        stack = [(top, '')]
+        while stack:
+            entries, subdirs = _scan_dir(*stack.pop(), with_stat, onerror)
+            yield from entries
+            if recursive:
+                stack.extend(reversed(list(descend(subdirs))))
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        pending = {executor.submit(_scan_dir, top, '', with_stat, onerror)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                entries, subdirs = future.result()
+                if recursive:
+                    for path, rel in descend(subdirs):
+                        pending.add(executor.submit(_scan_dir, path, rel, with_stat, onerror))
+                yield from entries
+    finally:
+        # The caller may stop early; drop directories not listed yet
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def iter_files(top, workers=1, follow_symlinks=False, onerror=None):
+    """
+    Yield the files below top with their stat results, see walk()
+
+    Yields:
+        WalkEntry: One per file (anything that is not a directory)
+    """
+    for entry in walk(top, workers, follow_symlinks=follow_symlinks, onerror=onerror):
+        if not entry.is_dir:
+            yield entry